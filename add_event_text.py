@@ -1,10 +1,12 @@
-import re
-from googleapiclient.discovery import build
 import pytz
-from datetime import datetime, timedelta
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from datetime import datetime
+from telegram import Update
 from telegram.ext import ContextTypes
-from settings import user_timezones, user_credentials
+from profile_store import user_timezones, user_credentials
+from event_cache import event_cache, parse_event_time
+from add_event_voice import build_events, add_events_or_ask
+from date_parser import parse_events
+from metrics import timer
 from logger import logger
 
 ERROR_MESSAGES = {
@@ -14,75 +16,35 @@ ERROR_MESSAGES = {
     'event_error': "❌ Ошибка при добавлении события."
 }
 
-DATE_TIME_PATTERN = re.compile(
-    r"(?i)(сегодня|завтра|послезавтра)\s+" 
-    r"(?:с\s+)?(\d{1,2}):(\d{2})\s+"
-    r"(?:до\s+)?(\d{1,2}):(\d{2})\s+"
-    r"(.+)"
-)
-
-DATE_MAPPING = {
-    "сегодня": 0,
-    "завтра": 1,
-    "послезавтра": 2,
-}
-
-def calculate_event_date(date_text: str, today: datetime.date) -> datetime.date:
-    if date_text in DATE_MAPPING:
-        return today + timedelta(days=DATE_MAPPING[date_text])
-    return today
-
-async def add_event_to_calendar(service, event: dict) -> InlineKeyboardMarkup:
-    keyboard = [[InlineKeyboardButton("Событие добавлено", callback_data='event_added')]]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    return reply_markup
-
 async def add_event_from_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    message_text = update.message.text.strip().title()
+    message_text = update.message.text.strip()
 
     if user_id not in user_credentials:
         await update.message.reply_text(ERROR_MESSAGES['no_auth'])
         return
 
     tz = pytz.timezone(user_timezones.get(user_id, 'UTC'))
-    logger.info(f"Received text message: {message_text}")
+    logger.info("Received text message: %s", message_text)
 
-    match = DATE_TIME_PATTERN.match(message_text)
-    if not match:
+    with timer('stage_seconds', stage='parse'):
+        parsed_events = parse_events(message_text, datetime.now(tz).date())
+    if not parsed_events:
         await update.message.reply_text(ERROR_MESSAGES['invalid_format'])
         return
 
-    date_text, start_hour, start_min, end_hour, end_min, title = match.groups()
-    start_hour, start_min, end_hour, end_min = map(int, (start_hour, start_min, end_hour, end_min))
-
-    today = datetime.now(tz).date()
-    event_date = calculate_event_date(date_text, today)
-
-    event_start = tz.localize(datetime.combine(event_date, datetime.min.time()) + 
-                               timedelta(hours=start_hour, minutes=start_min))
-    event_end = tz.localize(datetime.combine(event_date, datetime.min.time()) + 
-                             timedelta(hours=end_hour, minutes=end_min))
-
-    if event_end <= event_start:
+    events = build_events(parsed_events, tz)
+    if events is None:
         await update.message.reply_text(ERROR_MESSAGES['invalid_time'])
         return
 
     try:
         credentials = user_credentials[user_id]
-        service = build('calendar', 'v3', credentials=credentials)
-        event = {
-            'summary': title.strip(),
-            'start': {'dateTime': event_start.isoformat(), 'timeZone': tz.zone},
-            'end': {'dateTime': event_end.isoformat(), 'timeZone': tz.zone},
-        }
-        
-        await update.message.reply_text("✅ Событие добавлено:", reply_markup=await add_event_to_calendar(service, event))
-        
+        await add_events_or_ask(update, user_id, credentials, events, tz)
+
     except Exception as e:
         await update.message.reply_text(ERROR_MESSAGES['event_error'])
-        logger.error(f"Ошибка при добавлении события: {e}")
+        logger.error("Ошибка при добавлении события: %s", e)
         
 async def get_user_events(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
@@ -93,21 +55,14 @@ async def get_user_events(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     try:
         credentials = user_credentials[user_id]
-        service = build('calendar', 'v3', credentials=credentials)
 
-        today = datetime.now(pytz.timezone(user_timezones.get(user_id, 'UTC')))
+        tz = pytz.timezone(user_timezones.get(user_id, 'UTC'))
+        today = datetime.now(tz)
         start_of_day = today.replace(hour=0, minute=0, second=0, microsecond=0)
         end_of_day = today.replace(hour=23, minute=59, second=59, microsecond=999999)
 
-        events_result = service.events().list(
-            calendarId='primary',
-            timeMin=start_of_day.isoformat(),
-            timeMax=end_of_day.isoformat(),
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-
-        events = events_result.get('items', [])
+        with timer('stage_seconds', stage='events_list'):
+            events = await event_cache.get_events(user_id, credentials, start_of_day, end_of_day)
 
         if not events:
             await update.message.reply_text("📅 У вас нет событий на сегодня.")
@@ -115,8 +70,7 @@ async def get_user_events(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         response_message = "📅 Ваши события на сегодня:\n"
         for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            start_time = datetime.fromisoformat(start[:-1])
+            start_time = parse_event_time(event['start'], tz).astimezone(tz)
             formatted_start = start_time.strftime("%d %B %Y, %H:%M")
             response_message += f"- {event['summary']} (Начало: {formatted_start})\n"
 
@@ -124,4 +78,4 @@ async def get_user_events(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
     except Exception as e:
         await update.message.reply_text("❌ Ошибка при получении событий.")
-        logger.error(f"Ошибка при получении событий: {e}")
\ No newline at end of file
+        logger.error("Ошибка при получении событий: %s", e)
\ No newline at end of file
@@ -1,17 +1,24 @@
-import re
-from googleapiclient.discovery import build
+import asyncio
+import io
 import pytz
 from datetime import datetime, timedelta
-from telegram import Update
+from typing import List, Optional, Tuple
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-import speech_recognition as sr
-from pydub import AudioSegment
-from settings import user_timezones, user_credentials
+from profile_store import user_timezones, user_credentials
+from calendar_gateway import calendar_gateway
+from event_cache import event_cache
+from busy_cache import busy_cache, event_interval
+from state_backend import state_backend
+from settings import settings
+from voice_pipeline import convert_to_wav
+from transcript_cache import transcript_cache
+from speech import speech_pool, SpeechNotRecognized, SpeechServiceError, RecognitionBusy
+from date_parser import parse_events
+from notifications import notification_scheduler
+from metrics import timer, observe
 from logger import logger
 
-VOICE_FILE_OGA = 'voice.oga'
-VOICE_FILE_WAV = 'voice.wav'
-
 ERROR_MESSAGES = {
     'invalid_format': "❌ Некорректный формат команды. Попробуйте еще раз.",
     'invalid_time': "❌ Время окончания должно быть позже времени начала.",
@@ -21,70 +28,188 @@ ERROR_MESSAGES = {
     'download_error': "❌ Ошибка при загрузке файла: {}",
     'convert_error': "❌ Ошибка при конвертации файла: {}",
     'recognition_error': "❌ Не удалось распознать голосовое сообщение.",
-    'service_error': "❌ Ошибка сервиса распознавания: {}"
+    'service_error': "❌ Ошибка сервиса распознавания: {}",
+    'recognition_busy': "⏳ Сейчас слишком много голосовых сообщений, попробуйте чуть позже.",
+    'conflict_expired': "Выбор устарел, отправьте событие ещё раз.",
+    'conflict_cancelled': "Создание события отменено.",
+    'no_free_slot': "❌ {}: до конца дня нет свободного времени такой длины.",
 }
 
-DATE_TIME_PATTERN = re.compile(
-    r"(?P<date>сегодня|завтра|послезавтра|пустым\sоставить|на\sследующей\sнеделе|"
-    r"через\s(два|три)\s(дня|недели|месяца|года)|\d{1,2}\s[а-я]+\s\d{4})\s+"
-    r"(?:с|от)?\s*(?P<start_hour>\d{1,2}):?(?P<start_min>\d{2})?\s*(?:-|до)?\s*"
-    r"(?P<end_hour>\d{1,2}):?(?P<end_min>\d{2})?\s*(?P<title>.+)|"
-    r"(?P<today_with_time>сегодня\s+с\s(?P<start_hour_2>\d{1,2}):?(?P<start_min_2>\d{2})?\s+"
-    r"до\s+(?P<end_hour_2>\d{1,2}):?(?P<end_min_2>\d{2})?\s(?P<title_2>.+))"
-)
-
-def parse_time(match):
-    start_hour = int(match.group("start_hour") or match.group("start_hour_2") or 0)
-    start_min = int(match.group("start_min") or match.group("start_min_2") or 0)
-    end_hour = int(match.group("end_hour") or match.group("end_hour_2") or 0)
-    end_min = int(match.group("end_min") or match.group("end_min_2") or 0)
-    return start_hour, start_min, end_hour, end_min
-
-def get_event_date(date_text: str, today: datetime.date) -> datetime.date:
-    date_mapping = {
-        "сегодня": today,
-        "пустым оставить": today,
-        "завтра": today + timedelta(days=1),
-        "послезавтра": today + timedelta(days=2),
-    }
-    
-    if date_text in date_mapping:
-        return date_mapping[date_text]
-    elif "через" in date_text:
-        days = 2 if "два" in date_text else 3
-        return today + timedelta(days=days)
-    
-    return today
+CONFLICT_PREFIX = 'conflict:'
+# События, ожидающие решения пользователя; кнопку может обработать другой процесс.
+# Ключ — пользователь и сообщение с событиями, чтобы новый вопрос не затирал предыдущий.
+PENDING_NAMESPACE = 'pending_events'
 
 async def handle_error(update: Update, message: str):
     await update.message.reply_text(message)
 
-async def add_event_to_calendar(service, event: dict) -> str:
-    event_result = service.events().insert(calendarId='primary', body=event).execute()
+def build_event(title: str, start: datetime, end: datetime, timezone: str) -> dict:
+    return {
+        'summary': title,
+        'start': {'dateTime': start.isoformat(), 'timeZone': timezone},
+        'end': {'dateTime': end.isoformat(), 'timeZone': timezone},
+    }
+
+def build_events(parsed_events: tuple, tz) -> Optional[list]:
+    """Тела событий для Calendar API; None, если у какого-то события конец не позже начала."""
+    events = []
+    for parsed in parsed_events:
+        event_start = tz.localize(parsed.start)
+        event_end = tz.localize(parsed.end)
+        if event_end <= event_start:
+            return None
+        events.append(build_event(parsed.title, event_start, event_end, tz.zone))
+    return events
+
+async def add_event_to_calendar(user_id: int, credentials, event: dict) -> str:
+    event_result = await calendar_gateway.insert_event(user_id, credentials, event)
+    event_cache.apply_local(user_id, event_result)
+    busy_cache.add(user_id, event_result)
+    notification_scheduler.refresh_reminders(user_id)
     return f'✅ Событие добавлено: {event_result.get("htmlLink")}'
 
+async def add_events_to_calendar(user_id: int, credentials, events: list) -> str:
+    """Добавляет события одним batch-запросом и возвращает отчёт по каждому."""
+    if len(events) == 1:
+        return await add_event_to_calendar(user_id, credentials, events[0])
+
+    results = await calendar_gateway.insert_events(user_id, credentials, events)
+    lines = []
+    for event, result in zip(events, results):
+        if isinstance(result, Exception):
+            lines.append(f'❌ {event["summary"]}: не удалось добавить')
+            logger.error("Ошибка при добавлении события: %s", result)
+        else:
+            event_cache.apply_local(user_id, result)
+            busy_cache.add(user_id, result)
+            lines.append(f'✅ {event["summary"]}: {result.get("htmlLink")}')
+    if not all(isinstance(result, Exception) for result in results):
+        notification_scheduler.refresh_reminders(user_id)
+    return '\n'.join(lines)
+
+def format_time_range(start: float, end: float, tz) -> str:
+    return f"{datetime.fromtimestamp(start, tz).strftime('%H:%M')}–{datetime.fromtimestamp(end, tz).strftime('%H:%M')}"
+
+async def find_conflicts(user_id: int, credentials, events: list) -> List[Tuple[dict, list]]:
+    """События, пересекающиеся с занятым временем, и занятые интервалы для каждого.
+
+    Если занятость получить не удалось, проверка пропускается, чтобы не мешать созданию события.
+    """
+    conflicts = []
+    for event in events:
+        interval = event_interval(event)
+        if interval is None:
+            continue
+        try:
+            overlaps = await busy_cache.conflicts(user_id, credentials, *interval)
+        except Exception as e:
+            logger.warning("Проверка пересечений для пользователя %s пропущена: %s", user_id, e)
+            return []
+        if overlaps:
+            conflicts.append((event, overlaps))
+    return conflicts
+
+def format_conflicts(conflicts: List[Tuple[dict, list]], tz) -> str:
+    lines = ["⚠️ Это время уже занято:"]
+    for event, overlaps in conflicts:
+        busy = ', '.join(format_time_range(start, end, tz) for start, end, _ in overlaps)
+        lines.append(f"• {event['summary']} ({format_time_range(*event_interval(event), tz)}) — занято {busy}")
+    return '\n'.join(lines)
+
+def pending_key(user_id: int, prompt_id: int) -> str:
+    return f"{user_id}:{prompt_id}"
+
+def conflict_markup(prompt_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton("Создать всё равно", callback_data=f"{CONFLICT_PREFIX}force:{prompt_id}")],
+        [InlineKeyboardButton("Ближайшее свободное время", callback_data=f"{CONFLICT_PREFIX}next:{prompt_id}")],
+        [InlineKeyboardButton("Отмена", callback_data=f"{CONFLICT_PREFIX}cancel:{prompt_id}")],
+    ])
+
+async def add_events_or_ask(update: Update, user_id: int, credentials, events: list, tz) -> None:
+    """Добавляет события, а при пересечении с занятым временем предлагает выбор."""
+    with timer('stage_seconds', stage='conflict_check'):
+        conflicts = await find_conflicts(user_id, credentials, events)
+    if conflicts:
+        prompt_id = update.message.message_id
+        await asyncio.to_thread(state_backend.set, PENDING_NAMESPACE, pending_key(user_id, prompt_id),
+                                {'events': events}, settings.conflict_pending_ttl)
+        await update.message.reply_text(format_conflicts(conflicts, tz), reply_markup=conflict_markup(prompt_id))
+        return
+
+    with timer('stage_seconds', stage='calendar_insert'):
+        report = await add_events_to_calendar(user_id, credentials, events)
+    await update.message.reply_text(report)
+
+async def shift_to_free_slots(user_id: int, credentials, events: list, tz) -> Tuple[list, list]:
+    """Переносит события на ближайшее свободное время того же дня; возвращает (события, не поместившиеся)."""
+    shifted, skipped, taken = [], [], []
+    for event in events:
+        start, end = event_interval(event)
+        local_day = datetime.fromtimestamp(start, tz).date()
+        day_end = tz.localize(datetime.combine(local_day + timedelta(days=1), datetime.min.time())).timestamp()
+        new_start = await busy_cache.next_free(user_id, credentials, start, end, day_end, taken)
+        if new_start is None:
+            skipped.append(event)
+            continue
+        if new_start != start:
+            event = build_event(event['summary'], datetime.fromtimestamp(new_start, tz),
+                                datetime.fromtimestamp(new_start + end - start, tz), tz.zone)
+        # События из одного сообщения не должны занять один и тот же свободный промежуток.
+        taken.append((new_start, new_start + end - start, ''))
+        shifted.append(event)
+    return shifted, skipped
+
+async def handle_conflict_choice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Обрабатывает кнопки «Создать всё равно», «Ближайшее свободное время» и «Отмена»."""
+    query = update.callback_query
+    await query.answer()
+
+    user_id = query.from_user.id
+    choice, _, prompt_id = query.data[len(CONFLICT_PREFIX):].partition(':')
+    pending = None
+    if prompt_id.isdigit():
+        pending = await asyncio.to_thread(state_backend.pop, PENDING_NAMESPACE, pending_key(user_id, int(prompt_id)))
+    if pending is None:
+        await query.edit_message_text(ERROR_MESSAGES['conflict_expired'])
+        return
+    if choice == 'cancel':
+        await query.edit_message_text(ERROR_MESSAGES['conflict_cancelled'])
+        return
+
+    credentials = user_credentials.get(user_id)
+    if not credentials:
+        await query.edit_message_text(ERROR_MESSAGES['no_auth'])
+        return
+
+    tz = pytz.timezone(user_timezones.get(user_id, 'UTC'))
+    events, lines = pending['events'], []
+    try:
+        if choice == 'next':
+            events, skipped = await shift_to_free_slots(user_id, credentials, events, tz)
+            lines = [ERROR_MESSAGES['no_free_slot'].format(event['summary']) for event in skipped]
+        if events:
+            with timer('stage_seconds', stage='calendar_insert'):
+                lines.insert(0, await add_events_to_calendar(user_id, credentials, events))
+        await query.edit_message_text('\n'.join(lines))
+    except Exception as e:
+        await query.edit_message_text(ERROR_MESSAGES['event_error'])
+        logger.error("Ошибка при добавлении события: %s", e)
+
 async def add_event_from_voice(update: Update, message_text: str) -> None:
     user_id = update.effective_user.id
     timezone = user_timezones.get(user_id, 'UTC')
     tz = pytz.timezone(timezone)
     
-    pattern = DATE_TIME_PATTERN
-    match = pattern.search(message_text)
+    with timer('stage_seconds', stage='parse'):
+        parsed_events = parse_events(message_text.strip(), datetime.now(tz).date())
 
-    if not match:
+    if not parsed_events:
         await handle_error(update, ERROR_MESSAGES['invalid_format'])
         return
 
-    start_hour, start_min, end_hour, end_min = parse_time(match)
-    title = (match.group("title") or match.group("title_2")).strip()
-    date_text = match.group("date")
-    today = datetime.now(tz).date()
-    event_date = get_event_date(date_text, today)
-
-    event_start = tz.localize(datetime.combine (event_date, datetime.min.time()) + timedelta(hours=start_hour, minutes=start_min))
-    event_end = tz.localize(datetime.combine(event_date, datetime.min.time()) + timedelta(hours=end_hour, minutes=end_min))
-
-    if event_end <= event_start:
+    events = build_events(parsed_events, tz)
+    if events is None:
         await handle_error(update, ERROR_MESSAGES['invalid_time'])
         return
 
@@ -94,50 +219,54 @@ async def add_event_from_voice(update: Update, message_text: str) -> None:
             await handle_error(update, ERROR_MESSAGES['no_auth'])
             return
 
-        service = build('calendar', 'v3', credentials=credentials)
-        event = {
-            'summary': title,
-            'start': {'dateTime': event_start.isoformat(), 'timeZone': timezone},
-            'end': {'dateTime': event_end.isoformat(), 'timeZone': timezone},
-        }
-        event_result = service.events().insert(calendarId='primary', body=event).execute()
-        await update.message.reply_text(f'✅ Событие добавлено: {event_result.get("htmlLink")}')
+        await add_events_or_ask(update, user_id, credentials, events, tz)
     except Exception as e:
         await handle_error(update, ERROR_MESSAGES['event_error'])
-        logger.error(f"Ошибка при добавлении события: {e}")
+        logger.error("Ошибка при добавлении события: %s", e)
 
 async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     voice = update.message.voice
     if voice is None:
         await handle_error(update, ERROR_MESSAGES['no_voice'])
         return
-    
-    voice_file = await voice.get_file()
 
+    cached_text = transcript_cache.get(voice.file_unique_id)
+    if cached_text is not None:
+        await update.message.reply_text(f"Вы сказали: {cached_text}")
+        await add_event_from_voice(update, cached_text)
+        return
+
+    voice_buffer = io.BytesIO()
     try:
-        await voice_file.download_to_drive('voice.oga')
+        with timer('stage_seconds', stage='download'):
+            voice_file = await voice.get_file()
+            await voice_file.download_to_memory(out=voice_buffer)
     except Exception as e:
         await handle_error(update, f"❌ Ошибка при загрузке файла: {e}")
         return
 
     try:
-        audio = AudioSegment.from_ogg('voice.oga')
-        audio.export('voice.wav', format='wav')
+        with timer('stage_seconds', stage='convert'):
+            wav_bytes, timings = await convert_to_wav(voice_buffer.getvalue())
     except Exception as e:
         await handle_error(update, f"❌ Ошибка при конвертации файла: {e}")
         return
 
-    recognizer = sr.Recognizer()
-    with sr.AudioFile('voice.wav') as source:
-        audio_data = recognizer.record(source)
-        try:
-            message_text = recognizer.recognize_google(audio_data, language='ru-RU')
-            await update.message.reply_text(f"Вы сказали: {message_text}")
-            await add_event_from_voice(update, message_text)
-        except sr.UnknownValueError:
-            await handle_error(update, ERROR_MESSAGES['recognition_error'])
-        except sr.RequestError as e:
-            await handle_error(update, f"❌ Ошибка сервиса распознавания: {e}")
-        except Exception as e:
-            await handle_error(update, f"❌ Произошла ошибка: {str(e)}")
-            logger.error(f"Ошибка при обработке голосового сообщения: {str(e)}")
\ No newline at end of file
+    for stage, seconds in timings.items():
+        observe('stage_seconds', seconds, stage=f'convert_{stage}')
+
+    try:
+        with timer('stage_seconds', stage='recognize'):
+            message_text = await speech_pool.transcribe(wav_bytes)
+        transcript_cache.set(voice.file_unique_id, message_text)
+        await update.message.reply_text(f"Вы сказали: {message_text}")
+        await add_event_from_voice(update, message_text)
+    except SpeechNotRecognized:
+        await handle_error(update, ERROR_MESSAGES['recognition_error'])
+    except RecognitionBusy:
+        await handle_error(update, ERROR_MESSAGES['recognition_busy'])
+    except SpeechServiceError as e:
+        await handle_error(update, ERROR_MESSAGES['service_error'].format(e))
+    except Exception as e:
+        await handle_error(update, f"❌ Произошла ошибка: {str(e)}")
+        logger.error("Ошибка при обработке голосового сообщения: %s", e)
\ No newline at end of file
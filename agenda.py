@@ -0,0 +1,184 @@
+import asyncio
+import heapq
+import pytz
+from datetime import datetime, timedelta, date
+from typing import List, Optional, Tuple
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import ContextTypes
+from profile_store import user_timezones, user_credentials
+from calendar_gateway import calendar_gateway
+from event_cache import parse_event_time
+from cache import LRUCache
+from settings import settings
+from logger import logger
+
+EVENT_FIELDS = 'nextPageToken,items(id,summary,status,start,end)'
+CALENDAR_FIELDS = 'items(id,summary,summaryOverride,primary,selected)'
+WEEKDAYS = ['Пн', 'Вт', 'Ср', 'Чт', 'Пт', 'Сб', 'Вс']
+CALLBACK_PREFIX = 'agenda:'
+# Сколько последних многостраничных сводок пользователя можно листать.
+KEPT_AGENDAS = 10
+
+ERROR_MESSAGES = {
+    'no_auth': "❌ Сначала выполните команду /authorize.",
+    'invalid_range': "❌ Укажите период в формате /agenda ДД.ММ [ДД.ММ], не длиннее {} дней.",
+    'fetch_error': "❌ Ошибка при получении событий.",
+    'expired': "Список устарел, запросите его снова.",
+}
+
+_calendar_lists = LRUCache(1000, settings.calendar_list_ttl)
+
+
+async def get_selected_calendars(user_id: int, credentials) -> List[Tuple[str, str]]:
+    """Календари, отмеченные пользователем в Google Calendar: (id, название)."""
+    calendars = _calendar_lists.get(user_id)
+    if calendars is None:
+        result = await calendar_gateway.list_calendars(user_id, credentials, fields=CALENDAR_FIELDS)
+        calendars = [
+            (item['id'], item.get('summaryOverride') or item.get('summary', item['id']))
+            for item in result.get('items', [])
+            if item.get('selected') or item.get('primary')
+        ] or [('primary', '')]
+        _calendar_lists.set(user_id, calendars)
+    return calendars
+
+def invalidate_calendar_list(user_id: int) -> None:
+    _calendar_lists.pop(user_id)
+
+async def fetch_calendar(user_id: int, credentials, calendar_id: str, calendar_name: str,
+                         time_min: datetime, time_max: datetime, tz) -> List[tuple]:
+    events = []
+    async for event in calendar_gateway.iter_events(
+            user_id, credentials, calendar_id,
+            timeMin=time_min.isoformat(), timeMax=time_max.isoformat(),
+            singleEvents=True, orderBy='startTime', fields=EVENT_FIELDS):
+        if event.get('status') == 'cancelled':
+            continue
+        events.append((parse_event_time(event['start'], tz), parse_event_time(event['end'], tz),
+                       event.get('summary', '(без названия)'), calendar_name))
+    return events
+
+async def fetch_agenda(user_id: int, credentials, time_min: datetime, time_max: datetime, tz) -> List[tuple]:
+    """События из всех выбранных календарей, запрошенные параллельно и слитые по времени начала."""
+    calendars = await get_selected_calendars(user_id, credentials)
+    per_calendar = await asyncio.gather(*(
+        fetch_calendar(user_id, credentials, calendar_id, name if len(calendars) > 1 else '',
+                       time_min, time_max, tz)
+        for calendar_id, name in calendars
+    ))
+    return list(heapq.merge(*per_calendar, key=lambda event: event[0]))
+
+def is_all_day(start: datetime, end: datetime, tz) -> bool:
+    return end - start >= timedelta(days=1) and start.astimezone(tz).time() == datetime.min.time()
+
+def render_agenda(events: List[tuple], tz) -> List[str]:
+    lines = []
+    current_day: Optional[date] = None
+    for start, end, summary, calendar_name in events:
+        local_start = start.astimezone(tz)
+        if local_start.date() != current_day:
+            current_day = local_start.date()
+            lines.append(f"\n📅 {WEEKDAYS[current_day.weekday()]}, {current_day.strftime('%d.%m')}")
+        if is_all_day(start, end, tz):
+            time_text = 'весь день'
+        else:
+            time_text = f"{local_start.strftime('%H:%M')}–{end.astimezone(tz).strftime('%H:%M')}"
+        suffix = f" [{calendar_name}]" if calendar_name else ''
+        lines.append(f"• {time_text} {summary}{suffix}")
+    return paginate(lines)
+
+def paginate(lines: List[str], limit: int = settings.agenda_page_chars) -> List[str]:
+    pages, current = [], ''
+    for line in lines:
+        line = line[:limit]
+        if current and len(current) + len(line) + 1 > limit:
+            pages.append(current.strip())
+            current = ''
+        current += line + '\n'
+    if current.strip():
+        pages.append(current.strip())
+    return pages
+
+def page_markup(page: int, total: int) -> Optional[InlineKeyboardMarkup]:
+    if total <= 1:
+        return None
+    buttons = []
+    if page > 0:
+        buttons.append(InlineKeyboardButton("◀️", callback_data=f"{CALLBACK_PREFIX}{page - 1}"))
+    buttons.append(InlineKeyboardButton(f"{page + 1}/{total}", callback_data=f"{CALLBACK_PREFIX}current"))
+    if page < total - 1:
+        buttons.append(InlineKeyboardButton("▶️", callback_data=f"{CALLBACK_PREFIX}{page + 1}"))
+    return InlineKeyboardMarkup([buttons])
+
+def parse_day(text: str, today: date) -> date:
+    parts = [int(part) for part in text.split('.')]
+    if len(parts) == 2:
+        return date(today.year, parts[1], parts[0])
+    if len(parts) == 3:
+        return date(parts[2], parts[1], parts[0])
+    raise ValueError(text)
+
+async def send_agenda(update: Update, context: ContextTypes.DEFAULT_TYPE, first_day: date, days: int) -> None:
+    user_id = update.effective_user.id
+    if user_id not in user_credentials:
+        await update.message.reply_text(ERROR_MESSAGES['no_auth'])
+        return
+
+    tz = pytz.timezone(user_timezones.get(user_id, 'UTC'))
+    time_min = tz.localize(datetime.combine(first_day, datetime.min.time()))
+    time_max = tz.localize(datetime.combine(first_day + timedelta(days=days), datetime.min.time()))
+
+    try:
+        events = await fetch_agenda(user_id, user_credentials[user_id], time_min, time_max, tz)
+    except Exception as e:
+        await update.message.reply_text(ERROR_MESSAGES['fetch_error'])
+        logger.error("Ошибка при получении повестки: %s", e)
+        return
+
+    if not events:
+        await update.message.reply_text("📅 Нет событий за выбранный период.")
+        return
+
+    pages = render_agenda(events, tz)
+    message = await update.message.reply_text(pages[0], reply_markup=page_markup(0, len(pages)))
+    if len(pages) > 1:
+        # Страницы хранятся по сообщению, чтобы кнопки прежних сводок листали свои страницы.
+        agendas = context.user_data.setdefault('agenda_pages', {})
+        agendas[message.message_id] = pages
+        while len(agendas) > KEPT_AGENDAS:
+            del agendas[next(iter(agendas))]
+
+async def week_agenda(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    tz = pytz.timezone(user_timezones.get(update.effective_user.id, 'UTC'))
+    await send_agenda(update, context, datetime.now(tz).date(), 7)
+
+async def range_agenda(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    tz = pytz.timezone(user_timezones.get(update.effective_user.id, 'UTC'))
+    today = datetime.now(tz).date()
+    try:
+        first_day = parse_day(context.args[0], today) if context.args else today
+        last_day = parse_day(context.args[1], today) if len(context.args) > 1 else first_day
+    except ValueError:
+        await update.message.reply_text(ERROR_MESSAGES['invalid_range'].format(settings.agenda_max_days))
+        return
+
+    days = (last_day - first_day).days + 1
+    if not 0 < days <= settings.agenda_max_days:
+        await update.message.reply_text(ERROR_MESSAGES['invalid_range'].format(settings.agenda_max_days))
+        return
+    await send_agenda(update, context, first_day, days)
+
+async def agenda_page(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    query = update.callback_query
+    await query.answer()
+
+    page_text = query.data[len(CALLBACK_PREFIX):]
+    if not page_text.isdigit():
+        return
+
+    pages = context.user_data.get('agenda_pages', {}).get(query.message.message_id) if query.message else None
+    page = int(page_text)
+    if not pages or page >= len(pages):
+        await query.edit_message_text(ERROR_MESSAGES['expired'])
+        return
+    await query.edit_message_text(pages[page], reply_markup=page_markup(page, len(pages)))
@@ -1,9 +1,17 @@
-from google_auth_oauthlib.flow import Flow
+import asyncio
+from typing import TYPE_CHECKING
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from settings import CLIENT_SECRETS_FILE, SCOPES, REDIRECT_URI, auth_flows, user_credentials
+from settings import settings
+from profile_store import user_credentials
+from calendar_gateway import calendar_gateway
+from token_refresher import token_refresher, invalidate_user_caches
+from state_backend import state_backend
 from logger import logger
 
+if TYPE_CHECKING:
+    from google_auth_oauthlib.flow import Flow
+
 AUTH_MESSAGE = (
     'Нажмите кнопку ниже для авторизации:\n'
     'После авторизации вы будете перенаправлены на страницу, где получите код.\n'
@@ -15,15 +23,28 @@ SUCCESS_MESSAGE = ('✅ Авторизация прошла успешно! '
                    'или отправьте своё местоположение.')
 ERROR_MESSAGE = '❌ Ошибка авторизации. Попробуйте снова.'
 
+# Незавершённые авторизации хранятся в общем хранилище: /auth может обработать
+# другой процесс или уже перезапущенный бот. Сам Flow не сериализуется, поэтому
+# сохраняются state и code_verifier, из которых он восстанавливается.
+AUTH_FLOW_NAMESPACE = 'auth_flow'
+
+def create_flow(**kwargs) -> 'Flow':
+    from google_auth_oauthlib.flow import Flow
+
+    return Flow.from_client_secrets_file(
+        settings.client_secrets_file,
+        scopes=settings.scopes,
+        redirect_uri=settings.redirect_uri,
+        **kwargs
+    )
+
 async def authorize(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
-    flow = Flow.from_client_secrets_file(
-        CLIENT_SECRETS_FILE, 
-        scopes=SCOPES, 
-        redirect_uri=REDIRECT_URI
-    )
-    auth_flows[user_id] = flow
-    authorization_url, _ = flow.authorization_url()
+    flow = create_flow()
+    authorization_url, state = flow.authorization_url(access_type='offline', prompt='consent')
+    # Запись в общее хранилище может ждать блокировку sqlite, поэтому выполняется вне цикла событий.
+    await asyncio.to_thread(state_backend.set, AUTH_FLOW_NAMESPACE, user_id,
+                            {'state': state, 'code_verifier': flow.code_verifier}, settings.auth_flow_ttl)
 
     keyboard = [[InlineKeyboardButton("Авторизоваться", url=authorization_url)]]
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -38,20 +59,25 @@ async def handle_auth_code(update: Update, context: ContextTypes.DEFAULT_TYPE) -
 
     code = ' '.join(context.args).strip()
 
-    logger.info(f"Received authorization code from user {user_id}: {code}")
+    logger.info("Received authorization code from user %s", user_id)
 
-    if user_id not in auth_flows:
-        logger.warning(f"No auth flow found for user {user_id}.")
+    saved_flow = await asyncio.to_thread(state_backend.pop, AUTH_FLOW_NAMESPACE, user_id)
+    if saved_flow is None:
+        logger.warning("No auth flow found for user %s.", user_id)
         await update.message.reply_text(NO_AUTH_MESSAGE)
         return
 
-    flow = auth_flows.pop(user_id)
+    flow = create_flow(state=saved_flow['state'], code_verifier=saved_flow['code_verifier'],
+                       autogenerate_code_verifier=False)
 
     try:
-        flow.fetch_token(code=code)
+        await calendar_gateway.run(flow.fetch_token, code=code)
         user_credentials[user_id] = flow.credentials
+        # Другой аккаунт Google: события, занятость и календари прежнего больше не годятся.
+        invalidate_user_caches(user_id)
+        token_refresher.track(user_id, flow.credentials)
         await update.message.reply_text(SUCCESS_MESSAGE)
-        logger.info(f"User   {user_id} authorized successfully.")
+        logger.info("User   %s authorized successfully.", user_id)
     except Exception as e:
         await update.message.reply_text(ERROR_MESSAGE)
-        logger.error(f'Authorization error for user {user_id}: {e}')
\ No newline at end of file
+        logger.error("Authorization error for user %s: %s", user_id, e)
\ No newline at end of file
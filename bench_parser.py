@@ -0,0 +1,134 @@
+"""Проверка корпуса фраз и замер скорости date_parser.
+
+Запуск: python bench_parser.py [--iterations N] [--rounds N] [--min-speedup X]
+Код возврата 1, если разбор хотя бы одной фразы корпуса расходится с ожидаемым
+или худшее время разбора превышает --max-latency-ms. Скорость сравнивается с
+регулярными выражениями, которые date_parser заменил, и только печатается;
+с --min-speedup код возврата 1 и при отставании date_parser на длинных и
+патологических строках больше заданного.
+"""
+import argparse
+import re
+import statistics
+import sys
+import time
+from typing import Callable, Dict, Tuple
+from date_parser import parse_events
+from parser_corpus import ADVERSARIAL, CORPUS, CORPUS_TODAY
+
+# Регулярные выражения, которые заменил date_parser, в исходном виде: каждое
+# находит не больше одного события (текст — с начала сообщения).
+BASELINE_TEXT_PATTERN = re.compile(
+    r"(?i)(сегодня|завтра|послезавтра)\s+"
+    r"(?:с\s+)?(\d{1,2}):(\d{2})\s+"
+    r"(?:до\s+)?(\d{1,2}):(\d{2})\s+"
+    r"(.+)"
+)
+BASELINE_VOICE_PATTERN = re.compile(
+    r"(?P<date>сегодня|завтра|послезавтра|пустым\sоставить|на\sследующей\sнеделе|"
+    r"через\s(два|три)\s(дня|недели|месяца|года)|\d{1,2}\s[а-я]+\s\d{4})\s+"
+    r"(?:с|от)?\s*(?P<start_hour>\d{1,2}):?(?P<start_min>\d{2})?\s*(?:-|до)?\s*"
+    r"(?P<end_hour>\d{1,2}):?(?P<end_min>\d{2})?\s*(?P<title>.+)|"
+    r"(?P<today_with_time>сегодня\s+с\s(?P<start_hour_2>\d{1,2}):?(?P<start_min_2>\d{2})?\s+"
+    r"до\s+(?P<end_hour_2>\d{1,2}):?(?P<end_min_2>\d{2})?\s(?P<title_2>.+))"
+)
+
+parse_uncached = parse_events.__wrapped__
+
+
+def as_tuples(events) -> list:
+    return [(event.start.isoformat(timespec='minutes'), event.end.isoformat(timespec='minutes'), event.title)
+            for event in events]
+
+def check_corpus() -> list:
+    failures = []
+    for phrase, expected in CORPUS:
+        actual = as_tuples(parse_uncached(phrase, CORPUS_TODAY))
+        if actual != expected:
+            failures.append((phrase, expected, actual))
+    return failures
+
+def run(func, phrases: list, iterations: int) -> Tuple[float, float]:
+    """Прогоняет func по фразам: (общее время, худшее время одного разбора) в секундах."""
+    worst = 0.0
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for phrase in phrases:
+            call_started = time.perf_counter()
+            func(phrase)
+            worst = max(worst, time.perf_counter() - call_started)
+    return time.perf_counter() - started, worst
+
+def measure(funcs: Dict[str, Callable], phrases: list, iterations: int,
+            rounds: int) -> Dict[str, Tuple[float, float]]:
+    """Печатает и возвращает для каждой функции (разборов в секунду, худшее время в секундах).
+
+    Серии функций чередуются, чтобы посторонняя нагрузка на машину
+    доставалась всем поровну; скорость — по медиане серий.
+    """
+    elapsed = {name: [] for name in funcs}
+    worst = dict.fromkeys(funcs, 0.0)
+    for _ in range(rounds):
+        for name, func in funcs.items():
+            round_elapsed, round_worst = run(func, phrases, iterations)
+            elapsed[name].append(round_elapsed)
+            worst[name] = max(worst[name], round_worst)
+    total = iterations * len(phrases)
+    results = {}
+    for name in funcs:
+        throughput = total / statistics.median(elapsed[name])
+        results[name] = throughput, worst[name]
+        print(f"{name:<28} {throughput:>12,.0f} разборов/с   худшее {worst[name] * 1000:8.3f} мс")
+    return results
+
+def speedup(results: Dict[str, Tuple[float, float]]) -> float:
+    """Во сколько раз date_parser быстрее самого быстрого исходного regex; печатает отношение."""
+    baseline = max(throughput for name, (throughput, _) in results.items() if name.startswith('исходный'))
+    ratio = results['date_parser'][0] / baseline
+    print(f"{'date_parser / исходный regex':<28} {ratio:>12.3g}×")
+    return ratio
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--rounds', type=int, default=5, help='чередующихся серий замера, берётся медиана')
+    parser.add_argument('--max-latency-ms', type=float, default=50.0)
+    parser.add_argument('--min-speedup', type=float, default=None,
+                        help='минимальное отношение скорости date_parser к исходным regex на длинных строках')
+    args = parser.parse_args()
+
+    failures = check_corpus()
+    print(f"Корпус: {len(CORPUS) - len(failures)}/{len(CORPUS)} фраз разобраны верно")
+    for phrase, expected, actual in failures:
+        print(f"  {phrase!r}\n    ожидалось: {expected}\n    получено:  {actual}")
+
+    phrases = [phrase for phrase, _ in CORPUS]
+    funcs = {
+        "date_parser": lambda phrase: parse_uncached(phrase, CORPUS_TODAY),
+        "исходный regex (текст)": BASELINE_TEXT_PATTERN.match,
+        "исходный regex (голос)": BASELINE_VOICE_PATTERN.search,
+    }
+
+    print("\nКорпус:")
+    corpus = measure({**funcs, "date_parser (кэш)": lambda phrase: parse_events(phrase, CORPUS_TODAY)},
+                     phrases, args.iterations, args.rounds)
+    # date_parser ещё вычисляет даты и названия всех событий, чего regex не делают.
+    speedup(corpus)
+
+    print("\nДлинные и патологические строки:")
+    adversarial = measure(funcs, ADVERSARIAL, max(1, args.iterations // 50), args.rounds)
+    ratio = speedup(adversarial)
+    worst = adversarial['date_parser'][1]
+
+    failed = bool(failures)
+    if worst * 1000 > args.max_latency_ms:
+        print(f"\nХудшее время date_parser {worst * 1000:.1f} мс превышает {args.max_latency_ms} мс")
+        failed = True
+    if args.min_speedup is not None and ratio < args.min_speedup:
+        print(f"\ndate_parser на длинных строках отстаёт от исходных regex: "
+              f"×{ratio:.3g} при пороге ×{args.min_speedup}")
+        failed = True
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,142 @@
+from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, CallbackQueryHandler, TypeHandler
+from telegram import Update
+
+from settings import settings
+from commands import start, help_command, stats_command
+from auth import authorize, handle_auth_code
+from timezone import set_timezone, timezone_button, handle_location
+from add_event_voice import handle_voice, handle_conflict_choice
+from add_event_text import add_event_from_text
+from edit_event import edit_event
+from add_event_text import get_user_events
+from agenda import week_agenda, range_agenda, agenda_page
+from transcript_cache import transcript_cache
+from calendar_gateway import calendar_gateway
+from calendar_service import start_client_pruner
+from speech import speech_pool
+import voice_pipeline
+from user_data import close_user_data
+from profile_store import profile_store, start_profile_flusher
+from token_refresher import start_token_refresher
+from update_processor import KeyedUpdateProcessor
+from worker_pool import UpdateDispatcher, run_worker, set_worker, worker_metrics_port
+from state_backend import state_backend
+from metrics import metrics, timer, start_metrics_server
+from notifications import daily_command, remind_command, start_notification_scheduler
+
+def setup_handlers(application):
+    handlers = [
+        CommandHandler('start', start),
+        CommandHandler('help', help_command),
+        CommandHandler('authorize', authorize),
+        CommandHandler('auth', handle_auth_code),
+        CommandHandler('timezone', set_timezone),
+        CommandHandler('edit', edit_event),
+        CommandHandler("today_tasks", get_user_events),
+        CommandHandler('week', week_agenda),
+        CommandHandler('agenda', range_agenda),
+        CommandHandler('daily', daily_command),
+        CommandHandler('remind', remind_command),
+        CommandHandler('stats', stats_command),
+        CallbackQueryHandler(agenda_page, pattern=r'^agenda:'),
+        CallbackQueryHandler(handle_conflict_choice, pattern=r'^conflict:'),
+        CallbackQueryHandler(timezone_button),
+        MessageHandler(filters.LOCATION, handle_location),
+        MessageHandler(filters.VOICE, handle_voice),
+        MessageHandler(filters.TEXT & ~filters.COMMAND, add_event_from_text),
+    ]   
+    for handler in handlers:
+        handler.callback = timer('handler_seconds', handler=handler.callback.__name__)(handler.callback)
+        application.add_handler(handler)
+
+async def on_startup(application) -> None:
+    await start_profile_flusher()
+    await start_token_refresher()
+    await start_client_pruner()
+    await start_notification_scheduler(application.bot)
+    application.bot_data['metrics_server'] = await start_metrics_server(
+        settings.metrics_host, worker_metrics_port(settings.metrics_port))
+
+async def on_shutdown(application) -> None:
+    metrics_server = application.bot_data.get('metrics_server')
+    if metrics_server is not None:
+        metrics_server.close()
+    profile_store.close()
+    transcript_cache.save()
+    speech_pool.shutdown()
+    voice_pipeline.shutdown()
+    calendar_gateway.shutdown()
+    close_user_data()
+    state_backend.close()
+
+def build_application(with_updater: bool = True):
+    update_processor = KeyedUpdateProcessor(settings.update_concurrency, settings.update_queue_warn_depth)
+    metrics.gauge('updates_in_flight', lambda: update_processor.stats()['in_flight'], 'Обновления в обработке')
+    metrics.gauge('updates_queued', lambda: update_processor.stats()['queued'], 'Обновления в очередях пользователей')
+    builder = (
+        ApplicationBuilder()
+        .token(settings.telegram_token)
+        .concurrent_updates(update_processor)
+        .post_init(on_startup)
+        .post_shutdown(on_shutdown)
+    )
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.build()
+    setup_handlers(application)
+    return application
+
+def run_application(application) -> None:
+    if settings.webhook_url:
+        # Telegram сам доставляет обновления на встроенный сервер PTB; setWebhook вызывается при запуске.
+        application.run_webhook(
+            listen=settings.webhook_listen,
+            port=settings.webhook_port,
+            url_path=settings.webhook_path,
+            webhook_url=f"{settings.webhook_url.rstrip('/')}/{settings.webhook_path}",
+            secret_token=settings.webhook_secret,
+            max_connections=settings.webhook_max_connections,
+            allowed_updates=Update.ALL_TYPES,
+        )
+    else:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+
+def start_worker(index: int, workers: int, inbox) -> None:
+    """Точка входа процесса-обработчика в режиме нескольких процессов."""
+    set_worker(index, workers)
+    run_worker(build_application(with_updater=False), inbox)
+
+def run_dispatcher() -> None:
+    """Процесс, который только принимает обновления и раскладывает их по обработчикам."""
+    dispatcher = UpdateDispatcher(settings.workers, start_worker)
+    metrics.gauge('workers_alive', dispatcher.alive, 'Работающие процессы-обработчики')
+
+    async def on_dispatcher_startup(application) -> None:
+        await dispatcher.start(application)
+        application.bot_data['metrics_server'] = await start_metrics_server(settings.metrics_host, settings.metrics_port)
+
+    async def on_dispatcher_shutdown(application) -> None:
+        metrics_server = application.bot_data.get('metrics_server')
+        if metrics_server is not None:
+            metrics_server.close()
+        await dispatcher.stop(application)
+
+    application = (
+        ApplicationBuilder()
+        .token(settings.telegram_token)
+        .post_init(on_dispatcher_startup)
+        .post_shutdown(on_dispatcher_shutdown)
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, dispatcher.dispatch))
+    run_application(application)
+
+def main() -> None:
+    settings.validate()
+    if settings.workers > 1:
+        run_dispatcher()
+    else:
+        run_application(build_application())
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""Сборка сетки часовых поясов для timezone_index.
+
+Запуск: python build_timezone_index.py --geojson combined.json [--cells-per-degree N] [--output PATH]
+
+Растеризуются упрощённые полигоны границ зон (например, combined.json из
+timezone-boundary-builder), ячейки вне полигонов остаются пустыми. Сетка
+в репозитории не хранится: без неё timezone_index ищет ближайшую опорную
+точку, что у границ зон даёт ошибки.
+
+Формат файла: заголовок GRID_HEADER, названия зон через '\\n', затем
+строки сетки с юга на север, по uint16 (little-endian) на ячейку;
+0 — ячейка без зоны, n — n-я зона из списка.
+"""
+import argparse
+import array
+import json
+import math
+import sys
+from typing import Dict, List, Tuple
+from settings import settings
+from timezone_index import GRID_HEADER, GRID_MAGIC
+
+
+def _rings(geometry: dict) -> List[list]:
+    if geometry['type'] == 'Polygon':
+        return list(geometry['coordinates'])
+    if geometry['type'] == 'MultiPolygon':
+        return [ring for polygon in geometry['coordinates'] for ring in polygon]
+    return []
+
+def build_from_geojson(path: str, cells: int) -> Tuple[List[str], array.array]:
+    with open(path, encoding='utf-8') as geojson_file:
+        features = json.load(geojson_file)['features']
+    zones = sorted({feature['properties']['tzid'] for feature in features})
+    zone_ids: Dict[str, int] = {zone: index + 1 for index, zone in enumerate(zones)}
+
+    columns, rows = 360 * cells, 180 * cells
+    grid = array.array('H', bytes(2 * columns * rows))
+    for feature in features:
+        zone_id = zone_ids[feature['properties']['tzid']]
+        edges = []
+        for ring in _rings(feature['geometry']):
+            edges.extend(zip(ring, ring[1:] + ring[:1]))
+        if not edges:
+            continue
+        lats = [lat for (_, lat), _ in edges]
+        first_row = max(0, int((min(lats) + 90) * cells))
+        last_row = min(rows - 1, int((max(lats) + 90) * cells))
+        for row in range(first_row, last_row + 1):
+            lat = -90 + (row + 0.5) / cells
+            # Чётно-нечётное правило по центрам ячеек строки; дыры учитываются автоматически.
+            crossings = sorted(
+                lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+                for (lon1, lat1), (lon2, lat2) in edges
+                if (lat1 <= lat) != (lat2 <= lat)
+            )
+            for west, east in zip(crossings[::2], crossings[1::2]):
+                first = max(0, math.ceil((west + 180) * cells - 0.5))
+                last = min(columns - 1, math.floor((east + 180) * cells - 0.5))
+                offset = row * columns
+                for column in range(first, last + 1):
+                    grid[offset + column] = zone_id
+    return zones, grid
+
+def write_grid(path: str, cells: int, zones: List[str], grid: array.array) -> None:
+    names = '\n'.join(zones).encode('utf-8')
+    if sys.byteorder != 'little':
+        grid.byteswap()
+    with open(path, 'wb') as grid_file:
+        grid_file.write(GRID_HEADER.pack(GRID_MAGIC, cells, len(zones), len(names)))
+        grid_file.write(names)
+        grid.tofile(grid_file)
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--geojson', required=True, help='GeoJSON с полигонами зон (свойство tzid)')
+    parser.add_argument('--cells-per-degree', type=int, default=2)
+    parser.add_argument('--output', default=settings.timezone_index_path)
+    args = parser.parse_args()
+
+    zones, grid = build_from_geojson(args.geojson, args.cells_per_degree)
+    write_grid(args.output, args.cells_per_degree, zones, grid)
+    print(f"{args.output}: {len(zones)} зон, {len(grid)} ячеек, {args.cells_per_degree} ячеек на градус")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+import asyncio
+import bisect
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional, Sequence, Set, Tuple
+from cache import LRUCache
+from calendar_gateway import calendar_gateway
+from agenda import get_selected_calendars
+from metrics import count
+from settings import settings
+from logger import logger
+
+DAY = 24 * 3600
+
+# (начало, конец, ключ) в секундах эпохи; ключ — id события, записанного ботом, или '' для данных freebusy.
+Interval = Tuple[float, float, str]
+
+
+class IntervalTree:
+    """Дерево интервалов поверх отсортированного по началу массива.
+
+    Узел поддерева [lo, hi) — его середина; для каждого узла хранится
+    наибольший конец интервалов поддерева, что позволяет отсекать ветви, в
+    которых нет пересечений. Поиск — O(log n + k). Вставка и удаление
+    перестраивают массив максимумов за O(n): интервалов у пользователя
+    немного, а изменяются они реже, чем проверяются.
+    """
+
+    def __init__(self, intervals: Optional[List[Interval]] = None):
+        self._intervals: List[Interval] = sorted(intervals or [])
+        self._max_end: List[float] = []
+        self._rebuild()
+
+    def _rebuild(self) -> None:
+        self._max_end = [0.0] * len(self._intervals)
+        self._fill(0, len(self._intervals))
+
+    def _fill(self, lo: int, hi: int) -> float:
+        if lo >= hi:
+            return float('-inf')
+        mid = (lo + hi) // 2
+        self._max_end[mid] = max(self._intervals[mid][1], self._fill(lo, mid), self._fill(mid + 1, hi))
+        return self._max_end[mid]
+
+    def add(self, start: float, end: float, key: str = '') -> None:
+        bisect.insort(self._intervals, (start, end, key))
+        self._rebuild()
+
+    def remove(self, start: float, end: float) -> bool:
+        """Удаляет один интервал с такими границами независимо от ключа."""
+        for index, interval in enumerate(self._intervals):
+            if interval[0] == start and interval[1] == end:
+                del self._intervals[index]
+                self._rebuild()
+                return True
+        return False
+
+    def overlapping(self, start: float, end: float) -> List[Interval]:
+        found: List[Interval] = []
+        self._search(0, len(self._intervals), start, end, found)
+        return found
+
+    def _search(self, lo: int, hi: int, start: float, end: float, found: List[Interval]) -> None:
+        if lo >= hi:
+            return
+        mid = (lo + hi) // 2
+        if self._max_end[mid] <= start:
+            return
+        self._search(lo, mid, start, end, found)
+        interval = self._intervals[mid]
+        if interval[0] >= end:
+            return
+        if interval[1] > start:
+            found.append(interval)
+        self._search(mid + 1, hi, start, end, found)
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+
+@dataclass
+class BusyWindow:
+    start: float
+    end: float
+    tree: IntervalTree
+    fetched_at: float = field(default_factory=time.monotonic)
+    # Интервалы, добавленные ботом: (момент добавления, начало, конец, ключ).
+    local: List[Tuple[float, float, float, str]] = field(default_factory=list)
+
+
+class BusyCache:
+    """Занятое время пользователя по freebusy.query для проверки пересечений перед вставкой.
+
+    Запрашивается окно на window_days вперёд по всем выбранным календарям.
+    Пока окно покрывает проверяемый интервал, ответ берётся из кэша; после
+    ttl кэш по-прежнему отвечает, а обновление запускается в фоне. События,
+    созданные и перенесённые ботом, сразу вносятся в дерево без запроса к API;
+    если старый интервал перенесённого события в дереве не найден, окно
+    сбрасывается.
+    """
+
+    def __init__(self, max_users: int, ttl: float, window_days: int):
+        self.ttl = ttl
+        self.window_days = window_days
+        self._windows = LRUCache(max_users)
+        self._refreshing: Set[int] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def _fetch(self, user_id: int, credentials, start: float) -> BusyWindow:
+        window_start = start - start % DAY
+        window_end = window_start + self.window_days * DAY
+        fetch_started = time.monotonic()
+        calendars = await get_selected_calendars(user_id, credentials)
+        result = await calendar_gateway.query_freebusy(
+            user_id, credentials, to_rfc3339(window_start), to_rfc3339(window_end),
+            [calendar_id for calendar_id, _ in calendars],
+        )
+        intervals = []
+        for calendar_id, calendar in result.get('calendars', {}).items():
+            if calendar.get('errors'):
+                logger.warning("freebusy не вернул занятость календаря %s: %s", calendar_id, calendar['errors'])
+            for busy in calendar.get('busy', []):
+                intervals.append((parse_timestamp(busy['start']), parse_timestamp(busy['end']), ''))
+        window = BusyWindow(window_start, window_end, IntervalTree(intervals))
+
+        # То, что бот записал, пока шёл запрос, в ответ могло не попасть.
+        previous = self._windows.get(user_id)
+        if previous is not None:
+            for added_at, interval_start, interval_end, key in previous.local:
+                if added_at >= fetch_started:
+                    window.tree.add(interval_start, interval_end, key)
+                    window.local.append((added_at, interval_start, interval_end, key))
+        self._windows.set(user_id, window)
+        return window
+
+    async def _refresh(self, user_id: int, credentials, start: float) -> None:
+        try:
+            await self._fetch(user_id, credentials, start)
+        except Exception as e:
+            logger.warning("Не удалось обновить занятость пользователя %s: %s", user_id, e)
+        finally:
+            self._refreshing.discard(user_id)
+
+    async def busy(self, user_id: int, credentials, start: float, end: float) -> IntervalTree:
+        window = self._windows.get(user_id)
+        if window is None or start < window.start or end > window.end:
+            count('busy_cache_total', result='miss')
+            window = await self._fetch(user_id, credentials, start)
+        elif time.monotonic() - window.fetched_at > self.ttl:
+            count('busy_cache_total', result='stale')
+            if user_id not in self._refreshing:
+                self._refreshing.add(user_id)
+                task = asyncio.create_task(self._refresh(user_id, credentials, window.start))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        else:
+            count('busy_cache_total', result='hit')
+        return window.tree
+
+    async def conflicts(self, user_id: int, credentials, start: float, end: float) -> List[Interval]:
+        tree = await self.busy(user_id, credentials, start, end)
+        return tree.overlapping(start, end)
+
+    async def next_free(self, user_id: int, credentials, start: float, end: float, until: float,
+                        taken: Sequence[Interval] = ()) -> Optional[float]:
+        """Ближайшее начало не раньше start, при котором интервал той же длины свободен до until."""
+        duration = end - start
+        tree = await self.busy(user_id, credentials, start, until)
+        candidate = start
+        while candidate + duration <= until:
+            overlaps = tree.overlapping(candidate, candidate + duration) + [
+                interval for interval in taken if interval[0] < candidate + duration and interval[1] > candidate
+            ]
+            if not overlaps:
+                return candidate
+            candidate = max(interval[1] for interval in overlaps)
+        return None
+
+    def add(self, user_id: int, event: dict) -> None:
+        """Учитывает событие, созданное ботом."""
+        window = self._windows.get(user_id)
+        interval = event_interval(event)
+        if window is None or interval is None:
+            return
+        now = time.monotonic()
+        window.tree.add(*interval, event.get('id', ''))
+        # Фоновое обновление длится намного меньше ttl, более старые записи ему не нужны.
+        window.local = [entry for entry in window.local if now - entry[0] <= self.ttl]
+        window.local.append((now, *interval, event.get('id', '')))
+
+    def move(self, user_id: int, old_event: Optional[dict], new_event: dict) -> None:
+        """Учитывает перенос события: старый интервал удаляется, новый добавляется."""
+        window = self._windows.get(user_id)
+        if window is None:
+            return
+        old_interval = event_interval(old_event) if old_event else None
+        if old_interval is not None:
+            if not window.tree.remove(*old_interval):
+                # freebusy склеивает соседние и пересекающиеся интервалы, и старый мог войти
+                # в более широкий: вычесть его нельзя, поэтому окно запрашивается заново.
+                self.invalidate(user_id)
+                return
+            window.local = [entry for entry in window.local if entry[1:3] != old_interval]
+        self.add(user_id, new_event)
+
+    def invalidate(self, user_id: int) -> None:
+        self._windows.pop(user_id)
+
+
+def parse_timestamp(value: str) -> float:
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+def to_rfc3339(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat().replace('+00:00', 'Z')
+
+def event_interval(event: dict) -> Optional[Tuple[float, float]]:
+    """Границы события со временем начала и конца; для событий на весь день — None."""
+    start, end = event.get('start', {}), event.get('end', {})
+    if 'dateTime' not in start or 'dateTime' not in end:
+        return None
+    return parse_timestamp(start['dateTime']), parse_timestamp(end['dateTime'])
+
+
+busy_cache = BusyCache(settings.busy_cache_size, settings.busy_cache_ttl, settings.busy_window_days)
@@ -0,0 +1,79 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """Потокобезопасный LRU-кэш с ограничением по размеру и времени простоя."""
+
+    def __init__(self, max_size: int, idle_ttl: Optional[float] = None,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self._on_evict = on_evict
+        self._items: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return default
+            value, last_used = item
+            now = time.monotonic()
+            if self.idle_ttl is not None and now - last_used > self.idle_ttl:
+                del self._items[key]
+                self._evicted(key, value)
+                return default
+            self._items[key] = (value, now)
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._items[key] = (value, time.monotonic())
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                old_key, (old_value, _) = self._items.popitem(last=False)
+                self._evicted(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._items.pop(key, None)
+            return default if item is None else item[0]
+
+    def prune(self) -> int:
+        """Удаляет записи, простаивающие дольше idle_ttl."""
+        if self.idle_ttl is None:
+            return 0
+        removed = 0
+        with self._lock:
+            now = time.monotonic()
+            while self._items:
+                key, (value, last_used) = next(iter(self._items.items()))
+                if now - last_used <= self.idle_ttl:
+                    break
+                del self._items[key]
+                self._evicted(key, value)
+                removed += 1
+        return removed
+
+    def items(self) -> list:
+        """Снимок содержимого от давно использованных к недавним."""
+        with self._lock:
+            return [(key, value) for key, (value, _) in self._items.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def _evicted(self, key: Hashable, value: Any) -> None:
+        if self._on_evict is not None:
+            self._on_evict(key, value)
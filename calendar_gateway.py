@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, Hashable, Optional
+from calendar_service import get_calendar_service
+from rate_limiter import RateLimiter, is_duplicate, is_retryable, sleep_before_retry
+from metrics import metrics, timer, count
+from settings import settings
+
+if TYPE_CHECKING:
+    import httplib2
+    from google.oauth2.credentials import Credentials
+
+
+class CalendarGateway:
+    """Выполняет блокирующие вызовы Google API в пуле потоков.
+
+    Число одновременных вызовов ограничено семафором, каждый вызов — таймаутом.
+    httplib2 не потокобезопасен, поэтому у каждого потока пула свой транспорт.
+    Запросы к Calendar API проходят через RateLimiter и повторяются с
+    экспоненциальной задержкой при 429, 5xx и 403 rateLimitExceeded.
+
+    Ошибка 5xx или обрыв соединения не означают, что запрос не выполнен,
+    поэтому вставляемому событию заранее присваивается id: повтор уже
+    записанной вставки получает 409, и вместо дубликата возвращается
+    записанное событие.
+
+    Истёкший токен обновляется перед запросом под блокировкой пользователя,
+    общей с фоновым TokenRefresher, чтобы одни Credentials не обновлялись
+    из двух потоков сразу. Если после вызова токен изменился (в том числе
+    при обновлении внутри AuthorizedHttp после 401), вызывается
+    on_token_refresh, чтобы профиль был сохранён.
+    """
+
+    def __init__(self, max_workers: int, max_concurrency: int, timeout: float, limiter: RateLimiter,
+                 max_retries: int = settings.calendar_max_retries,
+                 backoff_base: float = settings.calendar_backoff_base,
+                 backoff_cap: float = settings.calendar_backoff_cap):
+        self.timeout = timeout
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='calendar')
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._local = threading.local()
+        self._refresh_locks: Dict[Hashable, threading.Lock] = {}
+        self._refresh_locks_guard = threading.Lock()
+        self.on_token_refresh: Optional[Callable[[Hashable, Credentials], None]] = None
+
+    async def run(self, func: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await asyncio.wait_for(
+                loop.run_in_executor(self._executor, partial(func, *args, **kwargs)),
+                timeout or self.timeout,
+            )
+
+    async def execute(self, request, credentials: Credentials, user_id: Optional[Hashable] = None,
+                      timeout: Optional[float] = None) -> Any:
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(user_id)
+            token = credentials.token
+            try:
+                with timer('external_call_seconds', service='calendar', method=getattr(request, 'methodId', None)):
+                    return await self.run(self._execute, request, credentials, user_id, timeout=timeout)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                count('calendar_retries_total')
+                await sleep_before_retry(attempt, self.backoff_base, self.backoff_cap, e,
+                                         f"Запрос Calendar API пользователя {user_id}")
+            finally:
+                self._check_token(user_id, credentials, token)
+
+    def _execute(self, request, credentials: Credentials, user_id: Optional[Hashable] = None) -> Any:
+        from google_auth_httplib2 import AuthorizedHttp
+        token = credentials.token
+        if not credentials.valid:
+            # Иначе токен обновил бы AuthorizedHttp, минуя блокировку пользователя.
+            self.refresh_credentials(user_id, credentials, token)
+        return request.execute(http=AuthorizedHttp(credentials, http=self._thread_http()))
+
+    def refresh_credentials(self, user_id: Optional[Hashable], credentials: Credentials,
+                            stale_token: Optional[str]) -> bool:
+        """Обновляет токен, если его ещё не заменил другой поток; False — обновлять не пришлось."""
+        with self._refresh_locks_guard:
+            lock = self._refresh_locks.setdefault(user_id, threading.Lock())
+        with lock:
+            if credentials.token != stale_token:
+                return False
+            from google_auth_httplib2 import Request
+            credentials.refresh(Request(self._thread_http()))
+            return True
+
+    def _check_token(self, user_id: Optional[Hashable], credentials: Credentials, token: Optional[str]) -> None:
+        if credentials.token != token and user_id is not None and self.on_token_refresh is not None:
+            self.on_token_refresh(user_id, credentials)
+
+    def _thread_http(self) -> httplib2.Http:
+        http = getattr(self._local, 'http', None)
+        if http is None:
+            import httplib2
+            http = self._local.http = httplib2.Http(timeout=self.timeout)
+        return http
+
+    async def insert_event(self, user_id: int, credentials: Credentials, event: dict,
+                           calendar_id: str = 'primary') -> dict:
+        service = get_calendar_service(user_id, credentials)
+        event = with_event_id(event)
+        try:
+            return await self.execute(service.events().insert(calendarId=calendar_id, body=event), credentials, user_id)
+        except Exception as e:
+            if not is_duplicate(e):
+                raise
+            return await self.get_event(user_id, credentials, event['id'], calendar_id)
+
+    async def execute_batch(self, service, requests: list, credentials: Credentials,
+                            user_id: Optional[Hashable] = None) -> list:
+        """Выполняет запросы одним batch-запросом. Для каждого — ответ или исключение.
+
+        Каждый вложенный запрос расходует квоту; отклонённые по лимиту
+        повторяются следующим batch-запросом только они.
+        """
+        results = [None] * len(requests)
+
+        def callback(request_id, response, exception):
+            results[int(request_id)] = exception or response
+
+        pending = list(range(len(requests)))
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.acquire(user_id, len(pending))
+            batch = service.new_batch_http_request(callback=callback)
+            for index in pending:
+                batch.add(requests[index], request_id=str(index))
+            token = credentials.token
+            try:
+                with timer('external_call_seconds', service='calendar', method='batch'):
+                    await self.run(self._execute, batch, credentials, user_id)
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                count('calendar_retries_total')
+                await sleep_before_retry(attempt, self.backoff_base, self.backoff_cap, e,
+                                         f"Batch-запрос Calendar API пользователя {user_id}")
+                continue
+            finally:
+                self._check_token(user_id, credentials, token)
+            pending = [index for index in pending if is_retryable(results[index])]
+            if not pending or attempt == self.max_retries:
+                break
+            count('calendar_retries_total', len(pending))
+            await sleep_before_retry(attempt, self.backoff_base, self.backoff_cap, results[pending[0]],
+                                     f"Batch-запрос Calendar API пользователя {user_id}, {len(pending)} из {len(requests)}")
+        return results
+
+    async def insert_events(self, user_id: int, credentials: Credentials, events: list,
+                            calendar_id: str = 'primary') -> list:
+        service = get_calendar_service(user_id, credentials)
+        events = [with_event_id(event) for event in events]
+        requests = [service.events().insert(calendarId=calendar_id, body=event) for event in events]
+        results = await self.execute_batch(service, requests, credentials, user_id)
+        for index, result in enumerate(results):
+            if is_duplicate(result):
+                try:
+                    results[index] = await self.get_event(user_id, credentials, events[index]['id'], calendar_id)
+                except Exception as e:
+                    results[index] = e
+        return results
+
+    async def list_events(self, user_id: int, credentials: Credentials,
+                          calendar_id: str = 'primary', **params) -> dict:
+        service = get_calendar_service(user_id, credentials)
+        return await self.execute(service.events().list(calendarId=calendar_id, **params), credentials, user_id)
+
+    async def iter_events(self, user_id: int, credentials: Credentials,
+                          calendar_id: str = 'primary', **params) -> AsyncIterator[dict]:
+        """Постранично отдаёт события, следуя nextPageToken."""
+        page_token = None
+        while True:
+            result = await self.list_events(user_id, credentials, calendar_id, pageToken=page_token, **params)
+            for event in result.get('items', []):
+                yield event
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return
+
+    async def list_calendars(self, user_id: int, credentials: Credentials, **params) -> dict:
+        service = get_calendar_service(user_id, credentials)
+        return await self.execute(service.calendarList().list(**params), credentials, user_id)
+
+    async def get_event(self, user_id: int, credentials: Credentials, event_id: str,
+                        calendar_id: str = 'primary') -> dict:
+        service = get_calendar_service(user_id, credentials)
+        return await self.execute(service.events().get(calendarId=calendar_id, eventId=event_id), credentials, user_id)
+
+    async def update_event(self, user_id: int, credentials: Credentials, event_id: str, event: dict,
+                           calendar_id: str = 'primary') -> dict:
+        service = get_calendar_service(user_id, credentials)
+        request = service.events().update(calendarId=calendar_id, eventId=event_id, body=event)
+        return await self.execute(request, credentials, user_id)
+
+    async def patch_event(self, user_id: int, credentials: Credentials, event_id: str, changes: dict,
+                          calendar_id: str = 'primary') -> dict:
+        service = get_calendar_service(user_id, credentials)
+        request = service.events().patch(calendarId=calendar_id, eventId=event_id, body=changes)
+        return await self.execute(request, credentials, user_id)
+
+    async def patch_events(self, user_id: int, credentials: Credentials, patches: list,
+                           calendar_id: str = 'primary') -> list:
+        """patches — список пар (event_id, изменения)."""
+        service = get_calendar_service(user_id, credentials)
+        requests = [service.events().patch(calendarId=calendar_id, eventId=event_id, body=changes)
+                    for event_id, changes in patches]
+        return await self.execute_batch(service, requests, credentials, user_id)
+
+    async def query_freebusy(self, user_id: int, credentials: Credentials, time_min: str, time_max: str,
+                             calendar_ids: list) -> dict:
+        service = get_calendar_service(user_id, credentials)
+        body = {'timeMin': time_min, 'timeMax': time_max, 'items': [{'id': calendar_id} for calendar_id in calendar_ids]}
+        return await self.execute(service.freebusy().query(body=body), credentials, user_id)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def with_event_id(event: dict) -> dict:
+    """Копия события с id, сгенерированным на клиенте (base32hex: a–v и 0–9), если его нет."""
+    return event if event.get('id') else {**event, 'id': uuid.uuid4().hex}
+
+
+calendar_gateway = CalendarGateway(
+    settings.calendar_workers, settings.calendar_max_concurrency, settings.calendar_call_timeout,
+    RateLimiter(settings.calendar_rate, settings.calendar_burst,
+                settings.calendar_user_rate, settings.calendar_user_burst),
+)
+metrics.gauge('calendar_rate_limit_queued', calendar_gateway.limiter.queued,
+              'Запросы к Calendar API, ожидающие токенов')
+
@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from typing import TYPE_CHECKING
+from cache import LRUCache
+from settings import settings
+from logger import logger
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+CALENDAR_API = 'calendar'
+CALENDAR_API_VERSION = 'v3'
+
+
+class CalendarServiceCache:
+    """Кэш клиентов Google Calendar по пользователям.
+
+    Discovery-документ берётся из комплекта googleapiclient и разбирается
+    один раз; клиенты создаются лениво и живут в LRU, ограниченном по
+    размеру и времени простоя.
+    """
+
+    def __init__(self, max_size: int, idle_ttl: float):
+        self._document = None
+        self._clients = LRUCache(max_size, idle_ttl)
+
+    @property
+    def document(self) -> dict:
+        if self._document is None:
+            from googleapiclient.discovery_cache import get_static_doc
+            self._document = json.loads(get_static_doc(CALENDAR_API, CALENDAR_API_VERSION))
+        return self._document
+
+    def get(self, user_id: int, credentials: Credentials):
+        cached = self._clients.get(user_id)
+        if cached is not None and cached[0] is credentials:
+            return cached[1]
+
+        from googleapiclient.discovery import build_from_document
+        service = build_from_document(self.document, credentials=credentials)
+        self._clients.set(user_id, (credentials, service))
+        logger.info("Создан клиент Calendar для пользователя %s", user_id)
+        return service
+
+    def invalidate(self, user_id: int) -> None:
+        self._clients.pop(user_id)
+
+    async def prune_periodically(self) -> None:
+        """Удаляет простаивающие клиенты, даже если к ним больше не обращаются."""
+        interval = max(1.0, self._clients.idle_ttl / 2)
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = self._clients.prune()
+                if removed:
+                    logger.info("Удалено простаивающих клиентов Calendar: %s", removed)
+            except Exception as e:
+                logger.error("Ошибка при очистке кэша клиентов Calendar: %s", e)
+
+
+calendar_services = CalendarServiceCache(settings.calendar_client_cache_size, settings.calendar_client_idle_ttl)
+
+def get_calendar_service(user_id: int, credentials: Credentials):
+    return calendar_services.get(user_id, credentials)
+
+def invalidate_calendar_service(user_id: int) -> None:
+    calendar_services.invalidate(user_id)
+
+async def start_client_pruner() -> asyncio.Task:
+    return asyncio.create_task(calendar_services.prune_periodically())
@@ -0,0 +1,102 @@
+"""Проверка времени импорта бота.
+
+Запускает `python -X importtime -c "import bot"` в отдельном процессе,
+печатает самые медленные модули и завершается с кодом 1, если суммарное
+время импорта bot превышает бюджет или при старте загрузился модуль,
+который должен подгружаться только при первом использовании. Зависимости,
+которые загружаются при старте намеренно, перечислены в EAGER_MODULES
+с причиной и временем импорта.
+
+    python check_import_time.py --budget-ms 800 --top 15
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+from typing import List, Tuple
+
+# Тяжёлые зависимости, которые импортируются внутри функций при первом обращении.
+DEFERRED_MODULES = [
+    'googleapiclient.discovery',
+    'google_auth_oauthlib',
+    'google_auth_httplib2',
+    'httplib2',
+    'speech_recognition',
+    'pydub',
+]
+
+# Зависимости, которые намеренно импортируются при старте, и почему; их время печатается отдельно.
+EAGER_MODULES = {
+    'pytz': "часовой пояс пользователя нужен почти каждому обработчику; "
+            "при импорте читается только список зон, сами зоны — при первом обращении",
+    'googleapiclient.errors': "HttpError нужен для разбора ошибок в rate_limiter и event_cache; "
+                              "модуль не тянет googleapiclient.discovery",
+}
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+PROBE = (
+    "import sys, json, bot; "
+    "print(json.dumps([name for name in {deferred!r} if name in sys.modules]))"
+)
+
+
+def run_probe(deferred: List[str]) -> Tuple[str, str]:
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(deferred=deferred)],
+        capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)), env=env,
+    )
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"Не удалось импортировать bot (код {result.returncode})")
+    return result.stdout, result.stderr
+
+def parse_importtime(output: str) -> List[Tuple[str, int, int]]:
+    """Строки -X importtime: (модуль, собственное время, суммарное время) в микросекундах."""
+    entries = []
+    for line in output.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, _, name = match.groups()
+            entries.append((name, int(self_us), int(cumulative_us)))
+    return entries
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget-ms', type=float, default=1000.0, help='допустимое время импорта bot, мс')
+    parser.add_argument('--top', type=int, default=10, help='сколько самых медленных модулей показать')
+    args = parser.parse_args()
+
+    stdout, stderr = run_probe(DEFERRED_MODULES)
+    entries = parse_importtime(stderr)
+    total_us = next((cumulative for name, _, cumulative in reversed(entries) if name == 'bot'), None)
+    if total_us is None:
+        raise SystemExit("В выводе -X importtime нет строки для bot")
+
+    print(f"Импорт bot: {total_us / 1000:.1f} мс (бюджет {args.budget_ms:.0f} мс)")
+    print("Самые медленные модули (собственное время):")
+    for name, self_us, cumulative_us in sorted(entries, key=lambda entry: entry[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1000:8.1f} мс  {cumulative_us / 1000:8.1f} мс  {name}")
+
+    imported = {name: cumulative for name, _, cumulative in entries}
+    print("Загружаются при старте намеренно:")
+    for name, reason in EAGER_MODULES.items():
+        cost = f"{imported[name] / 1000:.1f} мс" if name in imported else "не загружен"
+        print(f"  {name} ({cost}): {reason}")
+
+    failed = False
+    loaded = json.loads(stdout.strip().splitlines()[-1])
+    if loaded:
+        print(f"Загружены при старте, хотя должны подгружаться лениво: {', '.join(loaded)}")
+        failed = True
+    if total_us / 1000 > args.budget_ms:
+        print(f"Превышен бюджет времени импорта на {total_us / 1000 - args.budget_ms:.1f} мс")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,12 @@
+import asyncio
+from typing import Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
 from user_data import add_user, get_user_count, add_start_count, get_unique_start_count
+from metrics import metrics
+from settings import settings
+
+STATS_MESSAGE_LIMIT = 4000
 
 START_MESSAGE = """
 Добро пожаловать в Sintes!
@@ -22,7 +28,13 @@ HELP_MESSAGE = r"""
 • /start \- Перезапуск бота
 • /authorize \- Подключение к Google Calendar
 • /timezone \- Настройка часового пояса
+• /timezone город \- Поиск часового пояса, например /timezone Almaty
 • /edit \- Редактирование события
+• /today\_tasks \- События на сегодня
+• /week \- События на неделю
+• /agenda ДД\.ММ \[ДД\.ММ\] \- События за период
+• /daily \[ЧЧ:ММ\|off\] \- Утренняя сводка событий
+• /remind \[минуты\|off\] \- Напоминания перед событиями
 • /help \- Это руководство
 
 *Как добавить событие:*
@@ -31,10 +43,18 @@ HELP_MESSAGE = r"""
 *Примеры команд:*
 • "Сегодня с 10:00 до 12:00 Встреча"
 • "Завтра с 14:30 до 15:30 Совещание"
+• "Сегодня с 10:00 до 11:00 Встреча, завтра с 14:00 до 15:00 Обед" \- несколько событий сразу
+• "В пятницу с 19:00 до 21:00 Кино", "Через неделю в 10:00 Врач", "12 мая с 10:00 до 11:00 Праздник"
 
 *Редактирование события:*
 • /edit [ID события] [новое название]
 • Пример: /edit abc123 Важное совещание
+• Несколько полей: /edit abc123 название\=Созвон время\=15:00\-16:00 описание\=Ссылка в чате
+• Несколько событий: /edit abc123,def456 время\=15:00\-16:00
+• Все сегодняшние по названию: /edit сегодня:планерка время\=11:00\-11:30
+
+*Часовой пояс:*
+• Отправьте своё местоположение \- пояс определится автоматически
 
 *Советы:*
 • Говорите чётко и разборчиво
@@ -45,17 +65,21 @@ HELP_MESSAGE = r"""
 ❓ Вопросы? Пишите: mamishka79@gmail.com
 """
 
+def record_start(user_id: int, username: str) -> Tuple[int, int]:
+    """Учитывает пользователя и нажатие /start; возвращает оба счётчика."""
+    add_user(user_id, username)
+    add_start_count(user_id)
+    return get_user_count(), get_unique_start_count()
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     username = update.effective_user.username or "Без никнейма"
     
-    add_user(user_id, username)
-    
-    is_new_start = add_start_count(user_id)
-    unique_start_count = get_unique_start_count()
+    # Хранилище может быть сетевым (Postgres), поэтому запросы выполняются вне цикла событий.
+    user_count, unique_start_count = await asyncio.to_thread(record_start, user_id, username)
     
     welcome_message = f"{START_MESSAGE}\n\n" \
-                      f"Количество зарегистрированных пользователей: {get_user_count()}\n" \
+                      f"Количество зарегистрированных пользователей: {user_count}\n" \
                       f"Уникальных пользователей, нажавших /start: {unique_start_count}"
     
     await update.message.reply_text(welcome_message)
@@ -70,4 +94,23 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text(
             text=HELP_MESSAGE.replace('*', '').replace('\\', ''),
             parse_mode=None
-        )
\ No newline at end of file
+        )
+
+def format_stats() -> str:
+    """Задержки по этапам (p50/p99) и текущие значения показателей."""
+    lines = ["📊 Задержки, мс (p50 / p99):"]
+    for name, labels, histogram in metrics.histograms():
+        label = ', '.join(value for _, value in labels) or name
+        p50, p99 = histogram.quantile(0.5), histogram.quantile(0.99)
+        lines.append(f"{name} [{label}]: n={histogram.count}, {p50 * 1000:.0f} / {p99 * 1000:.0f}")
+    gauges = metrics.gauge_values()
+    if gauges:
+        lines.append("\n📈 Показатели:")
+        lines.extend(f"{name}: {value:g}" for name, value in gauges)
+    text = '\n'.join(lines)
+    return text if len(text) <= STATS_MESSAGE_LIMIT else text[:STATS_MESSAGE_LIMIT] + '\n…'
+
+async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id not in settings.admin_ids:
+        return
+    await update.message.reply_text(format_stats())
@@ -0,0 +1,238 @@
+import calendar
+import re
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+RELATIVE_DAYS = {
+    'сегодня': 0,
+    'завтра': 1,
+    'послезавтра': 2,
+}
+
+NUMBER_WORDS = {
+    'один': 1, 'одну': 1, 'одна': 1, 'два': 2, 'две': 2, 'три': 3, 'четыре': 4,
+    'пять': 5, 'шесть': 6, 'семь': 7, 'восемь': 8, 'девять': 9, 'десять': 10,
+}
+
+UNITS = {
+    'день': 'days', 'дня': 'days', 'дней': 'days',
+    'неделю': 'weeks', 'недели': 'weeks', 'недель': 'weeks',
+    'месяц': 'months', 'месяца': 'months', 'месяцев': 'months',
+    'год': 'years', 'года': 'years', 'лет': 'years',
+}
+
+WEEKDAYS = {
+    'понедельник': 0, 'вторник': 1, 'среду': 2, 'среда': 2, 'четверг': 3,
+    'пятницу': 4, 'пятница': 4, 'субботу': 5, 'суббота': 5, 'воскресенье': 6,
+}
+
+NEXT_WORDS = {'следующий', 'следующую', 'следующее', 'следующая'}
+NEXT_WEEK_WORDS = NEXT_WORDS | {'следующей'}
+
+MONTHS = {
+    'января': 1, 'январь': 1, 'февраля': 2, 'февраль': 2, 'марта': 3, 'март': 3,
+    'апреля': 4, 'апрель': 4, 'мая': 5, 'май': 5, 'июня': 6, 'июнь': 6,
+    'июля': 7, 'июль': 7, 'августа': 8, 'август': 8, 'сентября': 9, 'сентябрь': 9,
+    'октября': 10, 'октябрь': 10, 'ноября': 11, 'ноябрь': 11, 'декабря': 12, 'декабрь': 12,
+}
+
+START_WORDS = {'с', 'со', 'от', 'в', 'во'}
+RANGE_WORDS = {'до', 'по'}
+# Часы, которые «дня» и «вечера» переносят на вторую половину суток: «1 дня» — 13:00, а «11 дня» — 11:00.
+AFTERNOON_HOURS = {'дня': range(1, 6), 'вечера': range(1, 12)}
+YEAR_WORDS = {'года', 'год', 'г'}
+DEFAULT_DURATION = timedelta(hours=1)
+
+
+def _alternatives(words) -> str:
+    """Набор слов в виде префиксного дерева: «ма(?:рта?|[йя])» вместо перечисления.
+
+    Ветви дерева различаются первой буквой, и движок отбрасывает неподходящие
+    одной проверкой, а не сравнивает текст с каждым словом по очереди.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        if '' not in node:
+            return body
+        return (body if len(branches) > 1 or len(body) == 1 else f'(?:{body})') + '?'
+
+    return build(trie)
+
+def _clock(n: int) -> str:
+    """Время «10», «10:30» или «10.30»; часы и минуты вне диапазона не совпадают."""
+    return rf"(?P<hour{n}>2[0-3]|[01]?\d)(?:[:.](?P<minute{n}>[0-5]\d)|(?![:.]\d))(?!\d)"
+
+# Промежуток между словами: всё, кроме букв, цифр, тире и разделителей событий.
+# Захватывающий квантификатор не отдаёт символы назад, поэтому длинные
+# промежутки не вызывают перебора.
+GAP = r"[^\w\-–—,;]*+"
+WORD_END = r"(?![^\W\d_])"
+
+# Первые буквы слов, с которых может начинаться дата: остальные позиции
+# отсекаются одной проверкой класса символов, не перебирая ветви шаблона.
+HEAD_FIRST_CHARS = ''.join(sorted({
+    word[0] for word in (*RELATIVE_DAYS, *WEEKDAYS, *NEXT_WORDS, 'пустым', 'через', 'на', 'в')
+}))
+NEXT = _alternatives(NEXT_WORDS)
+
+# «<дата> <время>» целиком вместе с символом перед ним (к тексту слева
+# добавляется пробел). С класса символов движок начинает поиск, пропуская
+# позиции внутри слов без попытки совпадения. Шаблон не содержит вложенных
+# квантификаторов, а соседние части начинаются с непересекающихся классов
+# символов, поэтому попытка с каждой позиции ограничена длиной фразы.
+HEAD_PATTERN = re.compile(
+    rf"\W(?=[{HEAD_FIRST_CHARS}\d])(?:"
+    rf"(?P<relative>{_alternatives(RELATIVE_DAYS)}){WORD_END}"
+    rf"|через{WORD_END}(?:{GAP}(?P<count>\d++|(?:{_alternatives(NUMBER_WORDS)}){WORD_END}))?"
+    rf"{GAP}(?P<unit>{_alternatives(UNITS)}){WORD_END}"
+    rf"|на{WORD_END}{GAP}(?:{_alternatives(NEXT_WEEK_WORDS)}){WORD_END}{GAP}(?P<next_week>неделе){WORD_END}"
+    rf"|во?{WORD_END}{GAP}(?:(?:{NEXT}){WORD_END}(?P<next>){GAP})?(?P<weekday>{_alternatives(WEEKDAYS)}){WORD_END}"
+    rf"|(?:{NEXT}){WORD_END}{GAP}(?P<next_weekday>{_alternatives(WEEKDAYS)}){WORD_END}"
+    rf"|(?P<plain_weekday>{_alternatives(WEEKDAYS)}){WORD_END}"
+    rf"|пустым{GAP}(?P<blank>оставить){WORD_END}"
+    rf"|(?P<day>\d{{1,2}})(?!\d){GAP}(?P<month>{_alternatives(MONTHS)}){WORD_END}"
+    rf"(?:{GAP}(?P<year>\d{{4}})(?!\d)(?:{GAP}(?:{_alternatives(YEAR_WORDS)}){WORD_END})?)?"
+    r")"
+    rf"{GAP}(?:(?:{_alternatives(START_WORDS)}){WORD_END}{GAP})?{_clock(1)}"
+    rf"(?:{GAP}(?:(?:[-–—]|(?:{_alternatives(RANGE_WORDS)}){WORD_END}){GAP})?{_clock(2)})?"
+    rf"(?:{GAP}(?P<period>{_alternatives({*AFTERNOON_HOURS, 'утра'})}){WORD_END})?"
+)
+# Тот же шаблон без групп: им ищутся границы фраз. Без сохранения групп каждая
+# позиция проверяется быстрее, а группы нужны только для фраз, ставших событиями.
+HEAD_SCAN_PATTERN = re.compile(re.sub(r"\(\?P<\w+>\)|\(\?P<\w+>", lambda m: '' if m[0].endswith(')') else '(?:',
+                                      HEAD_PATTERN.pattern))
+
+
+class ParsedEvent(NamedTuple):
+    """Одно событие из сообщения: начало и конец (без часового пояса) и название."""
+    start: datetime
+    end: datetime
+    title: str
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр и «ё» → «е» с сохранением длины, чтобы смещения совпадали с исходным текстом."""
+    lowered = text.lower().replace('ё', 'е')
+    if len(lowered) != len(text):
+        lowered = ''.join(char.lower()[0] for char in text).replace('ё', 'е')
+    return lowered
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    year, month = day.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+DATE_GROUPS = ('relative', 'count', 'unit', 'next_week', 'next', 'weekday', 'next_weekday', 'plain_weekday',
+               'blank', 'day', 'month', 'year')
+
+def head_date(match: re.Match, today: date) -> Optional[date]:
+    """Дата из совпадения HEAD_PATTERN; None, если такого дня нет (31 февраля) или он вне календаря."""
+    (relative, count, unit, next_week, is_next, weekday, next_weekday, plain_weekday, blank,
+     day_number, month, year) = match.group(*DATE_GROUPS)
+
+    if relative is not None:
+        return today + timedelta(days=RELATIVE_DAYS[relative])
+
+    if blank is not None:
+        return today
+
+    if unit is not None:
+        # «через неделю» — через одну; «через 0 дней» — сегодня.
+        count = 1 if count is None else int(count) if count.isdigit() else NUMBER_WORDS[count]
+        unit = UNITS[unit]
+        try:
+            if unit == 'days':
+                return today + timedelta(days=count)
+            if unit == 'weeks':
+                return today + timedelta(weeks=count)
+            return add_months(today, count * (12 if unit == 'years' else 1))
+        except (OverflowError, ValueError):
+            return None
+
+    if next_week is not None:
+        return today + timedelta(weeks=1)
+
+    weekday = weekday or next_weekday or plain_weekday
+    if weekday is not None:
+        days_ahead = (WEEKDAYS[weekday] - today.weekday()) % 7
+        if days_ahead == 0 and (is_next is not None or next_weekday is not None):
+            days_ahead = 7
+        return today + timedelta(days=days_ahead)
+
+    month = MONTHS[month]
+    day_number = int(day_number)
+    explicit_year = year is not None
+    year = int(year) if explicit_year else today.year
+    if year < date.min.year or not 1 <= day_number <= calendar.monthrange(year, month)[1]:
+        return None
+    event_date = date(year, month, day_number)
+    if not explicit_year and event_date < today:
+        if year == date.max.year:
+            return None
+        event_date = date(year + 1, month, min(day_number, calendar.monthrange(year + 1, month)[1]))
+    return event_date
+
+def head_times(match: re.Match) -> Tuple[time, Optional[time]]:
+    """Интервал «с 10:00 до 11:00», «10-11», «10 11», «в 9»: (начало, конец или None)."""
+    hour1, minute1, hour2, minute2, period = match.group('hour1', 'minute1', 'hour2', 'minute2', 'period')
+    # Сдвиг решается для каждого конца отдельно: «с 11 до 1 дня» — 11:00–13:00.
+    afternoon = AFTERNOON_HOURS.get(period, ())
+    start_hour = int(hour1)
+    start_time = time(start_hour + 12 if start_hour in afternoon else start_hour, int(minute1) if minute1 else 0)
+    if hour2 is None:
+        return start_time, None
+    end_hour = int(hour2)
+    return start_time, time(end_hour + 12 if end_hour in afternoon else end_hour, int(minute2) if minute2 else 0)
+
+@lru_cache(maxsize=4096)
+def parse_events(text: str, today: date) -> Tuple[ParsedEvent, ...]:
+    """Находит в тексте все события вида «<дата> <время> <название>».
+
+    Название события — текст до начала следующего события. Даты и время
+    вычисляются только для фраз, у которых есть название. Результат
+    кэшируется по паре (текст, дата).
+    """
+    # Позиции в lowered сдвинуты на пробел относительно text.
+    lowered = ' ' + normalize(text)
+    search = HEAD_SCAN_PATTERN.search
+    spans = []
+    match = search(lowered)
+    while match is not None:
+        head_start, head_end = match.span()
+        # «31 февраля» и «через 99999999999 лет» совпадают с шаблоном, но такого дня нет:
+        # следующее начало может быть внутри. Другие виды дат проверять не нужно.
+        if (lowered[head_start + 1].isdigit() or lowered.startswith('через', head_start + 1)) \
+                and head_date(HEAD_PATTERN.match(lowered, head_start), today) is None:
+            match = search(lowered, head_start + 1)
+            continue
+        spans.append((head_start, head_end))
+        match = search(lowered, head_end)
+
+    events = []
+    for index, (head_start, head_end) in enumerate(spans):
+        title_end = spans[index + 1][0] if index + 1 < len(spans) else len(text)
+        title = text[head_end - 1:title_end].strip(' \t\n,;.-–—')
+        if not title:
+            continue
+        head = HEAD_PATTERN.match(lowered, head_start)
+        event_date = head_date(head, today)
+        start_time, end_time = head_times(head)
+        start = datetime.combine(event_date, start_time)
+        try:
+            end = datetime.combine(event_date, end_time) if end_time is not None else start + DEFAULT_DURATION
+        except OverflowError:
+            # Час после начала не помещается в календарь: «31 декабря 9999 в 23».
+            continue
+        events.append(ParsedEvent(start, end, title))
+    return tuple(events)
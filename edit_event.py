@@ -1,37 +1,149 @@
-from googleapiclient.discovery import build
+import re
+import pytz
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 from telegram import Update
 from telegram.ext import ContextTypes
-from settings import user_credentials
+from profile_store import user_credentials, user_timezones
+from calendar_gateway import calendar_gateway
+from event_cache import event_cache, parse_event_time
+from busy_cache import busy_cache
+from notifications import notification_scheduler
 from logger import logger
 
+FIELD_PATTERN = re.compile(r"(?i)\b(название|время|описание)\s*=\s*")
+TIME_PATTERN = re.compile(r"^(\d{1,2}):(\d{2})\s*(?:-|–|до)\s*(\d{1,2}):(\d{2})$")
+TODAY_PREFIX = 'сегодня:'
+
+FIELD_NAMES = {
+    'название': 'summary',
+    'время': 'time',
+    'описание': 'description',
+}
+
+ERROR_MESSAGES = {
+    'no_target': "❌ Пожалуйста, укажите идентификатор события для редактирования.",
+    'no_details': "❌ Пожалуйста, укажите новые детали события.",
+    'no_auth': "❌ Сначала выполните команду /authorize.",
+    'invalid_time': "❌ Укажите время в формате время=10:00-11:00.",
+    'not_found': "❌ Сегодня нет событий, подходящих под «{}».",
+    'edit_error': "❌ Ошибка при редактировании события.",
+}
+
+
+def parse_command(text: str) -> Tuple[str, Dict[str, str]]:
+    """Разбирает аргументы /edit на цель и изменяемые поля.
+
+    Без полей вида ключ=значение действует старый формат: /edit <id> <новое название>.
+    """
+    markers = list(FIELD_PATTERN.finditer(text))
+    if not markers:
+        target, _, summary = text.partition(' ')
+        return target, {'summary': summary.strip()} if summary.strip() else {}
+
+    changes = {}
+    for index, marker in enumerate(markers):
+        end = markers[index + 1].start() if index + 1 < len(markers) else len(text)
+        changes[FIELD_NAMES[marker.group(1).lower()]] = text[marker.end():end].strip()
+    return text[:markers[0].start()].strip(), changes
+
+def build_patch(changes: Dict[str, str], event: Optional[dict], tz) -> dict:
+    """Минимальное тело events().patch только с изменёнными полями."""
+    body = {key: value for key, value in changes.items() if key != 'time'}
+    if 'time' in changes:
+        match = TIME_PATTERN.match(changes['time'])
+        if not match:
+            raise ValueError(changes['time'])
+        start_hour, start_min, end_hour, end_min = map(int, match.groups())
+        day = parse_event_time(event['start'], tz).astimezone(tz).date()
+        midnight = datetime.combine(day, datetime.min.time())
+        start = tz.localize(midnight + timedelta(hours=start_hour, minutes=start_min))
+        end = tz.localize(midnight + timedelta(hours=end_hour, minutes=end_min))
+        if end <= start:
+            raise ValueError(changes['time'])
+        body['start'] = {'dateTime': start.isoformat(), 'timeZone': tz.zone}
+        body['end'] = {'dateTime': end.isoformat(), 'timeZone': tz.zone}
+        if 'date' in event['start']:
+            # patch сливается с прежним телом: у события на весь день надо явно убрать date.
+            body['start']['date'] = None
+            body['end']['date'] = None
+    return body
+
+async def resolve_targets(user_id: int, credentials, target: str, tz,
+                          need_events: bool) -> List[Tuple[str, Optional[dict]]]:
+    """Список (event_id, событие или None). Событие загружается, только если нужна дата."""
+    if target.lower().startswith(TODAY_PREFIX):
+        query = target[len(TODAY_PREFIX):].strip().lower()
+        today = datetime.now(tz)
+        start_of_day = today.replace(hour=0, minute=0, second=0, microsecond=0)
+        events = await event_cache.get_events(user_id, credentials, start_of_day, start_of_day + timedelta(days=1))
+        return [(event['id'], event) for event in events if query in event.get('summary', '').lower()]
+
+    targets = []
+    for event_id in filter(None, (part.strip() for part in target.split(','))):
+        event = event_cache.find(user_id, event_id)
+        if event is None and need_events:
+            event = await calendar_gateway.get_event(user_id, credentials, event_id)
+        targets.append((event_id, event))
+    return targets
 
 async def edit_event(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     user_id = update.effective_user.id
     if len(context.args) < 1:
-        await update.message.reply_text("❌ Пожалуйста, укажите идентификатор события для редактирования.")
+        await update.message.reply_text(ERROR_MESSAGES['no_target'])
         return
 
-    event_id = context.args[0]
-    new_details = ' '.join(context.args[1:]).strip()
+    target, changes = parse_command(' '.join(context.args).strip())
 
-    if not new_details:
-        await update.message.reply_text("❌ Пожалуйста, укажите новые детали события.")
+    if not target:
+        await update.message.reply_text(ERROR_MESSAGES['no_target'])
+        return
+    if not changes or not all(changes.values()):
+        await update.message.reply_text(ERROR_MESSAGES['no_details'])
         return
 
     credentials = user_credentials.get(user_id)
     if not credentials:
-        await update.message.reply_text("❌ Сначала выполните команду /authorize.")
+        await update.message.reply_text(ERROR_MESSAGES['no_auth'])
         return
 
-    service = build('calendar', 'v3', credentials=credentials)
+    tz = pytz.timezone(user_timezones.get(user_id, 'UTC'))
 
     try:
-        event = service.events().get(calendarId='primary', eventId=event_id).execute()
+        targets = await resolve_targets(user_id, credentials, target, tz, need_events='time' in changes)
+        if not targets:
+            if target.lower().startswith(TODAY_PREFIX):
+                await update.message.reply_text(ERROR_MESSAGES['not_found'].format(target[len(TODAY_PREFIX):].strip()))
+            else:
+                await update.message.reply_text(ERROR_MESSAGES['no_target'])
+            return
+
+        try:
+            patches = [(event_id, build_patch(changes, event, tz)) for event_id, event in targets]
+        except ValueError:
+            await update.message.reply_text(ERROR_MESSAGES['invalid_time'])
+            return
 
-        event['summary'] = new_details
+        if len(patches) == 1:
+            event_id, body = patches[0]
+            results = [await calendar_gateway.patch_event(user_id, credentials, event_id, body)]
+        else:
+            results = await calendar_gateway.patch_events(user_id, credentials, patches)
 
-        updated_event = service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
-        await update.message.reply_text(f'✅ Событие обновлено: {updated_event.get("htmlLink")}')
+        lines = []
+        for (event_id, old_event), result in zip(targets, results):
+            if isinstance(result, Exception):
+                lines.append(f'❌ {event_id}: не удалось обновить')
+                logger.error("Ошибка при редактировании события %s: %s", event_id, result)
+            else:
+                event_cache.apply_local(user_id, result)
+                if 'time' in changes:
+                    busy_cache.move(user_id, old_event, result)
+                lines.append(f'✅ Событие обновлено: {result.get("htmlLink")}')
+        if not all(isinstance(result, Exception) for result in results):
+            # Напоминания об изменённых событиях рассчитаны по прежним времени и названию.
+            notification_scheduler.refresh_reminders(user_id)
+        await update.message.reply_text('\n'.join(lines))
     except Exception as e:
-        await update.message.reply_text("❌ Ошибка при редактировании события.")
-        logger.error(f"Ошибка при редактировании события: {e}")
\ No newline at end of file
+        await update.message.reply_text(ERROR_MESSAGES['edit_error'])
+        logger.error("Ошибка при редактировании события: %s", e)
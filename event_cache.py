@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, tzinfo
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from googleapiclient.errors import HttpError
+from cache import LRUCache
+from calendar_gateway import calendar_gateway
+from settings import settings
+from logger import logger
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+SYNC_TOKEN_EXPIRED = 410
+
+
+def parse_event_time(value: dict, tz: tzinfo) -> datetime:
+    """Время начала/окончания события; для событий на весь день — полночь в tz."""
+    if 'dateTime' in value:
+        return datetime.fromisoformat(value['dateTime'])
+    day = datetime.fromisoformat(value['date'])
+    return tz.localize(day) if hasattr(tz, 'localize') else day.replace(tzinfo=tz)
+
+
+@dataclass
+class CachedCalendar:
+    window_start: datetime
+    window_end: datetime
+    sync_token: Optional[str] = None
+    synced_at: float = field(default_factory=time.monotonic)
+    events: Dict[str, dict] = field(default_factory=dict)
+
+
+class EventCache:
+    """Кэш событий основного календаря пользователя с инкрементальной синхронизацией.
+
+    Первая выборка берёт окно вокруг текущей даты и получает nextSyncToken,
+    дальше запрашиваются только изменения. По истечении TTL, при выходе
+    запроса за окно или ответе 410 выполняется полная синхронизация.
+    syncToken возвращает изменения всего календаря, поэтому события вне
+    окна при применении изменений отбрасываются.
+    """
+
+    def __init__(self, max_users: int, ttl: float, window_days: int):
+        self.ttl = ttl
+        self.window_days = window_days
+        self._calendars = LRUCache(max_users)
+
+    async def get_events(self, user_id: int, credentials: Credentials,
+                         time_min: datetime, time_max: datetime) -> List[dict]:
+        calendar = self._calendars.get(user_id)
+        if (calendar is None or time.monotonic() - calendar.synced_at > self.ttl
+                or time_min < calendar.window_start or time_max > calendar.window_end):
+            calendar = await self._full_sync(user_id, credentials, time_min)
+        else:
+            try:
+                await self._delta_sync(user_id, credentials, calendar)
+            except HttpError as e:
+                if e.resp.status != SYNC_TOKEN_EXPIRED:
+                    raise
+                logger.info("syncToken пользователя %s устарел, полная синхронизация", user_id)
+                calendar = await self._full_sync(user_id, credentials, time_min)
+
+        tz = time_min.tzinfo
+        selected = []
+        for event in calendar.events.values():
+            start = parse_event_time(event['start'], tz)
+            end = parse_event_time(event['end'], tz)
+            if start < time_max and end > time_min:
+                selected.append((start, event))
+        selected.sort(key=lambda item: item[0])
+        return [event for _, event in selected]
+
+    async def _list_all(self, user_id: int, credentials: Credentials, **params) -> Tuple[List[dict], Optional[str]]:
+        items = []
+        page_token = None
+        while True:
+            result = await calendar_gateway.list_events(
+                user_id, credentials, singleEvents=True, pageToken=page_token, **params)
+            items.extend(result.get('items', []))
+            page_token = result.get('nextPageToken')
+            if not page_token:
+                return items, result.get('nextSyncToken')
+
+    async def _full_sync(self, user_id: int, credentials: Credentials, time_min: datetime) -> CachedCalendar:
+        day_start = time_min.replace(hour=0, minute=0, second=0, microsecond=0)
+        calendar = CachedCalendar(day_start, day_start + timedelta(days=self.window_days))
+        items, calendar.sync_token = await self._list_all(
+            user_id, credentials,
+            timeMin=calendar.window_start.isoformat(),
+            timeMax=calendar.window_end.isoformat(),
+        )
+        calendar.events = {event['id']: event for event in items if event.get('status') != 'cancelled'}
+        self._calendars.set(user_id, calendar)
+        return calendar
+
+    async def _delta_sync(self, user_id: int, credentials: Credentials, calendar: CachedCalendar) -> None:
+        if not calendar.sync_token:
+            return
+        items, sync_token = await self._list_all(user_id, credentials, syncToken=calendar.sync_token)
+        for event in items:
+            self._apply(calendar, event)
+        calendar.sync_token = sync_token or calendar.sync_token
+
+    @staticmethod
+    def _apply(calendar: CachedCalendar, event: dict) -> None:
+        if event.get('status') == 'cancelled':
+            calendar.events.pop(event['id'], None)
+            return
+        tz = calendar.window_start.tzinfo
+        if (parse_event_time(event['start'], tz) < calendar.window_end
+                and parse_event_time(event['end'], tz) > calendar.window_start):
+            calendar.events[event['id']] = event
+        else:
+            # Событие создано или перенесено за пределы окна.
+            calendar.events.pop(event['id'], None)
+
+    def apply_local(self, user_id: int, event: dict) -> None:
+        """Учитывает событие, записанное самим ботом, без запроса к API."""
+        calendar = self._calendars.get(user_id)
+        if calendar is not None and 'start' in event:
+            self._apply(calendar, event)
+
+    def find(self, user_id: int, event_id: str) -> Optional[dict]:
+        calendar = self._calendars.get(user_id)
+        return calendar.events.get(event_id) if calendar is not None else None
+
+    def invalidate(self, user_id: int) -> None:
+        self._calendars.pop(user_id)
+
+
+event_cache = EventCache(settings.event_cache_size, settings.event_cache_ttl, settings.event_cache_window_days)
@@ -1,25 +1,145 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
 import os
+import queue
+import random
+import re
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional
+from settings import settings
 
-def setup_logger(name, log_file, level=logging.INFO):
-    """Function to setup as many loggers as you want"""
+# Значения, которые не должны попадать в логи: OAuth-коды и токены Google,
+# токен Telegram-бота, заголовки авторизации и секреты в параметрах.
+REDACTED = '***'
+REDACTION_PATTERNS = [
+    (re.compile(r"\b4/[0-9A-Za-z_-]{10,}"), REDACTED),
+    (re.compile(r"\bya29\.[0-9A-Za-z_.-]+"), REDACTED),
+    (re.compile(r"\b1//[0-9A-Za-z_-]{10,}"), REDACTED),
+    (re.compile(r"\b\d{6,}:[0-9A-Za-z_-]{30,}"), REDACTED),
+    (re.compile(r"(?i)\b(bearer\s+)[0-9A-Za-z_.~+/-]+=*"), r"\1" + REDACTED),
+    (re.compile(r"(?i)\b((?:code|access_token|refresh_token|client_secret|secret_token)"
+                r"(?:=|['\"]?\s*:\s*['\"]?))[^&\s'\",}]+"), r"\1" + REDACTED),
+]
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
 
-    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    
-    os.makedirs('logs', exist_ok=True)
-    
-    handler = RotatingFileHandler(f'logs/{log_file}', maxBytes=1024*1024, backupCount=5)
-    handler.setFormatter(formatter)
 
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
+def redact(text: str) -> str:
+    for pattern, replacement in REDACTION_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись; поля из extra= попадают в запись как есть."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': redact(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = redact(self.formatException(record.exc_info))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю записей каждого уровня; WARNING и выше не отбрасываются."""
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class LazyQueueHandler(QueueHandler):
+    """Кладёт запись в очередь без форматирования: сообщение собирается в потоке слушателя.
+
+    Переполненная очередь не блокирует цикл событий — запись отбрасывается
+    и учитывается в счётчике dropped.
+    """
 
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value: str) -> Dict[int, float]:
+    """Доли записей по уровням из строки вида DEBUG=0.1,INFO=0.5."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        level, _, rate = item.partition('=')
+        rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+_listener: Optional[QueueListener] = None
+
+def configure_logging() -> None:
+    """Настраивает корневой логгер один раз: очередь в вызывающем потоке, запись в файл и консоль — в фоне."""
+    global _listener
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if settings.log_format == 'json' else TextFormatter(
+        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    os.makedirs(settings.log_dir, exist_ok=True)
+    # RotatingFileHandler не рассчитан на запись из нескольких процессов: у каждого обработчика свой файл.
+    file_handler = RotatingFileHandler(settings.worker_file(os.path.join(settings.log_dir, 'main.log')),
+                                       maxBytes=1024*1024, backupCount=5, encoding='utf-8')
+    file_handler.setFormatter(formatter)
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
 
+    queue_handler = LazyQueueHandler(queue.Queue(settings.log_queue_size))
+    queue_handler.addFilter(SamplingFilter(parse_sample_rates(settings.log_sample_rates)))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(settings.log_level)
+    # httpx пишет INFO на каждый запрос getUpdates и к Bot API.
+    logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = QueueListener(queue_handler.queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+def stop_logging() -> None:
+    """Дописывает оставшиеся в очереди записи и останавливает фоновый поток."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def setup_logger(name, log_file=None, level=None):
+    """Логгер с общей неблокирующей конфигурацией; log_file оставлен для совместимости."""
+    configure_logging()
+    logger = logging.getLogger(name)
+    if level is not None:
+        logger.setLevel(level)
     return logger
 
-logger = setup_logger('main', 'main.log')
\ No newline at end of file
+logger = setup_logger('main', 'main.log')
@@ -0,0 +1,222 @@
+import asyncio
+import bisect
+import functools
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from logger import logger
+
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + '}'
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин, как в Prometheus."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Оценка квантиля линейной интерполяцией внутри корзины."""
+        with self._lock:
+            counts, total = list(self.counts), self.count
+        if not total:
+            return None
+        rank = q * total
+        cumulative = 0
+        for index, count in enumerate(counts):
+            if cumulative + count >= rank and count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                if index == len(self.buckets):
+                    return lower
+                return lower + (self.buckets[index] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """Счётчики, гистограммы и вычисляемые показатели с выгрузкой в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families: Dict[str, Tuple[str, str, Dict[Labels, object]]] = {}
+        self._gauges: Dict[str, Tuple[str, Callable[[], float]]] = {}
+
+    def _child(self, kind: str, name: str, description: str, labels: Dict[str, object], factory: Callable):
+        key = _labels(labels)
+        with self._lock:
+            family = self._families.setdefault(name, (kind, description, {}))
+            children = family[2]
+            child = children.get(key)
+            if child is None:
+                child = children[key] = factory()
+            return child
+
+    def counter(self, name: str, description: str = '', **labels) -> Counter:
+        return self._child('counter', name, description, labels, Counter)
+
+    def histogram(self, name: str, description: str = '', buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                  **labels) -> Histogram:
+        return self._child('histogram', name, description, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name: str, func: Callable[[], float], description: str = '') -> None:
+        """Показатель, который вычисляется в момент выгрузки (например, глубина очереди)."""
+        self._gauges[name] = (description, func)
+
+    def timer(self, name: str, **labels) -> 'Timer':
+        return Timer(self, name, labels)
+
+    def gauge_values(self) -> List[Tuple[str, float]]:
+        values = []
+        for name, (_, func) in list(self._gauges.items()):
+            try:
+                values.append((name, float(func())))
+            except Exception as e:
+                logger.warning("Не удалось вычислить показатель %s: %s", name, e)
+        return values
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            families = [(name, kind, description, list(children.items()))
+                        for name, (kind, description, children) in self._families.items()]
+        for name, kind, description, children in sorted(families):
+            if description:
+                lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, child in children:
+                if kind == 'counter':
+                    lines.append(f'{name}{_format_labels(labels)} {child.value}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float('inf'),), child.counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else repr(float(bound))
+                    lines.append(f'{name}_bucket{_format_labels(labels, ("le", le))} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {child.sum}')
+                lines.append(f'{name}_count{_format_labels(labels)} {child.count}')
+        for name, value in self.gauge_values():
+            description = self._gauges[name][0]
+            if description:
+                lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def histograms(self) -> List[Tuple[str, Labels, Histogram]]:
+        with self._lock:
+            return sorted(
+                ((name, labels, child)
+                 for name, (kind, _, children) in self._families.items() if kind == 'histogram'
+                 for labels, child in children.items()),
+                key=lambda item: (item[0], item[1]),
+            )
+
+
+class Timer:
+    """Замер длительности в гистограмму name; работает как контекстный менеджер и как декоратор.
+
+    При исключении дополнительно увеличивает счётчик <name без _seconds>_errors_total.
+    """
+
+    def __init__(self, registry: MetricsRegistry, name: str, labels: Dict[str, object]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self._started = 0.0
+
+    def __enter__(self) -> 'Timer':
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.registry.histogram(self.name, **self.labels).observe(time.perf_counter() - self._started)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.registry.counter(f"{self.name.removesuffix('_seconds')}_errors_total", **self.labels).inc()
+
+    def __call__(self, func: Callable) -> Callable:
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with Timer(self.registry, self.name, self.labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Timer(self.registry, self.name, self.labels):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+metrics = MetricsRegistry()
+
+def timer(name: str, **labels) -> Timer:
+    return metrics.timer(name, **labels)
+
+def observe(name: str, value: float, **labels) -> None:
+    metrics.histogram(name, **labels).observe(value)
+
+def count(name: str, amount: float = 1, **labels) -> None:
+    metrics.counter(name, **labels).inc(amount)
+
+
+async def _handle_metrics_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+            pass
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', metrics.render().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'not found\n'
+        writer.write(
+            f'HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def start_metrics_server(host: str, port: int) -> Optional[asyncio.AbstractServer]:
+    """HTTP-эндпоинт /metrics для Prometheus; port=0 отключает его."""
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_metrics_request, host, port)
+    logger.info("Метрики доступны на http://%s:%s/metrics", host, port)
+    return server
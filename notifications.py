@@ -0,0 +1,485 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+import pytz
+from telegram import Bot, Update
+from telegram.error import Forbidden, RetryAfter
+from telegram.ext import ContextTypes
+from profile_store import profile_store, user_credentials, user_timezones
+from agenda import fetch_agenda, render_agenda, is_all_day
+from rate_limiter import TokenBucket
+import worker_pool
+from metrics import metrics, count, observe
+from settings import settings
+from logger import logger
+
+AGENDA = 'agenda'
+SCAN = 'scan'
+REMIND = 'remind'
+
+AGENDA_PREFERENCE = 'daily_agenda'
+REMINDER_PREFERENCE = 'reminder_minutes'
+
+# Шаг, с которым разносятся по времени выборки событий для напоминаний разных пользователей.
+SCAN_PHASE_STEP = 60
+IDLE_WAKEUP = 60
+SEND_ATTEMPTS = 3
+OFF_ARGUMENTS = {'off', 'выкл', 'нет'}
+
+MESSAGES = {
+    'no_auth': "❌ Сначала выполните команду /authorize.",
+    'agenda_on': "☀️ Каждый день в {} вы будете получать список событий на день.",
+    'agenda_off': "Утренняя сводка отключена.",
+    'agenda_invalid': "❌ Укажите время в формате /daily ЧЧ:ММ или /daily off.",
+    'remind_on': "⏰ Напоминания включены: за {} мин. до начала события.",
+    'remind_off': "Напоминания отключены.",
+    'remind_invalid': "❌ Укажите число минут от 1 до 1440 или /remind off.",
+    'agenda_header': "☀️ Доброе утро! События на сегодня:\n",
+    'agenda_empty': "☀️ Доброе утро! На сегодня событий нет.",
+    'reminder': "⏰ Через {minutes} мин.: {summary} ({time})",
+}
+
+
+@dataclass
+class Job:
+    kind: str
+    user_id: int
+    send_at: float
+    # Выборка покрывает напоминания из [send_at, until); у напоминания вместо интервала — событие.
+    until: float = 0.0
+    event: Optional[Tuple[str, str, str]] = None
+    # Для регулярной выборки: начало интервала до этого момента уже просматривалось прошлой выборкой.
+    seen_until: float = 0.0
+    cancelled: bool = False
+
+    @property
+    def key(self) -> Tuple[str, int, str]:
+        return self.kind, self.user_id, self.event[0] if self.event else ''
+
+
+class NotificationScheduler:
+    """Утренние сводки и напоминания о событиях для всех пользователей из одной min-кучи.
+
+    В куче лежат задания трёх видов: сводка (раз в день в выбранное
+    пользователем местное время), выборка событий для напоминаний (раз в
+    scan_interval, со сдвигом по user_id, чтобы выборки не сходились в одну
+    секунду) и отправка конкретного напоминания. Задания, которые требуют
+    запроса к календарю, извлекаются за prefetch секунд до отправки;
+    все задания одного извлечения обрабатываются пачкой: для пользователя
+    выполняется один запрос, покрывающий и сводку, и напоминания, а число
+    одновременных запросов ограничено. Сводка ждёт времени отправки в
+    отдельной задаче и не задерживает выборки. Исходящие сообщения проходят
+    через ведро токенов, чтобы не упереться в лимиты Bot API.
+
+    Каждая выборка заново покрывает остаток уже просмотренного окна, а
+    напоминания о пропавших из него событиях отменяет. После изменений,
+    сделанных ботом, refresh_reminders сразу перевыбирает всё окно.
+    Заменённые и отменённые задания не удаляются из кучи, а пропускаются.
+    Сводка и выборка остаются зарегистрированными до конца обработки,
+    поэтому /daily, /remind и refresh_reminders в это время заменяют их,
+    а не добавляют вторые.
+    """
+
+    def __init__(self, scan_interval: float, prefetch: float, fetch_concurrency: int,
+                 send_rate: float, send_burst: float):
+        self.scan_interval = scan_interval
+        self.prefetch = prefetch
+        self.fetch_concurrency = fetch_concurrency
+        self.send_bucket = TokenBucket(send_rate, send_burst)
+        self._send_lock: Optional[asyncio.Lock] = None
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._jobs: Dict[Tuple[str, int, str], Job] = {}
+        # Ключи запланированных напоминаний пользователя и интервал, по которому они рассчитаны.
+        self._reminders: Dict[int, Set[Tuple[str, int, str]]] = defaultdict(set)
+        self._leads: Dict[int, int] = {}
+        # Конец окна, уже взятого в выборку: до него напоминания рассчитаны.
+        self._horizons: Dict[int, float] = {}
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self.bot: Optional[Bot] = None
+
+    def _push(self, job: Job, fire_at: float) -> None:
+        previous = self._jobs.get(job.key)
+        if previous is not None:
+            previous.cancelled = True
+        self._jobs[job.key] = job
+        if job.kind == REMIND:
+            self._reminders[job.user_id].add(job.key)
+        heapq.heappush(self._heap, (fire_at, next(self._sequence), job))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def cancel(self, kind: str, user_id: int) -> None:
+        job = self._jobs.pop((kind, user_id, ''), None)
+        if job is not None:
+            job.cancelled = True
+
+    def cancel_reminders(self, user_id: int) -> None:
+        """Отменяет запланированные напоминания пользователя и его выборку событий."""
+        for key in self._reminders.pop(user_id, ()):
+            job = self._jobs.pop(key, None)
+            if job is not None:
+                job.cancelled = True
+        self.cancel(SCAN, user_id)
+
+    def refresh_reminders(self, user_id: int) -> None:
+        """Перевыбирает напоминания сразу, например после добавления или изменения события ботом."""
+        if user_id not in self._leads:
+            return
+        self.cancel_reminders(user_id)
+        self.configure_user(user_id)
+
+    @staticmethod
+    def user_tz(user_id: int):
+        return pytz.timezone(user_timezones.get(user_id, 'UTC'))
+
+    def next_agenda_time(self, user_id: int, now: float) -> Optional[float]:
+        """Ближайший момент отправки сводки в местном времени пользователя, не раньше чем через prefetch."""
+        value = profile_store.get_preference(user_id, AGENDA_PREFERENCE)
+        if value is None:
+            return None
+        tz = self.user_tz(user_id)
+        send_time = datetime.strptime(value, '%H:%M').time()
+        day = datetime.fromtimestamp(now, tz).date()
+        while True:
+            # normalize переносит несуществующее время (переход на летнее) на час вперёд.
+            send_at = tz.normalize(tz.localize(datetime.combine(day, send_time))).timestamp()
+            if send_at - self.prefetch > now:
+                return send_at
+            day += timedelta(days=1)
+
+    def next_scan_boundary(self, user_id: int, now: float) -> float:
+        phases = max(1, int(self.scan_interval // SCAN_PHASE_STEP))
+        phase = (user_id % phases) * SCAN_PHASE_STEP
+        return ((now - phase) // self.scan_interval + 1) * self.scan_interval + phase
+
+    def configure_user(self, user_id: int) -> None:
+        """Перестраивает задания пользователя по его настройкам и часовому поясу."""
+        now = time.time()
+        # Сводка, уже ждущая отправки после выборки, остаётся, если время отправки не изменилось.
+        send_at = self.next_agenda_time(user_id, now - self.prefetch)
+        current = self._jobs.get((AGENDA, user_id, ''))
+        if send_at is None:
+            self.cancel(AGENDA, user_id)
+        elif current is None or current.send_at != send_at:
+            self._push(Job(AGENDA, user_id, send_at), send_at - self.prefetch)
+
+        minutes = profile_store.get_preference(user_id, REMINDER_PREFERENCE)
+        if self._leads.get(user_id) != minutes:
+            # Напоминания, рассчитанные по прежнему интервалу, перевыбираются.
+            self.cancel_reminders(user_id)
+            if minutes is None:
+                self._leads.pop(user_id, None)
+            else:
+                self._leads[user_id] = minutes
+        if minutes is None:
+            self.cancel(SCAN, user_id)
+            self._horizons.pop(user_id, None)
+        elif (SCAN, user_id, '') not in self._jobs:
+            # Внеочередная выборка покрывает всё уже просмотренное окно, но не меньше чем до регулярной границы.
+            until = max(self._horizons.get(user_id, now), self.next_scan_boundary(user_id, now))
+            self._push(Job(SCAN, user_id, now, until=until), now)
+
+    def load_all(self) -> None:
+        user_ids = (profile_store.users_with_preference(AGENDA_PREFERENCE)
+                    | profile_store.users_with_preference(REMINDER_PREFERENCE))
+        for user_id in user_ids:
+            if worker_pool.owns_user(user_id):
+                self.configure_user(user_id)
+
+    def _pop_due(self, now: float) -> List[Job]:
+        jobs = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, job = heapq.heappop(self._heap)
+            if job.cancelled:
+                continue
+            # Сводка и выборка снимаются с учёта в _reschedule, после обработки.
+            if job.kind == SCAN:
+                self._horizons[job.user_id] = max(self._horizons.get(job.user_id, 0.0), job.until)
+            elif job.kind == REMIND and self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+                self._discard_reminder(job)
+            jobs.append(job)
+        return jobs
+
+    def _discard_reminder(self, job: Job) -> None:
+        keys = self._reminders.get(job.user_id)
+        if keys is not None:
+            keys.discard(job.key)
+            if not keys:
+                del self._reminders[job.user_id]
+
+    def _next_delay(self) -> float:
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return IDLE_WAKEUP
+        return max(0.0, min(IDLE_WAKEUP, self._heap[0][0] - time.time()))
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self) -> None:
+        self._wakeup = asyncio.Event()
+        self._send_lock = asyncio.Lock()
+        while True:
+            self._wakeup.clear()
+            jobs = self._pop_due(time.time())
+            if jobs:
+                self._spawn(self._process(jobs))
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self._next_delay())
+            except asyncio.TimeoutError:
+                pass
+
+    async def _process(self, jobs: List[Job]) -> None:
+        by_user: Dict[int, List[Job]] = defaultdict(list)
+        reminders = []
+        for job in jobs:
+            if job.kind == REMIND:
+                reminders.append(job)
+            else:
+                by_user[job.user_id].append(job)
+
+        semaphore = asyncio.Semaphore(self.fetch_concurrency)
+
+        async def process_user(user_id: int, user_jobs: List[Job]) -> None:
+            async with semaphore:
+                events = await self._fetch(user_id, user_jobs)
+            for job in user_jobs:
+                if job.kind == AGENDA:
+                    self._spawn(self._deliver_agenda(job, events))
+                    continue
+                try:
+                    self._schedule_reminders(job, events)
+                except Exception as e:
+                    logger.error("Ошибка задания %s пользователя %s: %s", job.kind, user_id, e)
+                finally:
+                    self._reschedule(job)
+
+        await asyncio.gather(
+            *(process_user(user_id, user_jobs) for user_id, user_jobs in by_user.items()),
+            *(self._send_reminder(job) for job in reminders),
+        )
+
+    def _windows(self, job: Job, tz) -> Tuple[datetime, datetime]:
+        if job.kind == AGENDA:
+            day = datetime.fromtimestamp(job.send_at, tz).date()
+            start = tz.localize(datetime.combine(day, datetime.min.time()))
+            return start, tz.localize(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+        lead = self.reminder_lead(job.user_id)
+        return (datetime.fromtimestamp(job.send_at + lead, tz), datetime.fromtimestamp(job.until + lead, tz))
+
+    @staticmethod
+    def reminder_lead(user_id: int) -> float:
+        return 60 * (profile_store.get_preference(user_id, REMINDER_PREFERENCE) or 0)
+
+    async def _fetch(self, user_id: int, jobs: List[Job]) -> Optional[List[tuple]]:
+        """Один запрос событий на пользователя, покрывающий окна всех его заданий в пачке."""
+        credentials = user_credentials.get(user_id)
+        if credentials is None:
+            return None
+        tz = self.user_tz(user_id)
+        windows = [self._windows(job, tz) for job in jobs]
+        try:
+            return await fetch_agenda(user_id, credentials, min(start for start, _ in windows),
+                                      max(end for _, end in windows), tz)
+        except Exception as e:
+            logger.error("Ошибка при получении событий для уведомлений пользователя %s: %s", user_id, e)
+            return None
+
+    def _reschedule(self, job: Job) -> None:
+        if job.kind == AGENDA:
+            # Заменённую или отменённую за время ожидания сводку уже перепланировал configure_user.
+            if self._jobs.get(job.key) is not job:
+                return
+            del self._jobs[job.key]
+            send_at = self.next_agenda_time(job.user_id, max(time.time(), job.send_at))
+            if send_at is not None:
+                self._push(Job(AGENDA, job.user_id, send_at), send_at - self.prefetch)
+        elif job.kind == SCAN:
+            # Отменённую выборку уже заменила внеочередная из configure_user.
+            if self._jobs.get(job.key) is not job:
+                return
+            del self._jobs[job.key]
+            if profile_store.get_preference(job.user_id, REMINDER_PREFERENCE) is not None:
+                # Следующая выборка начинается с момента извлечения и заново покрывает остаток окна.
+                send_at = job.until - self.prefetch
+                self._push(Job(SCAN, job.user_id, send_at, until=job.until + self.scan_interval, seen_until=job.until),
+                           send_at)
+
+    def _schedule_reminders(self, job: Job, events: Optional[List[tuple]]) -> None:
+        """Напоминания о событиях, время напоминания которых попадает в [send_at, until).
+
+        Напоминания из этого интервала, событий которых в выборке больше нет
+        (удалены или перенесены), отменяются.
+        """
+        if job.cancelled or events is None:
+            return
+        tz = self.user_tz(job.user_id)
+        lead = self.reminder_lead(job.user_id)
+        now = time.time()
+        scheduled = set()
+        for start, end, summary, calendar_name in events:
+            remind_at = start.timestamp() - lead
+            if is_all_day(start, end, tz) or not job.send_at <= remind_at < job.until:
+                continue
+            event_id = f"{calendar_name}|{start.isoformat()}|{summary}"
+            local_start = start.astimezone(tz).strftime('%H:%M')
+            reminder = Job(REMIND, job.user_id, remind_at, event=(event_id, summary, local_start))
+            scheduled.add(reminder.key)
+            current = self._jobs.get(reminder.key)
+            # Прошедшее напоминание из уже просмотренной части интервала отправлено прошлой выборкой.
+            if (current is not None and current.send_at == remind_at) or remind_at < min(now, job.seen_until):
+                continue
+            self._push(reminder, max(remind_at, now))
+        for key in list(self._reminders.get(job.user_id, ())):
+            reminder = self._jobs.get(key)
+            if key not in scheduled and reminder is not None and job.send_at <= reminder.send_at < job.until:
+                del self._jobs[key]
+                reminder.cancelled = True
+                self._discard_reminder(reminder)
+
+    async def _deliver_agenda(self, job: Job, events: Optional[List[tuple]]) -> None:
+        try:
+            await self._send_agenda(job, events)
+        except Exception as e:
+            logger.error("Ошибка задания %s пользователя %s: %s", job.kind, job.user_id, e)
+        finally:
+            self._reschedule(job)
+
+    async def _send_agenda(self, job: Job, events: Optional[List[tuple]]) -> None:
+        if events is None:
+            return
+        tz = self.user_tz(job.user_id)
+        day_start, day_end = self._windows(job, tz)
+        events = [event for event in events if event[0] < day_end and event[1] > day_start]
+        await asyncio.sleep(max(0.0, job.send_at - time.time()))
+        if job.cancelled:
+            return
+        if events:
+            pages = render_agenda(events, tz)
+            pages[0] = MESSAGES['agenda_header'] + pages[0]
+        else:
+            pages = [MESSAGES['agenda_empty']]
+        for page in pages:
+            if not await self.send(job.user_id, page):
+                return
+        observe('notification_lag_seconds', time.time() - job.send_at, kind=AGENDA)
+
+    async def _send_reminder(self, job: Job) -> None:
+        minutes = profile_store.get_preference(job.user_id, REMINDER_PREFERENCE)
+        if minutes is None:
+            return
+        _, summary, local_start = job.event
+        if await self.send(job.user_id, MESSAGES['reminder'].format(minutes=minutes, summary=summary,
+                                                                    time=local_start)):
+            observe('notification_lag_seconds', time.time() - job.send_at, kind=REMIND)
+
+    async def send(self, user_id: int, text: str) -> bool:
+        """Отправка с общим ограничением скорости; пользователь, заблокировавший бота, отписывается.
+
+        После RetryAfter отправка повторяется не более SEND_ATTEMPTS раз.
+        """
+        for attempt in range(1, SEND_ATTEMPTS + 1):
+            async with self._send_lock:
+                delay = self.send_bucket.wait_time()
+                if delay:
+                    await asyncio.sleep(delay)
+                self.send_bucket.consume()
+            try:
+                await self.bot.send_message(chat_id=user_id, text=text)
+            except RetryAfter as e:
+                if attempt == SEND_ATTEMPTS:
+                    logger.warning("Уведомление пользователю %s не отправлено: %d раз получен RetryAfter",
+                                   user_id, attempt)
+                    return False
+                retry_after = e.retry_after
+                await asyncio.sleep(retry_after.total_seconds() if isinstance(retry_after, timedelta) else retry_after)
+                continue
+            except Forbidden:
+                logger.info("Пользователь %s заблокировал бота, уведомления отключены", user_id)
+                self.disable(user_id)
+                return False
+            except Exception as e:
+                logger.error("Ошибка при отправке уведомления пользователю %s: %s", user_id, e)
+                return False
+            count('notifications_sent_total')
+            return True
+        return False
+
+    def disable(self, user_id: int) -> None:
+        profile_store.set_preference(user_id, AGENDA_PREFERENCE, None)
+        profile_store.set_preference(user_id, REMINDER_PREFERENCE, None)
+        self.configure_user(user_id)
+
+    def stats(self) -> dict:
+        return {'jobs': len(self._jobs), 'heap': len(self._heap), 'batches': len(self._tasks)}
+
+
+notification_scheduler = NotificationScheduler(
+    settings.notify_scan_interval, settings.notify_prefetch, settings.notify_fetch_concurrency,
+    settings.notify_send_rate, settings.notify_send_burst,
+)
+metrics.gauge('notification_jobs', lambda: notification_scheduler.stats()['jobs'],
+              'Запланированные сводки, выборки и напоминания')
+
+async def start_notification_scheduler(bot: Bot) -> asyncio.Task:
+    notification_scheduler.bot = bot
+    # Лимит Bot API общий для всех процессов-обработчиков, поэтому делится между ними.
+    workers = worker_pool.worker_count
+    notification_scheduler.send_bucket = TokenBucket(settings.notify_send_rate / workers,
+                                                     settings.notify_send_burst / workers)
+    notification_scheduler.load_all()
+    return asyncio.create_task(notification_scheduler.run())
+
+
+async def daily_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/daily [ЧЧ:ММ|off] — утренняя сводка событий в местное время."""
+    user_id = update.effective_user.id
+    if user_id not in user_credentials:
+        await update.message.reply_text(MESSAGES['no_auth'])
+        return
+
+    argument = context.args[0].lower() if context.args else settings.notify_agenda_time
+    if argument in OFF_ARGUMENTS:
+        profile_store.set_preference(user_id, AGENDA_PREFERENCE, None)
+        notification_scheduler.configure_user(user_id)
+        await update.message.reply_text(MESSAGES['agenda_off'])
+        return
+    try:
+        value = datetime.strptime(argument, '%H:%M').strftime('%H:%M')
+    except ValueError:
+        await update.message.reply_text(MESSAGES['agenda_invalid'])
+        return
+    profile_store.set_preference(user_id, AGENDA_PREFERENCE, value)
+    notification_scheduler.configure_user(user_id)
+    await update.message.reply_text(MESSAGES['agenda_on'].format(value))
+
+async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/remind [минуты|off] — напоминания перед началом событий."""
+    user_id = update.effective_user.id
+    if user_id not in user_credentials:
+        await update.message.reply_text(MESSAGES['no_auth'])
+        return
+
+    argument = context.args[0].lower() if context.args else str(settings.notify_reminder_minutes)
+    if argument in OFF_ARGUMENTS:
+        profile_store.set_preference(user_id, REMINDER_PREFERENCE, None)
+        notification_scheduler.configure_user(user_id)
+        await update.message.reply_text(MESSAGES['remind_off'])
+        return
+    if not argument.isdigit() or not 1 <= int(argument) <= 1440:
+        await update.message.reply_text(MESSAGES['remind_invalid'])
+        return
+    profile_store.set_preference(user_id, REMINDER_PREFERENCE, int(argument))
+    notification_scheduler.configure_user(user_id)
+    await update.message.reply_text(MESSAGES['remind_on'].format(argument))
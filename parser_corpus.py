@@ -0,0 +1,97 @@
+"""Корпус фраз для проверки date_parser.parse_events.
+
+Каждая запись: (фраза, ожидаемые события). Событие — (начало, конец, название)
+в ISO-формате без часового пояса. Все фразы разбираются относительно
+CORPUS_TODAY (среда).
+"""
+from datetime import date
+
+CORPUS_TODAY = date(2025, 5, 14)
+
+TYPED = [
+    ("Сегодня с 10:00 до 12:00 Встреча",
+     [("2025-05-14T10:00", "2025-05-14T12:00", "Встреча")]),
+    ("Завтра с 14:30 до 15:30 Совещание",
+     [("2025-05-15T14:30", "2025-05-15T15:30", "Совещание")]),
+    ("Послезавтра 09:00 10:00 Стоматолог",
+     [("2025-05-16T09:00", "2025-05-16T10:00", "Стоматолог")]),
+    ("сегодня 18:00-19:30 Тренировка в зале",
+     [("2025-05-14T18:00", "2025-05-14T19:30", "Тренировка в зале")]),
+    ("Сегодня с 10:00 до 11:00 Встреча, завтра с 14:00 до 15:00 Обед",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "Встреча"),
+      ("2025-05-15T14:00", "2025-05-15T15:00", "Обед")]),
+    ("Сегодня 10:00 11:00 Подготовка к завтра встрече",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "Подготовка к завтра встрече")]),
+    ("12 мая 2026 с 10:00 до 11:00 День рождения",
+     [("2026-05-12T10:00", "2026-05-12T11:00", "День рождения")]),
+    ("20 мая с 10:00 до 11:00 Отчёт",
+     [("2025-05-20T10:00", "2025-05-20T11:00", "Отчёт")]),
+    ("3 мая с 10:00 до 11:00 Праздник",
+     [("2026-05-03T10:00", "2026-05-03T11:00", "Праздник")]),
+    ("31 декабря с 22:00 до 23:59 Новый год",
+     [("2025-12-31T22:00", "2025-12-31T23:59", "Новый год")]),
+    ("В пятницу с 19:00 до 21:00 Кино",
+     [("2025-05-16T19:00", "2025-05-16T21:00", "Кино")]),
+    ("в среду с 10:00 до 11:00 Планерка",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "Планерка")]),
+    ("В следующую среду 10:00 11:00 Планерка",
+     [("2025-05-21T10:00", "2025-05-21T11:00", "Планерка")]),
+    ("в понедельник в 9:00 Созвон",
+     [("2025-05-19T09:00", "2025-05-19T10:00", "Созвон")]),
+    ("Через неделю в 10:00 Врач",
+     [("2025-05-21T10:00", "2025-05-21T11:00", "Врач")]),
+    ("Через месяц в 12:00 Оплатить аренду",
+     [("2025-06-14T12:00", "2025-06-14T13:00", "Оплатить аренду")]),
+    ("через год с 10:00 до 11:00 Продлить домен",
+     [("2026-05-14T10:00", "2026-05-14T11:00", "Продлить домен")]),
+    ("Привет, как дела?", []),
+    ("Сегодня Встреча", []),
+    ("Сегодня с 25:00 до 26:00 Ошибка", []),
+    ("31 февраля с 10:00 до 11:00 Нет такой даты", []),
+]
+
+ASR = [
+    ("сегодня с 10 до 11 встреча с командой",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "встреча с командой")]),
+    ("сегодня с 10 до 11 встреча с командой завтра с 14 до 15 обед",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "встреча с командой"),
+      ("2025-05-15T14:00", "2025-05-15T15:00", "обед")]),
+    ("завтра с 7 до 8 вечера кино",
+     [("2025-05-15T19:00", "2025-05-15T20:00", "кино")]),
+    ("послезавтра в 9 утра пробежка",
+     [("2025-05-16T09:00", "2025-05-16T10:00", "пробежка")]),
+    ("через два дня с 9 до 10 врач",
+     [("2025-05-16T09:00", "2025-05-16T10:00", "врач")]),
+    ("через три недели с 12 до 13 отпуск",
+     [("2025-06-04T12:00", "2025-06-04T13:00", "отпуск")]),
+    ("через 5 дней с 15 до 16 звонок маме",
+     [("2025-05-19T15:00", "2025-05-19T16:00", "звонок маме")]),
+    ("на следующей неделе с 10 до 11 отчёт",
+     [("2025-05-21T10:00", "2025-05-21T11:00", "отчёт")]),
+    ("пустым оставить с 10 до 11 тест",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "тест")]),
+    ("в следующую пятницу с 7 до 8 вечера кино",
+     [("2025-05-16T19:00", "2025-05-16T20:00", "кино")]),
+    ("12 мая 2025 года в 10 встреча",
+     [("2025-05-12T10:00", "2025-05-12T11:00", "встреча")]),
+    ("сегодня 10 11 встреча",
+     [("2025-05-14T10:00", "2025-05-14T11:00", "встреча")]),
+    ("двенадцатого мая встреча", []),
+    ("завтра с 12 до 10 назад",
+     [("2025-05-15T12:00", "2025-05-15T10:00", "назад")]),
+]
+
+CORPUS = TYPED + ASR
+
+ADVERSARIAL = [
+    "сегодня " * 2000,
+    "сегодня с " + "1" * 5000,
+    "через " * 3000 + "дня",
+    "12 " * 3000 + "мая",
+    "с 10 до " * 2000,
+    "сегодня с 10 до 11 " + "а " * 5000,
+    "завтра 10:00 11:00 " + "встреча " * 2000 + "сегодня 10:00 11:00 обед",
+    "сегодня с 10 до 11 " + "x" * 4000 + "\ny",
+    "сегодня с 10 до 11 " + "x" * 16000 + "\ny",
+    "сегодня 10:00 11:00 " + "сегодня 10:00 " * 300,
+]
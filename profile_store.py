@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sqlite3
+import threading
+from collections.abc import MutableMapping
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Set, Tuple
+from settings import settings
+from logger import logger
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+
+def serialize_credentials(credentials: Credentials) -> str:
+    return credentials.to_json()
+
+def deserialize_credentials(data: str) -> Credentials:
+    from google.oauth2.credentials import Credentials
+    info = json.loads(data)
+    expiry = info.get('expiry')
+    credentials = Credentials(
+        token=info.get('token'),
+        refresh_token=info.get('refresh_token'),
+        token_uri=info.get('token_uri'),
+        client_id=info.get('client_id'),
+        client_secret=info.get('client_secret'),
+        scopes=info.get('scopes', settings.scopes),
+    )
+    if expiry:
+        credentials.expiry = datetime.strptime(expiry.rstrip('Z').split('.')[0], '%Y-%m-%dT%H:%M:%S')
+    return credentials
+
+
+@dataclass
+class Profile:
+    credentials: Optional[Credentials] = None
+    timezone: Optional[str] = None
+    preferences: Dict[str, Any] = field(default_factory=dict)
+
+
+class ProfileStore:
+    """Постоянное хранилище профилей пользователей (SQLite).
+
+    Чтение идёт через кэш в памяти, изменения помечают профиль грязным
+    и записываются пачкой фоновой задачей (write-behind). При нескольких
+    процессах-обработчиках пользователь закреплён за одним из них
+    (worker_pool.partition), поэтому кэши процессов не пересекаются.
+    """
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS profiles (
+                user_id INTEGER PRIMARY KEY,
+                credentials TEXT,
+                timezone TEXT,
+                preferences TEXT
+            )
+        """)
+        self._conn.commit()
+        self._profiles: Dict[int, Profile] = {}
+        self._dirty: Set[int] = set()
+
+    def get(self, user_id: int) -> Profile:
+        """Профиль для чтения. Профиль, которого нет в базе, не кэшируется:
+        проверки вида `user_id in user_credentials` для незнакомых
+        пользователей иначе бесконечно растили бы кэш.
+        """
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = self._load(user_id)
+            if profile is not None:
+                self._profiles[user_id] = profile
+        return profile or Profile()
+
+    def _editable(self, user_id: int) -> Profile:
+        profile = self._profiles.get(user_id)
+        if profile is None:
+            profile = self._load(user_id) or Profile()
+            self._profiles[user_id] = profile
+        return profile
+
+    def _load(self, user_id: int) -> Optional[Profile]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT credentials, timezone, preferences FROM profiles WHERE user_id = ?', (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        credentials, timezone, preferences = row
+        try:
+            credentials = deserialize_credentials(credentials) if credentials else None
+        except Exception as e:
+            logger.error("Не удалось восстановить учётные данные пользователя %s: %s", user_id, e)
+            credentials = None
+        return Profile(credentials, timezone, json.loads(preferences) if preferences else {})
+
+    def update(self, user_id: int, **fields) -> Profile:
+        profile = self._editable(user_id)
+        for name, value in fields.items():
+            setattr(profile, name, value)
+        self._dirty.add(user_id)
+        return profile
+
+    def mark_dirty(self, user_id: int) -> None:
+        if user_id in self._profiles:
+            self._dirty.add(user_id)
+
+    def get_preference(self, user_id: int, key: str, default: Any = None) -> Any:
+        return self.get(user_id).preferences.get(key, default)
+
+    def set_preference(self, user_id: int, key: str, value: Any) -> None:
+        self._editable(user_id).preferences[key] = value
+        self._dirty.add(user_id)
+
+    def user_ids(self, column: str) -> Set[int]:
+        """Пользователи, у которых заполнено поле column, с учётом ещё не записанных изменений."""
+        with self._lock:
+            rows = self._conn.execute(f'SELECT user_id FROM profiles WHERE {column} IS NOT NULL').fetchall()
+        user_ids = {row[0] for row in rows}
+        for user_id, profile in self._profiles.items():
+            if getattr(profile, column) is not None:
+                user_ids.add(user_id)
+            else:
+                user_ids.discard(user_id)
+        return user_ids
+
+    def users_with_preference(self, key: str) -> Set[int]:
+        """Пользователи, у которых задана настройка key, с учётом ещё не записанных изменений."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT user_id FROM profiles WHERE json_extract(preferences, ?) IS NOT NULL', (f'$.{key}',)
+            ).fetchall()
+        user_ids = {row[0] for row in rows}
+        for user_id, profile in self._profiles.items():
+            if profile.preferences.get(key) is not None:
+                user_ids.add(user_id)
+            else:
+                user_ids.discard(user_id)
+        return user_ids
+
+    def _snapshot(self) -> Tuple[Set[int], List[tuple]]:
+        """Строки для записи грязных профилей. Вызывается в потоке цикла событий,
+        который изменяет профили, поэтому сериализация не пересекается с изменениями.
+        """
+        dirty, self._dirty = self._dirty, set()
+        rows = []
+        try:
+            for user_id in dirty:
+                profile = self._profiles[user_id]
+                rows.append((
+                    user_id,
+                    serialize_credentials(profile.credentials) if profile.credentials else None,
+                    profile.timezone,
+                    json.dumps(profile.preferences, ensure_ascii=False),
+                ))
+        except Exception:
+            self._dirty |= dirty
+            raise
+        return dirty, rows
+
+    def _write(self, rows: List[tuple]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("""
+                INSERT INTO profiles (user_id, credentials, timezone, preferences)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(user_id) DO UPDATE SET
+                    credentials = excluded.credentials,
+                    timezone = excluded.timezone,
+                    preferences = excluded.preferences
+            """, rows)
+
+    def flush(self) -> int:
+        if not self._dirty:
+            return 0
+        try:
+            dirty, rows = self._snapshot()
+        except Exception as e:
+            logger.error("Ошибка при подготовке профилей к сохранению: %s", e)
+            return 0
+        try:
+            self._write(rows)
+        except Exception as e:
+            self._dirty |= dirty
+            logger.error("Ошибка при сохранении профилей: %s", e)
+            return 0
+        return len(rows)
+
+    async def flush_periodically(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            if not self._dirty:
+                continue
+            try:
+                dirty, rows = self._snapshot()
+            except Exception as e:
+                logger.error("Ошибка при подготовке профилей к сохранению: %s", e)
+                continue
+            try:
+                await asyncio.to_thread(self._write, rows)
+            except Exception as e:
+                self._dirty |= dirty
+                logger.error("Ошибка при сохранении профилей: %s", e)
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+
+class ProfileFieldView(MutableMapping):
+    """Словарный доступ к одному полю профилей: user_id -> значение."""
+
+    def __init__(self, store: ProfileStore, field_name: str):
+        self._store = store
+        self._field = field_name
+
+    def __getitem__(self, user_id: int):
+        value = getattr(self._store.get(user_id), self._field)
+        if value is None:
+            raise KeyError(user_id)
+        return value
+
+    def __setitem__(self, user_id: int, value) -> None:
+        self._store.update(user_id, **{self._field: value})
+
+    def __delitem__(self, user_id: int) -> None:
+        if getattr(self._store.get(user_id), self._field) is None:
+            raise KeyError(user_id)
+        self._store.update(user_id, **{self._field: None})
+
+    def __contains__(self, user_id) -> bool:
+        return getattr(self._store.get(user_id), self._field) is not None
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._store.user_ids(self._field))
+
+    def __len__(self) -> int:
+        return len(self._store.user_ids(self._field))
+
+
+profile_store = ProfileStore(settings.profile_database_path)
+user_credentials = ProfileFieldView(profile_store, 'credentials')
+user_timezones = ProfileFieldView(profile_store, 'timezone')
+
+async def start_profile_flusher() -> asyncio.Task:
+    return asyncio.create_task(profile_store.flush_periodically(settings.profile_flush_interval))
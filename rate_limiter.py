@@ -0,0 +1,149 @@
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Hashable, Optional
+from googleapiclient.errors import HttpError
+from cache import LRUCache
+from logger import logger
+
+RETRYABLE_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+
+class TokenBucket:
+    """Ведро токенов: rate токенов в секунду, не больше capacity в запасе."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost: float = 1) -> float:
+        """Сколько секунд ждать, пока в ведре наберётся cost токенов; 0 — можно сразу."""
+        self._refill()
+        cost = min(cost, self.capacity)
+        return 0.0 if self._tokens >= cost else (cost - self._tokens) / self.rate
+
+    def consume(self, cost: float = 1) -> None:
+        self._tokens -= min(cost, self.capacity)
+
+
+class RateLimiter:
+    """Общий и пользовательский лимиты запросов с честной очередью.
+
+    Запрос проходит, когда токены есть и в общем ведре (квота проекта), и в
+    ведре пользователя. Ожидающие пользователи обслуживаются по кругу: тот,
+    кто прислал сотню запросов, получает слот наравне с остальными и не
+    задерживает тех, чьё ведро уже наполнилось.
+    """
+
+    def __init__(self, rate: float, burst: float, user_rate: float, user_burst: float, max_users: int = 10000):
+        self._global = TokenBucket(rate, burst)
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self._buckets = LRUCache(max_users)
+        self._waiting: 'OrderedDict[Hashable, Deque[tuple]]' = OrderedDict()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def _bucket(self, user_id: Hashable) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(self.user_rate, self.user_burst)
+            self._buckets.set(user_id, bucket)
+        return bucket
+
+    async def acquire(self, user_id: Hashable, cost: float = 1) -> None:
+        bucket = self._bucket(user_id)
+        if not self._waiting and bucket.wait_time(cost) == 0 and self._global.wait_time(cost) == 0:
+            bucket.consume(cost)
+            self._global.consume(cost)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(user_id, deque()).append((future, cost))
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch_loop())
+        await future
+
+    def _grant_round(self) -> float:
+        """Один круг по ожидающим пользователям; возвращает время до следующей попытки."""
+        delay = float('inf')
+        for user_id in list(self._waiting):
+            queue = self._waiting[user_id]
+            while queue and queue[0][0].done():
+                queue.popleft()
+            if not queue:
+                del self._waiting[user_id]
+                continue
+            future, cost = queue[0]
+            bucket = self._bucket(user_id)
+            wait = max(bucket.wait_time(cost), self._global.wait_time(cost))
+            if wait > 0:
+                delay = min(delay, wait)
+                continue
+            bucket.consume(cost)
+            self._global.consume(cost)
+            queue.popleft()
+            future.set_result(None)
+            self._waiting.move_to_end(user_id)
+            delay = 0.0
+        return delay
+
+    async def _dispatch_loop(self) -> None:
+        while self._waiting:
+            self._wakeup.clear()
+            delay = self._grant_round()
+            if not self._waiting:
+                break
+            if delay == 0:
+                await asyncio.sleep(0)
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._waiting.values())
+
+
+def error_reason(error: HttpError) -> Optional[str]:
+    try:
+        return json.loads(error.content)['error']['errors'][0]['reason']
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """429, 5xx и 403 rateLimitExceeded/userRateLimitExceeded, а также обрывы соединения."""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        return status == 429 or status >= 500 or (status == 403 and error_reason(error) in RETRYABLE_REASONS)
+    return isinstance(error, ConnectionError)
+
+def is_duplicate(error: Exception) -> bool:
+    """409: объект с таким id уже создан, например, предыдущей попыткой того же запроса."""
+    return isinstance(error, HttpError) and error.resp.status == 409
+
+def backoff_delay(attempt: int, base: float, cap: float, error: Optional[Exception] = None) -> float:
+    """Экспоненциальная задержка с полным джиттером; Retry-After из ответа имеет приоритет."""
+    if isinstance(error, HttpError):
+        retry_after = error.resp.get('retry-after')
+        if retry_after and retry_after.isdigit():
+            return min(cap, float(retry_after))
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+async def sleep_before_retry(attempt: int, base: float, cap: float, error: Exception, context: str) -> None:
+    delay = backoff_delay(attempt, base, cap, error)
+    logger.warning("%s: повтор %s через %.2f с после ошибки: %s", context, attempt + 1, delay, error)
+    await asyncio.sleep(delay)
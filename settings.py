@@ -1,52 +1,251 @@
 import os
-from typing import Dict, Any
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import Flow
-
-from dotenv import load_dotenv
-load_dotenv()
-
-TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
-if not TELEGRAM_TOKEN:
-    raise ValueError("TELEGRAM_TOKEN not found in environment variables")
-
-CLIENT_SECRETS_FILE = os.getenv('CLIENT_SECRETS_FILE', 'client_secret.json')
-SCOPES = ['https://www.googleapis.com/auth/calendar']
-REDIRECT_URI = os.getenv('REDIRECT_URI', 'https://mamishka79.github.io/home-page-sintes/')
-
-UserTimezones = Dict[int, str]
-UserCredentials = Dict[int, Credentials]
-AuthFlows = Dict[int, Flow]
-
-user_timezones: UserTimezones = {}
-user_credentials: UserCredentials = {}
-auth_flows: AuthFlows = {}
-
-def validate_config() -> None:
-    """Validate all required configuration parameters."""
-    if not os.path.exists(CLIENT_SECRETS_FILE):
-        raise FileNotFoundError(f"Client secrets file not found: {CLIENT_SECRETS_FILE}")
-    
-    if not REDIRECT_URI:
-        raise ValueError("REDIRECT_URI is not configured")
-
-class Config:
-    DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
-    
-    @classmethod
-    def get_telegram_token(cls) -> str:
-        return TELEGRAM_TOKEN
-    
-    @classmethod
-    def get_client_secrets_file(cls) -> str:
-        return CLIENT_SECRETS_FILE
-    
-    @classmethod
-    def get_scopes(cls) -> list:
-        return SCOPES
-    
+import re
+from dataclasses import dataclass
+from typing import FrozenSet, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Конфигурация бота, прочитанная из окружения (и .env) один раз при запуске.
+
+    Проверка обязательных параметров отложена до validate(), которую вызывает
+    main: импорт модулей не требует ни токена, ни файла client_secret.json.
+    """
+
+    telegram_token: Optional[str]
+    client_secrets_file: str
+    scopes: Tuple[str, ...]
+    redirect_uri: str
+
+    calendar_client_cache_size: int
+    calendar_client_idle_ttl: float
+    calendar_workers: int
+    calendar_max_concurrency: int
+    calendar_call_timeout: float
+    # Запросов в секунду на проект и на пользователя; по умолчанию ниже стандартных квот Calendar API.
+    calendar_rate: float
+    calendar_burst: float
+    calendar_user_rate: float
+    calendar_user_burst: float
+    calendar_max_retries: int
+    calendar_backoff_base: float
+    calendar_backoff_cap: float
+
+    voice_decode_workers: int
+    voice_sample_rate: int
+    voice_silence_threshold: float
+    voice_max_duration: float
+
+    speech_backend: str
+    speech_language: str
+    speech_workers: int
+    speech_queue_limit: int
+    speech_timeout: float
+    vosk_model_path: str
+
+    transcript_cache_size: int
+    transcript_cache_ttl: float
+    transcript_cache_file: str
+
+    user_data_file: str
+    user_data_database_url: str
+    profile_database_path: str
+    profile_flush_interval: float
+
+    token_refresh_lead: float
+    token_refresh_batch: int
+    token_refresh_interval: float
+
+    event_cache_size: int
+    event_cache_ttl: float
+    event_cache_window_days: int
+
+    agenda_page_chars: int
+    agenda_max_days: int
+    calendar_list_ttl: float
+
+    # Если задан WEBHOOK_URL, бот принимает обновления через webhook, иначе использует long polling.
+    webhook_url: Optional[str]
+    webhook_listen: str
+    webhook_port: int
+    webhook_path: str
+    webhook_secret: Optional[str]
+    webhook_max_connections: int
+
+    update_concurrency: int
+    update_queue_warn_depth: int
+
+    # Число процессов-обработчиков; при workers > 1 обновления распределяются между ними по user_id.
+    workers: int
+    # Номер процесса-обработчика, который задаёт диспетчер (WORKER_INDEX); None — процесс не обработчик.
+    worker_index: Optional[int]
+    # Общее для процессов состояние (незавершённые авторизации): sqlite:///путь или memory://.
+    state_backend_url: str
+    auth_flow_ttl: float
+
+    log_level: str
+    log_format: str
+    log_dir: str
+    log_queue_size: int
+    # Доли сохраняемых записей по уровням, например DEBUG=0.1,INFO=0.5; WARNING и выше пишутся всегда.
+    log_sample_rates: str
+
+    # Порт HTTP-эндпоинта /metrics в формате Prometheus; 0 — эндпоинт выключен.
+    # При workers > 1 процесс-обработчик с номером i слушает metrics_port + i + 1.
+    metrics_host: str
+    metrics_port: int
+    admin_ids: FrozenSet[int]
+
+    timezone_index_path: str
+    timezone_search_limit: int
+
+    notify_agenda_time: str
+    notify_reminder_minutes: int
+    # Раз в notify_scan_interval секунд для каждого пользователя запрашиваются события на следующий интервал.
+    notify_scan_interval: float
+    # За сколько секунд до отправки начинается выборка событий для утренней сводки и напоминаний.
+    notify_prefetch: float
+    notify_fetch_concurrency: int
+    # Лимит исходящих уведомлений (Telegram допускает около 30 сообщений в секунду на бота).
+    notify_send_rate: float
+    notify_send_burst: float
+
+    # Занятость из freebusy.query: окно на busy_window_days вперёд, после busy_cache_ttl обновляется в фоне.
+    busy_cache_size: int
+    busy_cache_ttl: float
+    busy_window_days: int
+    conflict_pending_ttl: float
+
     @classmethod
-    def get_redirect_uri(cls) -> str:
-        return REDIRECT_URI
+    def from_env(cls) -> 'Settings':
+        return cls(
+            telegram_token=os.getenv('TELEGRAM_TOKEN'),
+            client_secrets_file=os.getenv('CLIENT_SECRETS_FILE', 'client_secret.json'),
+            scopes=('https://www.googleapis.com/auth/calendar',),
+            redirect_uri=os.getenv('REDIRECT_URI', 'https://mamishka79.github.io/home-page-sintes/'),
+
+            calendar_client_cache_size=int(os.getenv('CALENDAR_CLIENT_CACHE_SIZE', '1000')),
+            calendar_client_idle_ttl=float(os.getenv('CALENDAR_CLIENT_IDLE_TTL', '1800')),
+            calendar_workers=int(os.getenv('CALENDAR_WORKERS', '16')),
+            calendar_max_concurrency=int(os.getenv('CALENDAR_MAX_CONCURRENCY', '16')),
+            calendar_call_timeout=float(os.getenv('CALENDAR_CALL_TIMEOUT', '15')),
+            calendar_rate=float(os.getenv('CALENDAR_RATE', '100')),
+            calendar_burst=float(os.getenv('CALENDAR_BURST', '200')),
+            calendar_user_rate=float(os.getenv('CALENDAR_USER_RATE', '5')),
+            calendar_user_burst=float(os.getenv('CALENDAR_USER_BURST', '20')),
+            calendar_max_retries=int(os.getenv('CALENDAR_MAX_RETRIES', '5')),
+            calendar_backoff_base=float(os.getenv('CALENDAR_BACKOFF_BASE', '0.5')),
+            calendar_backoff_cap=float(os.getenv('CALENDAR_BACKOFF_CAP', '32')),
+
+            voice_decode_workers=int(os.getenv('VOICE_DECODE_WORKERS', '2')),
+            voice_sample_rate=int(os.getenv('VOICE_SAMPLE_RATE', '16000')),
+            voice_silence_threshold=float(os.getenv('VOICE_SILENCE_THRESHOLD', '-40')),
+            voice_max_duration=float(os.getenv('VOICE_MAX_DURATION', '60')),
+
+            speech_backend=os.getenv('SPEECH_BACKEND', 'google'),
+            speech_language=os.getenv('SPEECH_LANGUAGE', 'ru-RU'),
+            speech_workers=int(os.getenv('SPEECH_WORKERS', '4')),
+            speech_queue_limit=int(os.getenv('SPEECH_QUEUE_LIMIT', '16')),
+            speech_timeout=float(os.getenv('SPEECH_TIMEOUT', '30')),
+            vosk_model_path=os.getenv('VOSK_MODEL_PATH', 'models/vosk-model-small-ru'),
+
+            transcript_cache_size=int(os.getenv('TRANSCRIPT_CACHE_SIZE', '5000')),
+            transcript_cache_ttl=float(os.getenv('TRANSCRIPT_CACHE_TTL', str(7 * 24 * 3600))),
+            transcript_cache_file=os.getenv('TRANSCRIPT_CACHE_FILE', 'transcripts.json'),
+
+            user_data_file=os.getenv('USER_DATA_FILE', 'user_data.json'),
+            user_data_database_url=os.getenv('USER_DATA_DATABASE_URL',
+                                             os.getenv('DATABASE_URL', 'sqlite:///sintes.db')),
+            profile_database_path=os.getenv('PROFILE_DATABASE_PATH', 'sintes.db'),
+            profile_flush_interval=float(os.getenv('PROFILE_FLUSH_INTERVAL', '5')),
+
+            token_refresh_lead=float(os.getenv('TOKEN_REFRESH_LEAD', '300')),
+            token_refresh_batch=int(os.getenv('TOKEN_REFRESH_BATCH', '20')),
+            token_refresh_interval=float(os.getenv('TOKEN_REFRESH_INTERVAL', '60')),
+
+            event_cache_size=int(os.getenv('EVENT_CACHE_SIZE', '1000')),
+            event_cache_ttl=float(os.getenv('EVENT_CACHE_TTL', '900')),
+            event_cache_window_days=int(os.getenv('EVENT_CACHE_WINDOW_DAYS', '14')),
+
+            agenda_page_chars=int(os.getenv('AGENDA_PAGE_CHARS', '3500')),
+            agenda_max_days=int(os.getenv('AGENDA_MAX_DAYS', '31')),
+            calendar_list_ttl=float(os.getenv('CALENDAR_LIST_TTL', '3600')),
+
+            webhook_url=os.getenv('WEBHOOK_URL'),
+            webhook_listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'),
+            webhook_port=int(os.getenv('WEBHOOK_PORT', os.getenv('PORT', '8443'))),
+            webhook_path=os.getenv('WEBHOOK_PATH', 'telegram').strip('/'),
+            webhook_secret=os.getenv('WEBHOOK_SECRET') or None,
+            webhook_max_connections=int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40')),
+
+            update_concurrency=int(os.getenv('UPDATE_CONCURRENCY', '32')),
+            update_queue_warn_depth=int(os.getenv('UPDATE_QUEUE_WARN_DEPTH', '20')),
+
+            workers=int(os.getenv('WORKERS', '1')),
+            worker_index=int(os.getenv('WORKER_INDEX')) if os.getenv('WORKER_INDEX') else None,
+            state_backend_url=os.getenv('STATE_BACKEND_URL',
+                                        'sqlite:///' + os.getenv('PROFILE_DATABASE_PATH', 'sintes.db')),
+            auth_flow_ttl=float(os.getenv('AUTH_FLOW_TTL', '900')),
+
+            log_level=os.getenv('LOG_LEVEL', 'INFO').upper(),
+            log_format=os.getenv('LOG_FORMAT', 'json'),
+            log_dir=os.getenv('LOG_DIR', 'logs'),
+            log_queue_size=int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+            log_sample_rates=os.getenv('LOG_SAMPLE_RATES', ''),
+
+            metrics_host=os.getenv('METRICS_HOST', '0.0.0.0'),
+            metrics_port=int(os.getenv('METRICS_PORT', '0')),
+            admin_ids=frozenset(int(user_id) for user_id in os.getenv('ADMIN_IDS', '').replace(' ', '').split(',')
+                                if user_id),
+
+            timezone_index_path=os.getenv('TIMEZONE_INDEX_PATH', 'timezone_grid.bin'),
+            timezone_search_limit=int(os.getenv('TIMEZONE_SEARCH_LIMIT', '8')),
+
+            notify_agenda_time=os.getenv('NOTIFY_AGENDA_TIME', '08:00'),
+            notify_reminder_minutes=int(os.getenv('NOTIFY_REMINDER_MINUTES', '15')),
+            notify_scan_interval=float(os.getenv('NOTIFY_SCAN_INTERVAL', '900')),
+            notify_prefetch=float(os.getenv('NOTIFY_PREFETCH', '120')),
+            notify_fetch_concurrency=int(os.getenv('NOTIFY_FETCH_CONCURRENCY', '20')),
+            notify_send_rate=float(os.getenv('NOTIFY_SEND_RATE', '25')),
+            notify_send_burst=float(os.getenv('NOTIFY_SEND_BURST', '30')),
+
+            busy_cache_size=int(os.getenv('BUSY_CACHE_SIZE', '1000')),
+            busy_cache_ttl=float(os.getenv('BUSY_CACHE_TTL', '300')),
+            busy_window_days=int(os.getenv('BUSY_WINDOW_DAYS', '7')),
+            conflict_pending_ttl=float(os.getenv('CONFLICT_PENDING_TTL', '600')),
+        )
+
+    def worker_file(self, path: str) -> str:
+        """Свой файл для каждого процесса-обработчика: logs/main.log → logs/main.worker1.log."""
+        if self.worker_index is None:
+            return path
+        root, extension = os.path.splitext(path)
+        return f"{root}.worker{self.worker_index}{extension}"
+
+    def validate(self) -> None:
+        """Validate all required configuration parameters."""
+        if not self.telegram_token:
+            raise ValueError("TELEGRAM_TOKEN not found in environment variables")
+
+        if not os.path.exists(self.client_secrets_file):
+            raise FileNotFoundError(f"Client secrets file not found: {self.client_secrets_file}")
+
+        if not self.redirect_uri:
+            raise ValueError("REDIRECT_URI is not configured")
+
+        if self.workers < 1:
+            raise ValueError("WORKERS must be at least 1")
+
+        if self.webhook_url and not self.webhook_url.startswith('https://'):
+            raise ValueError("WEBHOOK_URL must be an https:// URL")
+
+        if self.webhook_secret and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', self.webhook_secret):
+            raise ValueError("WEBHOOK_SECRET may contain only A-Z, a-z, 0-9, _ and - (up to 256 characters)")
+
+
+def load_settings() -> Settings:
+    from dotenv import load_dotenv
+    load_dotenv()
+    return Settings.from_env()
 
-validate_config()
\ No newline at end of file
+settings = load_settings()
@@ -0,0 +1,154 @@
+import asyncio
+import io
+import json
+import threading
+import wave
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+from metrics import metrics, timer
+from settings import settings
+
+
+class SpeechRecognitionError(Exception):
+    """Базовая ошибка распознавания речи."""
+
+class SpeechNotRecognized(SpeechRecognitionError):
+    """Речь в записи не распознана."""
+
+class SpeechServiceError(SpeechRecognitionError):
+    """Движок распознавания недоступен или вернул ошибку."""
+
+class RecognitionBusy(SpeechRecognitionError):
+    """Очередь распознавания переполнена."""
+
+
+class SpeechBackend(ABC):
+    """Интерфейс движка распознавания: WAV-байты на входе, текст на выходе."""
+
+    name = 'base'
+
+    @abstractmethod
+    def transcribe(self, wav_bytes: bytes, language: str) -> str:
+        """Возвращает распознанный текст или поднимает SpeechRecognitionError."""
+
+
+class GoogleSpeechBackend(SpeechBackend):
+    """Google Web Speech API через SpeechRecognition (сетевой вызов)."""
+
+    name = 'google'
+
+    def transcribe(self, wav_bytes: bytes, language: str) -> str:
+        import speech_recognition as sr
+
+        recognizer = sr.Recognizer()
+        with sr.AudioFile(io.BytesIO(wav_bytes)) as source:
+            audio_data = recognizer.record(source)
+        try:
+            return recognizer.recognize_google(audio_data, language=language)
+        except sr.UnknownValueError as e:
+            raise SpeechNotRecognized() from e
+        except sr.RequestError as e:
+            raise SpeechServiceError(str(e)) from e
+
+
+class VoskSpeechBackend(SpeechBackend):
+    """Локальный офлайн-движок Vosk, работает на CPU.
+
+    Модель загружается один раз при первом обращении и разделяется потоками пула.
+    """
+
+    name = 'vosk'
+
+    def __init__(self, model_path: str):
+        self.model_path = model_path
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    try:
+                        from vosk import Model
+                    except ImportError as e:
+                        raise SpeechServiceError("vosk не установлен: pip install vosk") from e
+                    self._model = Model(self.model_path)
+        return self._model
+
+    def transcribe(self, wav_bytes: bytes, language: str) -> str:
+        # Модель запрашивается первой: без vosk она поднимет SpeechServiceError, а не ImportError.
+        model = self.model
+        from vosk import KaldiRecognizer
+
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wav:
+            recognizer = KaldiRecognizer(model, wav.getframerate())
+            while True:
+                frames = wav.readframes(4000)
+                if not frames:
+                    break
+                recognizer.AcceptWaveform(frames)
+        text = json.loads(recognizer.FinalResult()).get('text', '').strip()
+        if not text:
+            raise SpeechNotRecognized()
+        return text
+
+
+def create_backend(name: str) -> SpeechBackend:
+    if name == GoogleSpeechBackend.name:
+        return GoogleSpeechBackend()
+    if name == VoskSpeechBackend.name:
+        return VoskSpeechBackend(settings.vosk_model_path)
+    raise ValueError(f"Unknown speech backend: {name}")
+
+
+class RecognitionPool:
+    """Пул потоков распознавания с ограничением глубины очереди и таймаутом на задачу.
+
+    Задача, у которой истёк таймаут, продолжает выполняться в потоке и
+    занимает место в очереди, пока не завершится.
+    """
+
+    def __init__(self, backend: SpeechBackend, workers: int, queue_limit: int,
+                 timeout: float, language: str):
+        self.backend = backend
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.timeout = timeout
+        self.language = language
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='speech')
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def transcribe(self, wav_bytes: bytes, timeout: Optional[float] = None) -> str:
+        if self._pending >= self.workers + self.queue_limit:
+            raise RecognitionBusy()
+
+        with self._pending_lock:
+            self._pending += 1
+        future = self._executor.submit(self.backend.transcribe, wav_bytes, self.language)
+        future.add_done_callback(self._finished)
+        try:
+            with timer('external_call_seconds', service='speech', method=self.backend.name):
+                return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeout)
+        except asyncio.TimeoutError as e:
+            raise SpeechServiceError("превышено время ожидания") from e
+
+    def _finished(self, future) -> None:
+        with self._pending_lock:
+            self._pending -= 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+speech_pool = RecognitionPool(
+    create_backend(settings.speech_backend), settings.speech_workers, settings.speech_queue_limit,
+    settings.speech_timeout, settings.speech_language
+)
+metrics.gauge('speech_pending', lambda: speech_pool.pending, 'Голосовые сообщения в очереди распознавания')
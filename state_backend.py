@@ -0,0 +1,146 @@
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+from settings import settings
+
+SQLITE_PREFIX = 'sqlite:///'
+MEMORY_URL = 'memory://'
+
+
+class StateBackend(ABC):
+    """Общее для всех процессов бота состояние с ограниченным сроком жизни.
+
+    Значения — JSON-совместимые объекты, ключи сгруппированы по пространствам
+    имён (например, незавершённые OAuth-авторизации). Запись, у которой истёк
+    ttl, считается отсутствующей.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        ...
+
+    @abstractmethod
+    def set(self, namespace: str, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def pop(self, namespace: str, key: Any) -> Optional[Any]:
+        """Атомарно читает и удаляет значение: его получит только один процесс."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStateBackend(StateBackend):
+    """Состояние в памяти процесса: для запуска в одном процессе и для проверок."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], Tuple[str, Optional[float]]] = {}
+
+    def _live(self, namespace: str, key: Any) -> Optional[str]:
+        entry = self._entries.get((namespace, str(key)))
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            del self._entries[(namespace, str(key))]
+            return None
+        return value
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._live(namespace, key)
+        return None if value is None else json.loads(value)
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[(namespace, str(key))] = (json.dumps(value, ensure_ascii=False), expires_at)
+
+    def pop(self, namespace: str, key: Any) -> Optional[Any]:
+        with self._lock:
+            value = self._live(namespace, key)
+            self._entries.pop((namespace, str(key)), None)
+        return None if value is None else json.loads(value)
+
+
+class SQLiteStateBackend(StateBackend):
+    """Состояние в файле SQLite, который открывают все процессы бота на одной машине."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS shared_state (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                expires_at REAL,
+                PRIMARY KEY (namespace, key)
+            );
+            CREATE INDEX IF NOT EXISTS shared_state_expires_at ON shared_state (expires_at);
+        """)
+
+    def get(self, namespace: str, key: Any) -> Optional[Any]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM shared_state WHERE namespace = ? AND key = ? '
+                'AND (expires_at IS NULL OR expires_at > ?)',
+                (namespace, str(key), time.time()),
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, namespace: str, key: Any, value: Any, ttl: Optional[float] = None) -> None:
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                # Просроченные записи удаляются попутно, отдельная уборка не нужна.
+                self._conn.execute('DELETE FROM shared_state WHERE expires_at <= ?', (now,))
+                self._conn.execute(
+                    'INSERT OR REPLACE INTO shared_state (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                    (namespace, str(key), json.dumps(value, ensure_ascii=False), expires_at),
+                )
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+
+    def pop(self, namespace: str, key: Any) -> Optional[Any]:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = self._conn.execute(
+                    'SELECT value, expires_at FROM shared_state WHERE namespace = ? AND key = ?',
+                    (namespace, str(key)),
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute('DELETE FROM shared_state WHERE namespace = ? AND key = ?',
+                                       (namespace, str(key)))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return json.loads(row[0])
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def create_state_backend(url: str) -> StateBackend:
+    if url.startswith(SQLITE_PREFIX):
+        return SQLiteStateBackend(url[len(SQLITE_PREFIX):])
+    if url == MEMORY_URL:
+        return MemoryStateBackend()
+    raise ValueError(f"Unsupported state backend URL: {url}")
+
+state_backend = create_state_backend(settings.state_backend_url)
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+from busy_cache import DAY, BusyCache, BusyWindow, IntervalTree, to_rfc3339
+
+USER = 7
+HOUR = 3600
+
+
+def brute_force(intervals, start, end):
+    return sorted(interval for interval in intervals if interval[0] < end and interval[1] > start)
+
+
+def test_overlapping_matches_brute_force():
+    generator = random.Random(25)
+    intervals = []
+    for _ in range(200):
+        start = generator.uniform(0, 1000)
+        intervals.append((start, start + generator.uniform(0.5, 80), ''))
+    tree = IntervalTree(intervals)
+    for _ in range(300):
+        start = generator.uniform(-50, 1050)
+        end = start + generator.uniform(0.1, 100)
+        assert sorted(tree.overlapping(start, end)) == brute_force(intervals, start, end)
+
+
+@pytest.mark.parametrize('start, end, found', [
+    (0, 10, []),
+    (10, 20, [(10, 20, '')]),
+    (19.9, 20, [(10, 20, '')]),
+    (20, 30, []),
+    (5, 45, [(10, 20, ''), (30, 40, 'bot')]),
+])
+def test_overlapping_is_half_open(start, end, found):
+    tree = IntervalTree([(30, 40, 'bot'), (10, 20, '')])
+    assert tree.overlapping(start, end) == found
+
+
+def test_add_and_remove():
+    tree = IntervalTree([(10, 20, '')])
+    tree.add(15, 25, 'event')
+    assert len(tree) == 2 and tree.overlapping(21, 22) == [(15, 25, 'event')]
+    assert tree.remove(15, 25)
+    assert not tree.remove(15, 25)
+    assert tree.overlapping(21, 22) == []
+
+
+def event(start: float, end: float, event_id: str = 'event') -> dict:
+    return {'id': event_id, 'start': {'dateTime': to_rfc3339(start)}, 'end': {'dateTime': to_rfc3339(end)}}
+
+
+@pytest.fixture
+def cache():
+    return BusyCache(max_users=10, ttl=60, window_days=7)
+
+
+def cached_window(cache, intervals) -> BusyWindow:
+    window = BusyWindow(0, 7 * DAY, IntervalTree(intervals))
+    cache._windows.set(USER, window)
+    return window
+
+
+def test_move_replaces_exact_interval(cache):
+    window = cached_window(cache, [(10 * HOUR, 11 * HOUR, '')])
+    cache.move(USER, event(10 * HOUR, 11 * HOUR), event(14 * HOUR, 15 * HOUR))
+    assert cache._windows.get(USER) is window
+    assert window.tree.overlapping(10 * HOUR, 11 * HOUR) == []
+    assert window.tree.overlapping(14 * HOUR, 15 * HOUR) == [(14 * HOUR, 15 * HOUR, 'event')]
+
+
+def test_move_out_of_merged_freebusy_interval_drops_window(cache):
+    # freebusy вернул одну склеенную занятость для встреч 10–11 и 11–12.
+    cached_window(cache, [(10 * HOUR, 12 * HOUR, '')])
+    cache.move(USER, event(10 * HOUR, 11 * HOUR), event(14 * HOUR, 15 * HOUR))
+    assert cache._windows.get(USER) is None
+
+
+def test_move_forgets_local_entry_of_old_interval(cache):
+    window = cached_window(cache, [])
+    cache.add(USER, event(10 * HOUR, 11 * HOUR))
+    cache.move(USER, event(10 * HOUR, 11 * HOUR), event(14 * HOUR, 15 * HOUR))
+    assert [entry[1:] for entry in window.local] == [(14 * HOUR, 15 * HOUR, 'event')]
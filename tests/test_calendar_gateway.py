@@ -0,0 +1,54 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from calendar_gateway import CalendarGateway
+
+USER = 7
+
+
+class Credentials:
+    def __init__(self):
+        self.token = 'old'
+        self.valid = False
+        self.refreshes = 0
+        self._active = 0
+        self.overlapped = False
+        self._lock = threading.Lock()
+
+    def refresh(self, request):
+        with self._lock:
+            self._active += 1
+            self.overlapped |= self._active > 1
+        time.sleep(0.02)
+        self.refreshes += 1
+        self.token = f'token-{self.refreshes}'
+        self.valid = True
+        with self._lock:
+            self._active -= 1
+
+
+def test_concurrent_refreshes_of_one_user_run_once():
+    gateway = CalendarGateway(4, 4, 5, limiter=None)
+    credentials = Credentials()
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: gateway.refresh_credentials(USER, credentials, 'old'), range(8)))
+    finally:
+        gateway.shutdown()
+    assert results.count(True) == 1
+    assert credentials.refreshes == 1 and not credentials.overlapped
+
+
+def test_token_change_is_reported():
+    gateway = CalendarGateway(1, 1, 5, limiter=None)
+    reported = []
+    gateway.on_token_refresh = lambda user_id, credentials: reported.append((user_id, credentials.token))
+    credentials = Credentials()
+    try:
+        gateway._check_token(USER, credentials, 'old')
+        credentials.token = 'new'
+        gateway._check_token(USER, credentials, 'old')
+    finally:
+        gateway.shutdown()
+    assert reported == [(USER, 'new')]
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+from date_parser import parse_events
+from parser_corpus import CORPUS, CORPUS_TODAY
+
+parse = parse_events.__wrapped__
+
+
+def as_tuples(events) -> list:
+    return [(event.start.isoformat(timespec='minutes'), event.end.isoformat(timespec='minutes'), event.title)
+            for event in events]
+
+
+@pytest.mark.parametrize('phrase, expected', CORPUS)
+def test_corpus(phrase, expected):
+    assert as_tuples(parse(phrase, CORPUS_TODAY)) == expected
+
+
+@pytest.mark.parametrize('phrase', [
+    "через 99999999999 лет в 10 x",
+    "через 999999999 дней в 10 x",
+    "через 99999999 недель в 10 x",
+    "12 мая 0000 в 10 x",
+    "31 декабря 9999 в 23 x",
+])
+def test_out_of_range_dates_are_not_events(phrase):
+    assert parse(phrase, CORPUS_TODAY) == ()
+
+
+def test_out_of_range_head_does_not_hide_next_event():
+    events = as_tuples(parse("через 99999999999 лет в 10 x, завтра в 11 z", CORPUS_TODAY))
+    assert events[-1] == ("2025-05-15T11:00", "2025-05-15T12:00", "z")
+
+
+@pytest.mark.parametrize('phrase, start, end', [
+    ("сегодня с 10 до 11 дня x", "10:00", "11:00"),
+    ("сегодня с 11 до 1 дня x", "11:00", "13:00"),
+    ("сегодня с 2 до 4 дня x", "14:00", "16:00"),
+    ("сегодня в 12 дня x", "12:00", "13:00"),
+    ("сегодня с 7 до 8 вечера x", "19:00", "20:00"),
+    ("сегодня с 10 до 11 вечера x", "22:00", "23:00"),
+    ("сегодня в 9 утра x", "09:00", "10:00"),
+])
+def test_afternoon_shift_per_end(phrase, start, end):
+    (event,) = parse(phrase, CORPUS_TODAY)
+    assert (event.start.strftime('%H:%M'), event.end.strftime('%H:%M')) == (start, end)
+
+
+def test_zero_count_is_today():
+    (event,) = parse("через 0 дней в 10 x", CORPUS_TODAY)
+    assert event.start.date() == CORPUS_TODAY
+
+
+def test_end_of_calendar_with_explicit_end():
+    (event,) = parse("31 декабря 9999 с 10 до 11 x", date(2025, 5, 14))
+    assert event.start.date() == date(9999, 12, 31)
@@ -0,0 +1,47 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from event_cache import CachedCalendar, EventCache
+
+WINDOW_START = datetime(2026, 10, 18, tzinfo=timezone.utc)
+
+
+def event(event_id: str, start: datetime, hours: float = 1) -> dict:
+    return {'id': event_id, 'start': {'dateTime': start.isoformat()},
+            'end': {'dateTime': (start + timedelta(hours=hours)).isoformat()}}
+
+
+@pytest.fixture
+def calendar():
+    calendar = CachedCalendar(WINDOW_START, WINDOW_START + timedelta(days=7))
+    EventCache._apply(calendar, event('inside', WINDOW_START + timedelta(days=1)))
+    return calendar
+
+
+@pytest.mark.parametrize('start, hours, kept', [
+    (WINDOW_START + timedelta(days=3), 1, True),
+    (WINDOW_START - timedelta(hours=1), 2, True),
+    (WINDOW_START + timedelta(days=7) - timedelta(hours=1), 2, True),
+    (WINDOW_START - timedelta(hours=1), 1, False),
+    (WINDOW_START + timedelta(days=7), 1, False),
+    (WINDOW_START + timedelta(days=30), 1, False),
+])
+def test_delta_keeps_only_events_overlapping_window(calendar, start, hours, kept):
+    EventCache._apply(calendar, event('delta', start, hours))
+    assert ('delta' in calendar.events) is kept
+
+
+def test_event_moved_out_of_window_is_dropped(calendar):
+    EventCache._apply(calendar, event('inside', WINDOW_START + timedelta(days=40)))
+    assert 'inside' not in calendar.events
+
+
+def test_all_day_event_inside_window(calendar):
+    EventCache._apply(calendar, {'id': 'day', 'start': {'date': '2026-10-20'}, 'end': {'date': '2026-10-21'}})
+    assert 'day' in calendar.events
+
+
+def test_cancelled_event_is_removed(calendar):
+    EventCache._apply(calendar, {'id': 'inside', 'status': 'cancelled'})
+    assert calendar.events == {}
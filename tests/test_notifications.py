@@ -0,0 +1,138 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from telegram.error import RetryAfter
+
+import notifications
+from notifications import AGENDA, REMIND, SCAN, SEND_ATTEMPTS, Job, NotificationScheduler
+
+USER = 7
+LEAD_MINUTES = 10
+
+
+class Preferences:
+    def __init__(self, **values):
+        self.values = values
+
+    def get_preference(self, user_id, name):
+        return self.values.get(name)
+
+    def set_preference(self, user_id, name, value):
+        self.values[name] = value
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(notifications, 'profile_store',
+                        Preferences(**{notifications.REMINDER_PREFERENCE: LEAD_MINUTES}))
+    monkeypatch.setattr(notifications, 'user_timezones', {})
+    return NotificationScheduler(3600, 60, 2, 100, 100)
+
+
+def event_at(remind_at: float, summary: str = 'Встреча') -> tuple:
+    start = datetime.fromtimestamp(remind_at + 60 * LEAD_MINUTES, timezone.utc)
+    return start, start + timedelta(hours=1), summary, 'primary'
+
+
+def reminders(scheduler) -> dict:
+    return {job.event[1]: job.send_at for job in scheduler._jobs.values() if job.kind == REMIND}
+
+
+def test_scan_schedules_reminders_inside_window(scheduler):
+    now = time.time()
+    scan = Job(SCAN, USER, now, until=now + 3600)
+    scheduler._schedule_reminders(scan, [event_at(now + 600, 'внутри'), event_at(now + 7200, 'после')])
+    assert reminders(scheduler) == {'внутри': pytest.approx(now + 600)}
+
+
+def test_rescan_cancels_reminders_of_vanished_events(scheduler):
+    now = time.time()
+    scheduler._schedule_reminders(Job(SCAN, USER, now, until=now + 3600),
+                                  [event_at(now + 600, 'удалят'), event_at(now + 900, 'останется')])
+    removed = next(job for job in scheduler._jobs.values() if job.event and job.event[1] == 'удалят')
+    scheduler._schedule_reminders(Job(SCAN, USER, now + 60, until=now + 7200), [event_at(now + 900, 'останется')])
+    assert set(reminders(scheduler)) == {'останется'}
+    assert removed.cancelled
+
+
+def test_rescan_does_not_repeat_sent_reminders(scheduler):
+    now = time.time()
+    regular = Job(SCAN, USER, now - 120, until=now + 3600, seen_until=now + 60)
+    scheduler._schedule_reminders(regular, [event_at(now - 60, 'отправлено'), event_at(now + 600, 'впереди')])
+    assert set(reminders(scheduler)) == {'впереди'}
+
+    # Внеочередная выборка после отмены всех напоминаний отправляет и опоздавшие.
+    scheduler.cancel_reminders(USER)
+    scheduler._schedule_reminders(Job(SCAN, USER, now - 120, until=now + 3600), [event_at(now - 60, 'опоздало')])
+    assert set(reminders(scheduler)) == {'опоздало'}
+
+
+def test_refresh_rescans_whole_scanned_window(scheduler):
+    scheduler.configure_user(USER)
+    first, = scheduler._pop_due(time.time())
+    scheduler._schedule_reminders(first, [])
+    scheduler._reschedule(first)
+
+    # Регулярная выборка следующего окна уже извлечена и ждёт ответа календаря.
+    in_flight, = scheduler._pop_due(first.until)
+    horizon = in_flight.until
+    scheduler.refresh_reminders(USER)
+    assert in_flight.cancelled
+
+    rescan = scheduler._jobs[(SCAN, USER, '')]
+    assert rescan.until == horizon
+    scheduler._schedule_reminders(rescan, [event_at(horizon - 600, 'добавлено')])
+    assert set(reminders(scheduler)) == {'добавлено'}
+
+    # Отменённая выборка не планирует напоминаний по устаревшим данным и не порождает следующую.
+    scheduler._schedule_reminders(in_flight, [event_at(horizon - 300, 'устарело')])
+    scheduler._reschedule(in_flight)
+    assert set(reminders(scheduler)) == {'добавлено'}
+    assert scheduler._jobs[(SCAN, USER, '')] is rescan
+
+
+def test_refresh_ignores_users_without_reminders(scheduler, monkeypatch):
+    monkeypatch.setattr(notifications, 'profile_store', Preferences())
+    scheduler.refresh_reminders(USER)
+    assert scheduler._jobs == {}
+
+
+def test_agenda_wait_does_not_block_scan(scheduler):
+    async def fetch(user_id, jobs):
+        return []
+
+    async def scenario():
+        scheduler._send_lock = asyncio.Lock()
+        scheduler._fetch = fetch
+        now = time.time()
+        agenda = Job(AGENDA, USER, now + 3600)
+        scan = Job(SCAN, USER, now, until=now + 600)
+        scheduler._jobs[agenda.key] = agenda
+        scheduler._jobs[scan.key] = scan
+        await asyncio.wait_for(scheduler._process([agenda, scan]), 1)
+        assert scheduler._jobs[(SCAN, USER, '')] is not scan
+        assert len(scheduler._tasks) == 1
+        for task in list(scheduler._tasks):
+            task.cancel()
+        await asyncio.gather(*scheduler._tasks, return_exceptions=True)
+
+    asyncio.run(scenario())
+
+
+def test_send_gives_up_after_repeated_retry_after(scheduler):
+    class Bot:
+        calls = 0
+
+        async def send_message(self, chat_id, text):
+            Bot.calls += 1
+            raise RetryAfter(0)
+
+    async def scenario():
+        scheduler._send_lock = asyncio.Lock()
+        scheduler.bot = Bot()
+        return await scheduler.send(USER, 'текст')
+
+    assert asyncio.run(scenario()) is False
+    assert Bot.calls == SEND_ATTEMPTS
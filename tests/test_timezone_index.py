@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from build_timezone_index import build_from_geojson, write_grid
+from timezone_index import TimezoneIndex, parse_zone_tab
+
+
+@pytest.fixture
+def grid_path(tmp_path):
+    # Квадрат Europe/Moscow с дырой, занятой Europe/Kaliningrad.
+    features = [
+        {'properties': {'tzid': 'Europe/Moscow'}, 'geometry': {'type': 'Polygon', 'coordinates': [
+            [[30, 50], [40, 50], [40, 60], [30, 60]],
+            [[34, 54], [36, 54], [36, 56], [34, 56]],
+        ]}},
+        {'properties': {'tzid': 'Europe/Kaliningrad'}, 'geometry': {'type': 'MultiPolygon', 'coordinates': [
+            [[[34, 54], [36, 54], [36, 56], [34, 56]]],
+        ]}},
+    ]
+    geojson = tmp_path / 'zones.json'
+    geojson.write_text(json.dumps({'features': features}), encoding='utf-8')
+    zones, grid = build_from_geojson(str(geojson), 2)
+    path = tmp_path / 'grid.bin'
+    write_grid(str(path), 2, zones, grid)
+    return str(path)
+
+
+def test_parse_zone_tab():
+    lines = ['# comment\n', 'RU\t+554521+0373704\tEurope/Moscow\tMSK+00\n', 'AR\t-3436-05827\tAmerica/Argentina/Buenos_Aires\n']
+    (moscow, moscow_lat, moscow_lon), (buenos_aires, ba_lat, ba_lon) = parse_zone_tab(lines)
+    assert moscow == 'Europe/Moscow' and buenos_aires == 'America/Argentina/Buenos_Aires'
+    assert moscow_lat == pytest.approx(55.756, abs=1e-3) and moscow_lon == pytest.approx(37.618, abs=1e-3)
+    assert ba_lat == pytest.approx(-34.6) and ba_lon == pytest.approx(-58.45)
+
+
+def test_grid_lookup_uses_polygons(grid_path):
+    index = TimezoneIndex(grid_path)
+    try:
+        assert index.lookup(51, 31) == 'Europe/Moscow'
+        assert index.lookup(59.5, 39.5) == 'Europe/Moscow'
+        assert index.lookup(55, 35) == 'Europe/Kaliningrad'
+    finally:
+        index.close()
+
+
+def test_grid_cell_without_zone_falls_back_to_nearest_point(grid_path):
+    index = TimezoneIndex(grid_path)
+    try:
+        assert index.lookup(-33.87, 151.21) == 'Australia/Sydney'
+    finally:
+        index.close()
+
+
+@pytest.mark.parametrize('lat, lon, zone', [
+    (55.75, 37.62, 'Europe/Moscow'),
+    (43.25, 76.95, 'Asia/Almaty'),
+    (40.71, -74.01, 'America/New_York'),
+    (35.68, 139.69, 'Asia/Tokyo'),
+])
+def test_nearest_point_without_grid(tmp_path, lat, lon, zone):
+    assert TimezoneIndex(str(tmp_path / 'missing.bin')).lookup(lat, lon) == zone
+
+
+@pytest.mark.parametrize('lat, lon', [(91, 0), (-91, 0), (0, 181), (0, -180.5)])
+def test_invalid_coordinates(tmp_path, lat, lon):
+    with pytest.raises(ValueError):
+        TimezoneIndex(str(tmp_path / 'missing.bin')).lookup(lat, lon)
@@ -1,31 +1,141 @@
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
 import pytz
-import logging
+from datetime import datetime
+from typing import List
+from profile_store import user_timezones
+from timezone_index import find_timezone
+from notifications import notification_scheduler
+from settings import settings
+from logger import logger
 
-logging.basicConfig(level=logging.INFO)
-logger = logging.getLogger(__name__)
 
-user_timezones = {}
+CALLBACK_PREFIX = 'tz:'
+# Кнопка «Другой часовой пояс» под определённой по местоположению зоной.
+PICKER_CALLBACK = f'{CALLBACK_PREFIX}?'
 
-def generate_timezone_buttons():
+POPULAR_TIMEZONES = [
+    ("Алматы", "Asia/Almaty"),
+    ("Астана", "Asia/Almaty"),
+    ("Москва", "Europe/Moscow"),
+    ("Ташкент", "Asia/Tashkent"),
+    ("Бишкек", "Asia/Bishkek"),
+    ("Екатеринбург", "Asia/Yekaterinburg"),
+    ("Новосибирск", "Asia/Novosibirsk"),
+    ("Владивосток", "Asia/Vladivostok"),
+    ("Киев", "Europe/Kyiv"),
+    ("Минск", "Europe/Minsk"),
+    ("Тбилиси", "Asia/Tbilisi"),
+    ("Баку", "Asia/Baku"),
+    ("Ереван", "Asia/Yerevan"),
+    ("Актобе", "Asia/Aqtobe"),
+    ("Атырау", "Asia/Atyrau"),
+    ("Калининград", "Europe/Kaliningrad"),
+    ("Самара", "Europe/Samara"),
+    ("Омск", "Asia/Omsk"),
+    ("Красноярск", "Asia/Krasnoyarsk"),
+    ("Иркутск", "Asia/Irkutsk"),
+    ("Лондон", "Europe/London"),
+    ("Берлин", "Europe/Berlin"),
+    ("Стамбул", "Europe/Istanbul"),
+    ("Дубай", "Asia/Dubai"),
+    ("Нью-Йорк", "America/New_York"),
+]
+
+PICKER_MESSAGE = ("Выберите часовой пояс, найдите его командой /timezone <город или зона> "
+                  "или отправьте своё местоположение:")
+NOT_FOUND_MESSAGE = "❌ Часовой пояс «{}» не найден. Попробуйте другой запрос, например /timezone Almaty."
+LOCATION_MESSAGE = ("По местоположению определён часовой пояс {} (сейчас там {}). "
+                    "Вблизи границ зон он может быть неточным — подтвердите его или выберите другой:")
+SUCCESS_MESSAGE = ("✅ Часовой пояс установлен: {}. "
+                   "Теперь вы можете использовать команду /help для дальнейших инструкций.")
+
+def search_timezones(query: str, limit: int = settings.timezone_search_limit) -> List[tuple]:
+    """Зоны, подходящие под запрос: (подпись, зона). Сначала совпадения с начала названия."""
+    query = query.strip().lower().replace(' ', '_')
+    if not query:
+        return []
+    matches = [(label, zone) for label, zone in POPULAR_TIMEZONES if label.lower().startswith(query.replace('_', ' '))]
+    ranked = []
+    for zone in pytz.common_timezones:
+        city = zone.rsplit('/', 1)[-1].lower()
+        if city.startswith(query) or zone.lower() == query:
+            ranked.append((0, zone))
+        elif query in zone.lower():
+            ranked.append((1, zone))
+    ranked.sort()
+    seen = {zone for _, zone in matches}
+    for _, zone in ranked:
+        if zone not in seen:
+            matches.append((zone.replace('_', ' '), zone))
+            seen.add(zone)
+    return matches[:limit]
+
+def generate_timezone_buttons(options=None):
+    options = options if options is not None else POPULAR_TIMEZONES[:settings.timezone_search_limit]
+    return InlineKeyboardMarkup([
+        [InlineKeyboardButton(f"{label} ({zone})", callback_data=f"{CALLBACK_PREFIX}{zone}")]
+        for label, zone in options
+    ])
+
+def generate_location_buttons(timezone: str) -> InlineKeyboardMarkup:
+    """Подтверждение зоны, определённой по местоположению, и переход к выбору другой."""
     return InlineKeyboardMarkup([
-        [InlineKeyboardButton("Алматы (Asia/Almaty)", callback_data="Asia/Almaty")]
+        [InlineKeyboardButton(f"✅ Да, {timezone}", callback_data=f"{CALLBACK_PREFIX}{timezone}")],
+        [InlineKeyboardButton("Другой часовой пояс…", callback_data=PICKER_CALLBACK)],
     ])
 
+def save_timezone(user_id: int, timezone: str) -> None:
+    user_timezones[user_id] = timezone
+    # Сводка и напоминания привязаны к местному времени.
+    notification_scheduler.configure_user(user_id)
+    logger.info("Часовой пояс для пользователя %s установлен: %s", user_id, timezone)
+
 async def set_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    """Отправляет сообщение с кнопками для выбора часового пояса."""
-    await update.message.reply_text("Выберите часовой пояс:", reply_markup=generate_timezone_buttons())
+    """Отправляет кнопки выбора часового пояса; с аргументом — результаты поиска."""
+    if not context.args:
+        await update.message.reply_text(PICKER_MESSAGE, reply_markup=generate_timezone_buttons())
+        return
+
+    query = ' '.join(context.args)
+    options = search_timezones(query)
+    if not options:
+        await update.message.reply_text(NOT_FOUND_MESSAGE.format(query))
+        return
+    await update.message.reply_text("Выберите часовой пояс:", reply_markup=generate_timezone_buttons(options))
 
 async def timezone_button(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Обрабатывает нажатия на кнопки выбора часового пояса."""
     query = update.callback_query
     await query.answer()
 
-    timezone = query.data
-    user_timezones[query.from_user.id] = timezone
-    logger.info(f"Часовой пояс для пользователя {query.from_user.id} установлен: {timezone}")
-    await query.edit_message_text(f"✅ Часовой пояс установлен: {timezone}. Теперь вы можете использовать команду /help для дальнейших инструкций.")
+    if query.data == PICKER_CALLBACK:
+        await query.edit_message_text(PICKER_MESSAGE, reply_markup=generate_timezone_buttons())
+        return
+
+    # Кнопки, отправленные до появления префикса, содержат только название зоны.
+    timezone = query.data[len(CALLBACK_PREFIX):] if query.data.startswith(CALLBACK_PREFIX) else query.data
+    if timezone not in pytz.all_timezones_set:
+        logger.warning("Неизвестный часовой пояс в кнопке: %s", query.data)
+        return
+    save_timezone(query.from_user.id, timezone)
+    await query.edit_message_text(SUCCESS_MESSAGE.format(timezone))
+
+async def handle_location(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Определяет часовой пояс по присланному местоположению без внешних сервисов.
+
+    Сетка зон у границ неточна, поэтому зона не сохраняется сразу:
+    пользователь подтверждает её кнопкой или переходит к выбору другой.
+    """
+    location = update.message.location
+    timezone = find_timezone(location.latitude, location.longitude)
+    if timezone not in pytz.all_timezones_set:
+        logger.warning("Зона %s отсутствует в pytz, предлагается выбор вручную", timezone)
+        await update.message.reply_text(PICKER_MESSAGE, reply_markup=generate_timezone_buttons())
+        return
+    local_time = datetime.now(pytz.timezone(timezone)).strftime('%H:%M')
+    await update.message.reply_text(LOCATION_MESSAGE.format(timezone, local_time),
+                                    reply_markup=generate_location_buttons(timezone))
 
 def convert_to_user_timezone(user_id, naive_datetime):
     """Конвертирует время в часовой пояс пользователя."""
@@ -33,7 +143,7 @@ def convert_to_user_timezone(user_id, naive_datetime):
         user_timezone = user_timezones[user_id]
         tz = pytz.timezone(user_timezone)
         local_datetime = tz.localize(naive_datetime)
-        logger.info(f"Конвертация времени в часовой пояс пользователя {user_id}: {local_datetime}")
+        logger.info("Конвертация времени в часовой пояс пользователя %s: %s", user_id, local_datetime)
         return local_datetime
-    logger.warning(f"Часовой пояс для пользователя {user_id} не установлен. Используется naive_datetime.")
-    return naive_datetime
\ No newline at end of file
+    logger.warning("Часовой пояс для пользователя %s не установлен. Используется naive_datetime.", user_id)
+    return naive_datetime
@@ -0,0 +1,135 @@
+import math
+import mmap
+import os
+import struct
+import threading
+from typing import List, Optional, Tuple
+from settings import settings
+from logger import logger
+
+GRID_MAGIC = b'TZG1'
+GRID_HEADER = struct.Struct('<4sHHI')
+ZONE_TAB_PATHS = ['/usr/share/zoneinfo/zone1970.tab', '/usr/share/zoneinfo/zone.tab']
+
+
+def _parse_coordinate(value: str, degree_digits: int) -> float:
+    sign = -1 if value[0] == '-' else 1
+    digits = value[1:]
+    degrees = int(digits[:degree_digits])
+    minutes = int(digits[degree_digits:degree_digits + 2])
+    seconds = int(digits[degree_digits + 2:] or 0)
+    return sign * (degrees + minutes / 60 + seconds / 3600)
+
+def parse_zone_tab(lines) -> List[Tuple[str, float, float]]:
+    """Опорные точки зон из zone1970.tab: (зона, широта, долгота)."""
+    points = []
+    for line in lines:
+        if not line.strip() or line.startswith('#'):
+            continue
+        fields = line.rstrip('\n').split('\t')
+        coordinates, zone = fields[1], fields[2]
+        split = max(coordinates.rfind('+'), coordinates.rfind('-'))
+        points.append((zone, _parse_coordinate(coordinates[:split], 2), _parse_coordinate(coordinates[split:], 3)))
+    return points
+
+def load_zone_points() -> List[Tuple[str, float, float]]:
+    """Точки зон из tzdata пакета pytz, а при её отсутствии — из системной /usr/share/zoneinfo."""
+    try:
+        import pytz
+        with pytz.open_resource('zone1970.tab') as resource:
+            return parse_zone_tab(line.decode('utf-8') for line in resource)
+    except (ImportError, OSError, ValueError):
+        pass
+    for path in ZONE_TAB_PATHS:
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as zone_tab:
+                return parse_zone_tab(zone_tab)
+    raise FileNotFoundError("zone1970.tab не найден ни в pytz, ни в /usr/share/zoneinfo")
+
+def unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    phi, lam = math.radians(lat), math.radians(lon)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+class TimezoneIndex:
+    """Определение часового пояса по координатам без внешних сервисов.
+
+    Основной источник — сетка зон (см. build_timezone_index.py), которая
+    отображается в память при первом запросе: поиск сводится к чтению
+    двух байт по смещению. Если файла сетки нет или ячейка не покрыта
+    ни одной зоной (море), берётся ближайшая опорная точка из zone1970.tab.
+
+    Сетка в репозитории не поставляется: её собирает из полигонов границ
+    build_timezone_index.py --geojson. Без сетки работает только поиск
+    ближайшей опорной точки — это приближение, которое у границ зон
+    ошибается (Санкт-Петербург → Europe/Helsinki, Астана → Asia/Omsk,
+    Львов → Europe/Warsaw), поэтому найденную зону пользователь
+    подтверждает.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._grid: Optional[mmap.mmap] = None
+        self._zones: List[str] = []
+        self._cells_per_degree = 0
+        self._data_offset = 0
+        self._points: Optional[List[tuple]] = None
+
+    def _load_grid(self) -> None:
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not os.path.exists(self.path):
+                logger.warning("Сетка часовых поясов %s не найдена (соберите её build_timezone_index.py --geojson); "
+                               "зона определяется приближённо, по ближайшей опорной точке zone1970.tab", self.path)
+                return
+            with open(self.path, 'rb') as grid_file:
+                grid = mmap.mmap(grid_file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, cells_per_degree, zone_count, names_length = GRID_HEADER.unpack_from(grid)
+            if magic != GRID_MAGIC:
+                grid.close()
+                logger.error("Файл %s не является сеткой часовых поясов", self.path)
+                return
+            names = grid[GRID_HEADER.size:GRID_HEADER.size + names_length].decode('utf-8').split('\n')
+            self._zones = [''] + names[:zone_count]
+            self._cells_per_degree = cells_per_degree
+            self._data_offset = GRID_HEADER.size + names_length
+            self._grid = grid
+
+    def _nearest(self, lat: float, lon: float) -> str:
+        if self._points is None:
+            self._points = [(zone, unit_vector(point_lat, point_lon))
+                            for zone, point_lat, point_lon in load_zone_points()]
+        x, y, z = unit_vector(lat, lon)
+        return max(self._points, key=lambda point: x * point[1][0] + y * point[1][1] + z * point[1][2])[0]
+
+    def lookup(self, lat: float, lon: float) -> str:
+        if not -90 <= lat <= 90 or not -180 <= lon <= 180:
+            raise ValueError(f"Некорректные координаты: {lat}, {lon}")
+        if not self._loaded:
+            self._load_grid()
+        if self._grid is not None:
+            cells = self._cells_per_degree
+            columns = 360 * cells
+            row = min(int((lat + 90) * cells), 180 * cells - 1)
+            column = min(int((lon + 180) * cells), columns - 1)
+            zone_id, = struct.unpack_from('<H', self._grid, self._data_offset + 2 * (row * columns + column))
+            if zone_id:
+                return self._zones[zone_id]
+        return self._nearest(lat, lon)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._grid is not None:
+                self._grid.close()
+                self._grid = None
+            self._loaded = False
+
+
+timezone_index = TimezoneIndex(settings.timezone_index_path)
+
+def find_timezone(lat: float, lon: float) -> str:
+    return timezone_index.lookup(lat, lon)
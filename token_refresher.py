@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import time
+from datetime import timezone
+from typing import TYPE_CHECKING, Dict, List, Tuple
+from calendar_gateway import calendar_gateway
+from calendar_service import invalidate_calendar_service
+from event_cache import event_cache
+from busy_cache import busy_cache
+from agenda import invalidate_calendar_list
+from profile_store import profile_store, user_credentials
+from settings import settings
+from worker_pool import owns_user
+from logger import logger
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+
+def expiry_timestamp(credentials: Credentials) -> float:
+    if credentials.expiry is None:
+        return time.time()
+    return credentials.expiry.replace(tzinfo=timezone.utc).timestamp()
+
+
+class TokenRefresher:
+    """Фоновое обновление access-токенов незадолго до истечения.
+
+    Сроки хранятся в min-куче; устаревшие записи кучи пропускаются
+    по сверке с _scheduled.
+    """
+
+    def __init__(self, lead_time: float, batch_size: int, interval: float):
+        self.lead_time = lead_time
+        self.batch_size = batch_size
+        self.interval = interval
+        self._heap: List[Tuple[float, int]] = []
+        self._scheduled: Dict[int, float] = {}
+
+    def track(self, user_id: int, credentials: Credentials) -> None:
+        if not credentials.refresh_token:
+            return
+        due = expiry_timestamp(credentials) - self.lead_time
+        self._scheduled[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+
+    def forget(self, user_id: int) -> None:
+        self._scheduled.pop(user_id, None)
+
+    def load_all(self) -> None:
+        # Токены обновляет только процесс, который обслуживает пользователя, иначе
+        # его профиль записывали бы несколько процессов одновременно.
+        for user_id in user_credentials:
+            if owns_user(user_id):
+                self.track(user_id, user_credentials[user_id])
+
+    def _pop_due(self) -> List[int]:
+        now = time.time()
+        due_users = []
+        while self._heap and self._heap[0][0] <= now and len(due_users) < self.batch_size:
+            due, user_id = heapq.heappop(self._heap)
+            if self._scheduled.get(user_id) == due:
+                del self._scheduled[user_id]
+                due_users.append(user_id)
+        return due_users
+
+    async def refresh_due(self) -> int:
+        user_ids = self._pop_due()
+        if user_ids:
+            await asyncio.gather(*(self._refresh(user_id) for user_id in user_ids))
+        return len(user_ids)
+
+    async def _refresh(self, user_id: int) -> None:
+        credentials = user_credentials.get(user_id)
+        if credentials is None:
+            return
+        from google.auth.exceptions import RefreshError
+        try:
+            # Если токен уже обновил запрос к API, повторно он не обновляется.
+            await calendar_gateway.run(calendar_gateway.refresh_credentials, user_id, credentials, credentials.token)
+        except RefreshError as e:
+            self.mark_revoked(user_id)
+            logger.warning("Токен пользователя %s отозван: %s", user_id, e)
+            return
+        except Exception as e:
+            logger.error("Ошибка при обновлении токена пользователя %s: %s", user_id, e)
+            self._scheduled[user_id] = time.time() + self.interval
+            heapq.heappush(self._heap, (self._scheduled[user_id], user_id))
+            return
+        self.refreshed(user_id, credentials)
+
+    def refreshed(self, user_id: int, credentials: Credentials) -> None:
+        """Сохраняет обновлённый токен в профиле и переносит следующее обновление."""
+        profile_store.mark_dirty(user_id)
+        if owns_user(user_id):
+            self.track(user_id, credentials)
+
+    def mark_revoked(self, user_id: int) -> None:
+        """Удаляет отозванные учётные данные, чтобы обработчики сразу просили /authorize."""
+        self.forget(user_id)
+        user_credentials.pop(user_id, None)
+        invalidate_user_caches(user_id)
+
+    def next_due_in(self) -> float:
+        while self._heap and self._scheduled.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return self.interval
+        return max(0.0, min(self.interval, self._heap[0][0] - time.time()))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                while await self.refresh_due() == self.batch_size:
+                    pass
+            except Exception as e:
+                logger.error("Ошибка планировщика обновления токенов: %s", e)
+            await asyncio.sleep(self.next_due_in())
+
+
+def invalidate_user_caches(user_id: int) -> None:
+    """Сбрасывает всё, что получено от API с прежними учётными данными пользователя:
+    клиент Calendar, события, занятость и список календарей.
+    """
+    invalidate_calendar_service(user_id)
+    event_cache.invalidate(user_id)
+    busy_cache.invalidate(user_id)
+    invalidate_calendar_list(user_id)
+
+
+token_refresher = TokenRefresher(
+    settings.token_refresh_lead, settings.token_refresh_batch, settings.token_refresh_interval
+)
+# Токены, обновлённые при запросах к API, тоже сохраняются и перепланируются.
+calendar_gateway.on_token_refresh = token_refresher.refreshed
+
+async def start_token_refresher() -> asyncio.Task:
+    token_refresher.load_all()
+    return asyncio.create_task(token_refresher.run())
@@ -0,0 +1,76 @@
+import json
+import os
+import tempfile
+import time
+from typing import Optional
+from cache import LRUCache
+from metrics import metrics
+from settings import settings
+from logger import logger
+
+
+class TranscriptCache:
+    """LRU/TTL-кэш расшифровок голосовых сообщений по file_unique_id.
+
+    При заданном пути к файлу содержимое сохраняется между перезапусками.
+    """
+
+    def __init__(self, max_size: int, ttl: float, path: Optional[str] = None):
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = LRUCache(max_size)
+
+    def get(self, file_unique_id: str) -> Optional[str]:
+        entry = self._entries.get(file_unique_id)
+        if entry is not None and time.time() - entry[1] <= self.ttl:
+            self.hits += 1
+            return entry[0]
+        if entry is not None:
+            self._entries.pop(file_unique_id)
+        self.misses += 1
+        return None
+
+    def set(self, file_unique_id: str, text: str) -> None:
+        self._entries.set(file_unique_id, (text, time.time()))
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except Exception as e:
+            logger.error("Ошибка при загрузке кэша расшифровок: %s", e)
+            return
+        now = time.time()
+        for file_unique_id, (text, stored_at) in sorted(entries.items(), key=lambda item: item[1][1]):
+            if now - stored_at <= self.ttl:
+                self._entries.set(file_unique_id, (text, stored_at))
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        entries = dict(self._entries.items())
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as file:
+                json.dump(entries, file, ensure_ascii=False)
+            os.replace(file.name, self.path)
+        except Exception as e:
+            logger.error("Ошибка при сохранении кэша расшифровок: %s", e)
+
+    def stats(self) -> dict:
+        return {'size': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+# Каждый процесс-обработчик сохраняет свой кэш: расшифровки пользователя остаются в его процессе.
+transcript_cache = TranscriptCache(
+    settings.transcript_cache_size, settings.transcript_cache_ttl,
+    settings.worker_file(settings.transcript_cache_file) if settings.transcript_cache_file else None,
+)
+transcript_cache.load()
+metrics.gauge('transcript_cache_size', lambda: transcript_cache.stats()['size'], 'Расшифровки в кэше')
+metrics.gauge('transcript_cache_hits', lambda: transcript_cache.stats()['hits'], 'Попадания в кэш расшифровок')
+metrics.gauge('transcript_cache_misses', lambda: transcript_cache.stats()['misses'], 'Промахи кэша расшифровок')
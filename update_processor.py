@@ -0,0 +1,93 @@
+from collections import deque
+from typing import Awaitable, Deque, Dict, Hashable, Optional, Tuple
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+from logger import logger
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Параллельная обработка обновлений с сохранением порядка для каждого пользователя.
+
+    У каждого пользователя своя очередь, которую разбирает одна задача: его
+    команды выполняются строго по порядку, а обновления разных пользователей
+    идут параллельно, но не больше max_concurrent_updates одновременно.
+    Слот (семафор базового process_update) держит только задача, которая
+    разбирает очередь; обновление, вставшее в уже существующую очередь,
+    сразу освобождает свой слот, поэтому длинная очередь одного
+    пользователя занимает один слот и не блокирует остальных.
+    """
+
+    def __init__(self, max_concurrent_updates: int, warn_depth: int = 20):
+        super().__init__(max_concurrent_updates)
+        self.warn_depth = warn_depth
+        self._queues: Dict[Hashable, Deque[Tuple[object, Awaitable]]] = {}
+        self._in_flight = 0
+        self._processed = 0
+        self._max_depth = 0
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Hashable]:
+        if isinstance(update, Update):
+            if update.effective_user is not None:
+                return update.effective_user.id
+            if update.effective_chat is not None:
+                return update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        key = self.update_key(update)
+        if key is None:
+            await self._run(coroutine)
+            return
+
+        # Задачи получают слот в порядке поступления обновлений (семафор будит
+        # ожидающих по очереди), поэтому постановка в очередь сохраняет их порядок.
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append((update, coroutine))
+            depth = len(queue)
+            self._max_depth = max(self._max_depth, depth)
+            if depth == self.warn_depth:
+                logger.warning("Очередь обновлений пользователя %s достигла %s", key, depth)
+            return
+
+        queue = self._queues[key] = deque([(update, coroutine)])
+        try:
+            while queue:
+                update, coroutine = queue.popleft()
+                try:
+                    await self._run(coroutine)
+                except Exception as e:
+                    logger.error("Ошибка при обработке обновления пользователя %s: %s", key, e)
+        finally:
+            del self._queues[key]
+            for _, pending in queue:
+                pending.close()
+
+    async def _run(self, coroutine: Awaitable) -> None:
+        self._in_flight += 1
+        try:
+            await coroutine
+        finally:
+            self._in_flight -= 1
+            self._processed += 1
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        for queue in self._queues.values():
+            for _, pending in queue:
+                pending.close()
+            queue.clear()
+
+    def stats(self) -> dict:
+        depths = [len(queue) for queue in self._queues.values()]
+        return {
+            'in_flight': self._in_flight,
+            'users_active': len(depths),
+            'queued': sum(depths),
+            'max_depth': max(depths, default=0),
+            'max_depth_seen': self._max_depth,
+            'processed': self._processed,
+        }
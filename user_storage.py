@@ -0,0 +1,185 @@
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, List, Tuple
+
+SQLITE_PREFIX = 'sqlite:///'
+POSTGRES_PREFIXES = ('postgres://', 'postgresql://')
+
+
+class UserStorage(ABC):
+    """Хранилище пользователей бота со счётчиками, которые поддерживаются при вставке."""
+
+    @abstractmethod
+    def add_user(self, user_id: str, username: str) -> bool:
+        ...
+
+    @abstractmethod
+    def add_start(self, user_id: str) -> bool:
+        ...
+
+    @abstractmethod
+    def user_count(self) -> int:
+        ...
+
+    @abstractmethod
+    def start_count(self) -> int:
+        ...
+
+    def import_data(self, user_data: Dict[str, Any]) -> Tuple[int, int]:
+        """Переносит данные в формате user_data.json, возвращает число добавленных записей.
+
+        Перенос выполняется одной транзакцией: после сбоя на полпути счётчики
+        остаются нулевыми и перенос повторяется при следующем запуске.
+        """
+        users = [(str(user_id), username) for user_id, username in user_data.get('users', {}).items()]
+        starts = [(str(user_id),) for user_id in user_data.get('start_count', {})]
+        return self._import_rows(users, starts)
+
+    @abstractmethod
+    def _import_rows(self, users: List[Tuple[str, str]], starts: List[Tuple[str]]) -> Tuple[int, int]:
+        ...
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteUserStorage(UserStorage):
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, username TEXT);
+            CREATE TABLE IF NOT EXISTS starts (user_id TEXT PRIMARY KEY);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO counters (name, value) VALUES ('users', 0), ('starts', 0);
+        """)
+
+    def _insert(self, table: str, counter: str, values: tuple) -> bool:
+        placeholders = ', '.join('?' * len(values))
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                cursor = self._conn.execute(
+                    f'INSERT OR IGNORE INTO {table} VALUES ({placeholders})', values)
+                inserted = cursor.rowcount == 1
+                if inserted:
+                    self._conn.execute('UPDATE counters SET value = value + 1 WHERE name = ?', (counter,))
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return inserted
+
+    def _counter(self, name: str) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT value FROM counters WHERE name = ?', (name,)).fetchone()[0]
+
+    def add_user(self, user_id: str, username: str) -> bool:
+        return self._insert('users', 'users', (user_id, username))
+
+    def add_start(self, user_id: str) -> bool:
+        return self._insert('starts', 'starts', (user_id,))
+
+    def user_count(self) -> int:
+        return self._counter('users')
+
+    def start_count(self) -> int:
+        return self._counter('starts')
+
+    def _import_rows(self, users: List[Tuple[str, str]], starts: List[Tuple[str]]) -> Tuple[int, int]:
+        with self._lock:
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                changes = self._conn.total_changes
+                self._conn.executemany('INSERT OR IGNORE INTO users VALUES (?, ?)', users)
+                added_users = self._conn.total_changes - changes
+                changes = self._conn.total_changes
+                self._conn.executemany('INSERT OR IGNORE INTO starts VALUES (?)', starts)
+                added_starts = self._conn.total_changes - changes
+                self._conn.execute("UPDATE counters SET value = (SELECT COUNT(*) FROM users) WHERE name = 'users'")
+                self._conn.execute("UPDATE counters SET value = (SELECT COUNT(*) FROM starts) WHERE name = 'starts'")
+                self._conn.execute('COMMIT')
+            except Exception:
+                self._conn.execute('ROLLBACK')
+                raise
+        return added_users, added_starts
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class PostgresUserStorage(UserStorage):
+    def __init__(self, dsn: str):
+        import psycopg2
+
+        self._lock = threading.Lock()
+        self._conn = psycopg2.connect(dsn)
+        with self._conn, self._conn.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS users (user_id TEXT PRIMARY KEY, username TEXT);
+                CREATE TABLE IF NOT EXISTS starts (user_id TEXT PRIMARY KEY);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value BIGINT NOT NULL);
+                INSERT INTO counters (name, value) VALUES ('users', 0), ('starts', 0)
+                    ON CONFLICT DO NOTHING;
+            """)
+
+    def _insert(self, table: str, counter: str, values: tuple) -> bool:
+        placeholders = ', '.join(['%s'] * len(values))
+        with self._lock, self._conn, self._conn.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {table} VALUES ({placeholders}) ON CONFLICT DO NOTHING', values)
+            inserted = cursor.rowcount == 1
+            if inserted:
+                cursor.execute('UPDATE counters SET value = value + 1 WHERE name = %s', (counter,))
+        return inserted
+
+    def _counter(self, name: str) -> int:
+        with self._lock, self._conn, self._conn.cursor() as cursor:
+            cursor.execute('SELECT value FROM counters WHERE name = %s', (name,))
+            return cursor.fetchone()[0]
+
+    def add_user(self, user_id: str, username: str) -> bool:
+        return self._insert('users', 'users', (user_id, username))
+
+    def add_start(self, user_id: str) -> bool:
+        return self._insert('starts', 'starts', (user_id,))
+
+    def user_count(self) -> int:
+        return self._counter('users')
+
+    def start_count(self) -> int:
+        return self._counter('starts')
+
+    def _import_rows(self, users: List[Tuple[str, str]], starts: List[Tuple[str]]) -> Tuple[int, int]:
+        with self._lock, self._conn, self._conn.cursor() as cursor:
+            cursor.execute('SELECT (SELECT COUNT(*) FROM users), (SELECT COUNT(*) FROM starts)')
+            users_before, starts_before = cursor.fetchone()
+            cursor.executemany('INSERT INTO users VALUES (%s, %s) ON CONFLICT DO NOTHING', users)
+            cursor.executemany('INSERT INTO starts VALUES (%s) ON CONFLICT DO NOTHING', starts)
+            cursor.execute("UPDATE counters SET value = (SELECT COUNT(*) FROM users) WHERE name = 'users' RETURNING value")
+            users_after = cursor.fetchone()[0]
+            cursor.execute("UPDATE counters SET value = (SELECT COUNT(*) FROM starts) WHERE name = 'starts' RETURNING value")
+            starts_after = cursor.fetchone()[0]
+        return users_after - users_before, starts_after - starts_before
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+def create_user_storage(url: str) -> UserStorage:
+    if url.startswith(SQLITE_PREFIX):
+        return SQLiteUserStorage(url[len(SQLITE_PREFIX):])
+    if url.startswith(POSTGRES_PREFIXES):
+        return PostgresUserStorage(url)
+    raise ValueError(f"Unsupported user data storage URL: {url}")
+
+def migrate_from_json(storage: UserStorage, path: str) -> Tuple[int, int]:
+    """Однократный перенос данных из user_data.json в хранилище."""
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path, 'r', encoding='utf-8') as file:
+        return storage.import_data(json.load(file))
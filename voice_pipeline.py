@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import TYPE_CHECKING, Dict, Optional, Tuple
+from settings import settings
+
+if TYPE_CHECKING:
+    from pydub import AudioSegment
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        # forkserver: к моменту первого запуска уже работают потоки логирования и пулов,
+        # а fork унаследовал бы их захваченные блокировки. Сервер стартует чистым
+        # процессом и заранее загружает только этот модуль и pydub, а не __main__.
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(['voice_pipeline', 'pydub'])
+        _executor = ProcessPoolExecutor(max_workers=settings.voice_decode_workers, mp_context=context)
+    return _executor
+
+def trim_silence(audio: AudioSegment, threshold: float) -> AudioSegment:
+    from pydub.silence import detect_leading_silence
+
+    start = detect_leading_silence(audio, silence_threshold=threshold)
+    end = detect_leading_silence(audio.reverse(), silence_threshold=threshold)
+    trimmed = audio[start:len(audio) - end]
+    return trimmed if len(trimmed) > 0 else audio
+
+def prepare_voice(ogg_bytes: bytes) -> Tuple[bytes, Dict[str, float]]:
+    """Готовит запись к распознаванию: декодирование, 16 кГц моно, обрезка тишины и длины.
+
+    Выполняется в отдельном процессе, возвращает WAV-байты и время этапов в секундах.
+    pydub импортируется здесь, чтобы основной процесс не загружал его при старте.
+    """
+    from pydub import AudioSegment
+
+    timings = {}
+    started = time.perf_counter()
+
+    audio = AudioSegment.from_file(io.BytesIO(ogg_bytes), format='ogg')
+    timings['decode'] = time.perf_counter() - started
+
+    stage = time.perf_counter()
+    audio = audio.set_channels(1).set_frame_rate(settings.voice_sample_rate)
+    timings['resample'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    audio = trim_silence(audio, settings.voice_silence_threshold)
+    audio = audio[:int(settings.voice_max_duration * 1000)]
+    timings['trim'] = time.perf_counter() - stage
+
+    stage = time.perf_counter()
+    output = io.BytesIO()
+    audio.export(output, format='wav')
+    timings['export'] = time.perf_counter() - stage
+
+    timings['total'] = time.perf_counter() - started
+    return output.getvalue(), timings
+
+async def convert_to_wav(ogg_bytes: bytes) -> Tuple[bytes, Dict[str, float]]:
+    global _executor
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, prepare_voice, ogg_bytes)
+    except BrokenProcessPool:
+        # Упавший декодер ломает весь пул; следующая запись получит новый.
+        if _executor is executor:
+            _executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
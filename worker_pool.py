@@ -0,0 +1,169 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+from typing import Callable, List, Optional
+from telegram import Update
+from telegram.ext import Application, ContextTypes
+from update_processor import KeyedUpdateProcessor
+from metrics import count
+from logger import logger
+
+INBOX_POLL_INTERVAL = 1.0
+SUPERVISE_INTERVAL = 5.0
+STOP_TIMEOUT = 30.0
+# Номер обработчика нужен уже при импорте модулей (имена файлов лога и кэшей),
+# поэтому диспетчер передаёт его через окружение, см. settings.worker_index.
+WORKER_INDEX_ENV = 'WORKER_INDEX'
+
+# Номер текущего процесса-обработчика и их общее число; в обычном режиме — 0 из 1.
+worker_index = 0
+worker_count = 1
+
+
+def partition(user_id: int, workers: int) -> int:
+    """Номер обработчика для пользователя; не зависит от запуска, поэтому переживает перезапуски."""
+    return user_id % workers
+
+def set_worker(index: int, workers: int) -> None:
+    global worker_index, worker_count
+    worker_index, worker_count = index, workers
+
+def owns_user(user_id: int) -> bool:
+    """Обслуживает ли текущий процесс этого пользователя (его кэши и фоновые задачи)."""
+    return partition(user_id, worker_count) == worker_index
+
+def worker_metrics_port(port: int) -> int:
+    if not port or worker_count == 1:
+        return port
+    return port + worker_index + 1
+
+
+class UpdateDispatcher:
+    """Распределение обновлений между процессами-обработчиками по user_id.
+
+    Получать обновления от Telegram может только один процесс, поэтому он
+    принимает их (polling или webhook) и раскладывает по очередям
+    обработчиков: все обновления пользователя попадают в один процесс и
+    в исходном порядке. Упавший обработчик перезапускается с той же
+    очередью, так что ещё не разобранные обновления не теряются.
+    """
+
+    def __init__(self, workers: int, target: Callable):
+        self.workers = workers
+        self.target = target
+        # spawn: дочерний процесс не наследует открытые соединения SQLite и потоки родителя.
+        self._context = multiprocessing.get_context('spawn')
+        self._inboxes = [self._context.Queue() for _ in range(workers)]
+        self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self._supervisor: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=self.target, args=(index, self.workers, self._inboxes[index]), name=f'worker-{index}', daemon=False
+        )
+        # spawn-процесс получает копию окружения в момент запуска.
+        os.environ[WORKER_INDEX_ENV] = str(index)
+        try:
+            process.start()
+        finally:
+            del os.environ[WORKER_INDEX_ENV]
+        self._processes[index] = process
+        logger.info("Запущен обработчик %s (pid %s)", index, process.pid)
+
+    async def start(self, application: Application) -> None:
+        for index in range(self.workers):
+            self._spawn(index)
+        self._supervisor = asyncio.create_task(self._supervise())
+
+    async def _supervise(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for index, process in enumerate(self._processes):
+                if process is not None and not process.is_alive() and not self._stopping:
+                    logger.error("Обработчик %s завершился с кодом %s, перезапуск", index, process.exitcode)
+                    count('worker_restarts_total', worker=index)
+                    self._spawn(index)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        key = KeyedUpdateProcessor.update_key(update)
+        index = partition(key, self.workers) if key is not None else 0
+        self._inboxes[index].put(update.to_dict())
+        count('updates_dispatched_total', worker=index)
+
+    def alive(self) -> int:
+        return sum(1 for process in self._processes if process is not None and process.is_alive())
+
+    async def stop(self, application: Application) -> None:
+        """Просит обработчики дообработать свои очереди и ждёт их завершения."""
+        self._stopping = True
+        if self._supervisor is not None:
+            self._supervisor.cancel()
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for index, process in enumerate(self._processes):
+            if process is None:
+                continue
+            await asyncio.to_thread(process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Обработчик %s не завершился за %s с, остановка принудительно", index, STOP_TIMEOUT)
+                process.terminate()
+                await asyncio.to_thread(process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logger.error("Обработчик %s не завершился после SIGTERM, процесс убит", index)
+                process.kill()
+
+
+async def serve_worker(application: Application, inbox) -> None:
+    """Цикл процесса-обработчика: обновления приходят из очереди диспетчера, а не от Telegram.
+
+    run_polling/run_webhook здесь не используются, поэтому post_init и
+    post_shutdown вызываются явно.
+
+    SIGTERM обычно получает вся группа процессов одновременно, и диспетчер
+    ещё может дослать принятые обновления, поэтому после него очередь
+    дочитывается до None от диспетчера. Повторный SIGTERM (диспетчер не
+    дождался завершения) останавливает чтение сразу, как и пустая очередь
+    после гибели диспетчера — тогда None уже не придёт.
+    """
+    stop = asyncio.Event()
+    draining = False
+
+    def on_sigterm() -> None:
+        nonlocal draining
+        if draining:
+            stop.set()
+            return
+        draining = True
+        logger.info("Получен SIGTERM, обработчик дочитывает очередь до сигнала диспетчера")
+
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, on_sigterm)
+    dispatcher = multiprocessing.parent_process()
+    await application.initialize()
+    if application.post_init:
+        await application.post_init(application)
+    await application.start()
+    try:
+        while not stop.is_set():
+            try:
+                data = await asyncio.to_thread(inbox.get, True, INBOX_POLL_INTERVAL)
+            except queue.Empty:
+                if draining and dispatcher is not None and not dispatcher.is_alive():
+                    logger.warning("Диспетчер завершился, не прислав сигнал остановки")
+                    break
+                continue
+            if data is None:
+                break
+            await application.update_queue.put(Update.de_json(data, application.bot))
+    finally:
+        await application.stop()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
+        await application.shutdown()
+
+def run_worker(application: Application, inbox) -> None:
+    # Ctrl+C получает вся группа процессов; обработчик останавливает диспетчер, дослав None в очередь.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(serve_worker(application, inbox))